@@ -234,3 +234,183 @@ int filename_chunk_cdc(const char *filename,
     close (fd_src);
     return ret;
 }
+
+struct _CDCStream {
+    CDCFileDescriptor *file_descr;
+    struct SeafileCrypt *crypt;
+    gboolean write_data;
+
+    SHA_CTX file_ctx;
+    CDCDescriptor chunk_descr;
+    char *buf;
+    uint32_t buf_sz;
+    uint64_t offset;
+    int fingerprint;
+    /* Same meanings as in file_chunk_cdc(). */
+    uint32_t tail, cur;
+};
+
+CDCStream *cdc_stream_new (CDCFileDescriptor *file_descr,
+                           SeafileCrypt *crypt,
+                           gboolean write_data)
+{
+    CDCStream *stream;
+
+    if (file_descr->block_min_sz <= 0)
+        file_descr->block_min_sz = BLOCK_MIN_SZ;
+    if (file_descr->block_max_sz <= 0)
+        file_descr->block_max_sz = BLOCK_MAX_SZ;
+    if (file_descr->block_sz <= 0)
+        file_descr->block_sz = BLOCK_SZ;
+
+    if (file_descr->write_block == NULL)
+        file_descr->write_block = (WriteblockFunc)default_write_chunk;
+
+    file_descr->block_nr = 0;
+    file_descr->max_block_nr = 0;
+    file_descr->blk_sha1s = NULL;
+    file_descr->file_size = 0;
+
+    stream = calloc (1, sizeof(CDCStream));
+    if (!stream)
+        return NULL;
+
+    stream->buf_sz = file_descr->block_max_sz;
+    stream->buf = stream->chunk_descr.block_buf = malloc (stream->buf_sz);
+    if (!stream->buf) {
+        free (stream);
+        return NULL;
+    }
+
+    stream->file_descr = file_descr;
+    stream->crypt = crypt;
+    stream->write_data = write_data;
+    SHA1_Init (&stream->file_ctx);
+
+    return stream;
+}
+
+static int stream_write_block (CDCStream *stream, uint32_t block_sz)
+{
+    CDCFileDescriptor *file_descr = stream->file_descr;
+    CDCDescriptor *chunk_descr = &stream->chunk_descr;
+
+    if (file_descr->block_nr == file_descr->max_block_nr) {
+        int max_block_nr = file_descr->max_block_nr ?
+            file_descr->max_block_nr * 2 : 16;
+        uint8_t *blk_sha1s = realloc (file_descr->blk_sha1s,
+                                      max_block_nr * CHECKSUM_LENGTH);
+        if (!blk_sha1s)
+            return -1;
+        file_descr->blk_sha1s = blk_sha1s;
+        file_descr->max_block_nr = max_block_nr;
+    }
+
+    chunk_descr->len = block_sz;
+    chunk_descr->offset = stream->offset;
+    if (file_descr->write_block (chunk_descr, stream->crypt,
+                                 chunk_descr->checksum,
+                                 stream->write_data) < 0)
+        return -1;
+
+    memcpy (file_descr->blk_sha1s + file_descr->block_nr * CHECKSUM_LENGTH,
+            chunk_descr->checksum, CHECKSUM_LENGTH);
+    SHA1_Update (&stream->file_ctx, chunk_descr->checksum, 20);
+    file_descr->block_nr++;
+    stream->offset += block_sz;
+
+    memmove (stream->buf, stream->buf + block_sz, stream->tail - block_sz);
+    stream->tail -= block_sz;
+    stream->cur = 0;
+
+    return 0;
+}
+
+/* Scan the buffered data for block boundaries. Data is only scanned when
+ * there is at least block_min_sz bytes, as file_chunk_cdc() does, so that
+ * the fingerprint is computed over the same windows.
+ */
+static int stream_scan (CDCStream *stream)
+{
+    CDCFileDescriptor *file_descr = stream->file_descr;
+    uint32_t block_min_sz = file_descr->block_min_sz;
+    uint32_t block_mask = file_descr->block_sz - 1;
+    char *buf = stream->buf;
+    gboolean found;
+
+    while (stream->tail >= block_min_sz) {
+        if (stream->cur < block_min_sz - 1)
+            stream->cur = block_min_sz - 1;
+
+        found = FALSE;
+        while (stream->cur < stream->tail) {
+            uint32_t cur = stream->cur;
+
+            stream->fingerprint = (cur == block_min_sz - 1) ?
+                finger(buf + cur - BLOCK_WIN_SZ + 1, BLOCK_WIN_SZ) :
+                rolling_finger (stream->fingerprint, BLOCK_WIN_SZ,
+                                *(buf+cur-BLOCK_WIN_SZ), *(buf + cur));
+
+            if (((stream->fingerprint & block_mask) ==
+                 ((BREAK_VALUE & block_mask)))
+                || cur + 1 >= file_descr->block_max_sz)
+            {
+                if (stream_write_block (stream, cur + 1) < 0)
+                    return -1;
+                found = TRUE;
+                break;
+            } else {
+                stream->cur++;
+            }
+        }
+
+        if (!found)
+            break;
+    }
+
+    return 0;
+}
+
+int cdc_stream_feed (CDCStream *stream, const char *data, size_t len)
+{
+    uint32_t n;
+
+    while (len > 0) {
+        n = stream->buf_sz - stream->tail;
+        if (n > len)
+            n = len;
+
+        memcpy (stream->buf + stream->tail, data, n);
+        stream->tail += n;
+        stream->file_descr->file_size += n;
+        data += n;
+        len -= n;
+
+        /* The buffer always has room after scanning, since a block is
+         * cut when it reaches block_max_sz.
+         */
+        if (stream_scan (stream) < 0)
+            return -1;
+    }
+
+    return 0;
+}
+
+int cdc_stream_finish (CDCStream *stream)
+{
+    if (stream->tail > 0 && stream_write_block (stream, stream->tail) < 0)
+        return -1;
+
+    SHA1_Final (stream->file_descr->file_sum, &stream->file_ctx);
+
+    return 0;
+}
+
+void cdc_stream_free (CDCStream *stream)
+{
+    if (!stream)
+        return;
+
+    free (stream->buf);
+    free (stream);
+}
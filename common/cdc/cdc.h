@@ -72,4 +72,23 @@ int filename_chunk_cdc(const char *filename,
                        struct SeafileCrypt *crypt,
                        gboolean write_data);
 
+/*
+ * Chunk data that arrives in pieces, e.g. from the network. The blocks
+ * are the same as file_chunk_cdc() produces for the same content.
+ * Block size parameters are taken from file_descr, which is filled in
+ * as blocks are written. The block id array grows as needed.
+ */
+typedef struct _CDCStream CDCStream;
+
+CDCStream *cdc_stream_new (CDCFileDescriptor *file_descr,
+                           struct SeafileCrypt *crypt,
+                           gboolean write_data);
+
+int cdc_stream_feed (CDCStream *stream, const char *data, size_t len);
+
+/* Write out the remaining data as the last block. */
+int cdc_stream_finish (CDCStream *stream);
+
+void cdc_stream_free (CDCStream *stream);
+
 #endif
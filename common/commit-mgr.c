@@ -2,6 +2,7 @@
 
 #include "common.h"
 
+#include <pthread.h>
 #include <json-glib/json-glib.h>
 #include <openssl/sha.h>
 
@@ -15,11 +16,25 @@
 
 #define MAX_TIME_SKEW 259200    /* 3 days */
 
+#ifdef SEAFILE_SERVER
+#define DEFAULT_COMMIT_CACHE_SIZE 1000
+#else
+#define DEFAULT_COMMIT_CACHE_SIZE 0
+#endif
+
 struct _SeafCommitManagerPriv {
-    /* GHashTable *commit_cache; */
-    /* JsonGenerator   *gen; */
-    /* JsonParser      *parser; */
-    int dummy;
+    /*
+     * LRU cache of loaded commits. Commits are immutable, so a cached
+     * commit object is shared by all the callers that look it up.
+     */
+    pthread_mutex_t cache_lock;
+    GHashTable *commit_cache;   /* commit id -> link in cache_lru */
+    GQueue *cache_lru;          /* most recently used commit first */
+    int cache_size;             /* 0 disables the cache */
+
+    gint64 cache_hits;
+    gint64 cache_misses;
+    gint64 cache_evictions;
 };
 
 static SeafCommit *
@@ -157,7 +172,7 @@ seaf_commit_free (SeafCommit *commit)
 void
 seaf_commit_ref (SeafCommit *commit)
 {
-    commit->ref++;
+    g_atomic_int_inc (&commit->ref);
 }
 
 void
@@ -166,7 +181,7 @@ seaf_commit_unref (SeafCommit *commit)
     if (!commit)
         return;
 
-    if (--commit->ref <= 0)
+    if (g_atomic_int_dec_and_test (&commit->ref))
         seaf_commit_free (commit);
 }
 
@@ -179,12 +194,31 @@ seaf_commit_manager_new (SeafileSession *seaf)
     mgr->seaf = seaf;
     mgr->obj_store = seaf_obj_store_new (mgr->seaf, "commits");
 
+    pthread_mutex_init (&mgr->priv->cache_lock, NULL);
+    /* Keys are owned by the cached commits. */
+    mgr->priv->commit_cache = g_hash_table_new (g_str_hash, g_str_equal);
+    mgr->priv->cache_lru = g_queue_new ();
+    mgr->priv->cache_size = DEFAULT_COMMIT_CACHE_SIZE;
+
     return mgr;
 }
 
 int
 seaf_commit_manager_init (SeafCommitManager *mgr)
 {
+#ifdef SEAFILE_SERVER
+    GError *error = NULL;
+    int cache_size;
+
+    cache_size = g_key_file_get_integer (mgr->seaf->config,
+                                         "cache", "commit_cache_size",
+                                         &error);
+    if (!error)
+        seaf_commit_manager_set_cache_size (mgr, cache_size);
+    else
+        g_clear_error (&error);
+#endif
+
 #if defined SEAFILE_SERVER && defined FULL_FEATURE
     if (seaf_obj_store_init (mgr->obj_store, TRUE, seaf->ev_mgr) < 0) {
         g_warning ("[commit mgr] Failed to init commit object store.\n");
@@ -200,30 +234,127 @@ seaf_commit_manager_init (SeafCommitManager *mgr)
     return 0;
 }
 
-#if 0
-inline static void
+/* Called with cache_lock held. */
+static void
+evict_commits (SeafCommitManagerPriv *priv)
+{
+    SeafCommit *commit;
+
+    while ((int)g_queue_get_length (priv->cache_lru) > priv->cache_size) {
+        commit = g_queue_pop_tail (priv->cache_lru);
+        g_hash_table_remove (priv->commit_cache, commit->commit_id);
+        seaf_commit_unref (commit);
+        ++priv->cache_evictions;
+    }
+}
+
+static SeafCommit *
+lookup_commit_cache (SeafCommitManager *mgr, const char *id)
+{
+    SeafCommitManagerPriv *priv = mgr->priv;
+    GList *link;
+    SeafCommit *commit = NULL;
+
+    pthread_mutex_lock (&priv->cache_lock);
+
+    if (priv->cache_size <= 0)
+        goto out;
+
+    link = g_hash_table_lookup (priv->commit_cache, id);
+    if (link) {
+        g_queue_unlink (priv->cache_lru, link);
+        g_queue_push_head_link (priv->cache_lru, link);
+        commit = link->data;
+        seaf_commit_ref (commit);
+        ++priv->cache_hits;
+    } else {
+        ++priv->cache_misses;
+    }
+
+out:
+    pthread_mutex_unlock (&priv->cache_lock);
+    return commit;
+}
+
+static void
 add_commit_to_cache (SeafCommitManager *mgr, SeafCommit *commit)
 {
-    g_hash_table_insert (mgr->priv->commit_cache,
-                         g_strdup(commit->commit_id),
-                         commit);
+    SeafCommitManagerPriv *priv = mgr->priv;
+
+    pthread_mutex_lock (&priv->cache_lock);
+
+    /* The commit may have been loaded by another thread meanwhile. */
+    if (priv->cache_size <= 0 ||
+        g_hash_table_lookup (priv->commit_cache, commit->commit_id) != NULL)
+        goto out;
+
     seaf_commit_ref (commit);
+    g_queue_push_head (priv->cache_lru, commit);
+    g_hash_table_insert (priv->commit_cache,
+                         commit->commit_id,
+                         g_queue_peek_head_link (priv->cache_lru));
+    evict_commits (priv);
+
+out:
+    pthread_mutex_unlock (&priv->cache_lock);
+}
+
+static void
+remove_commit_from_cache (SeafCommitManager *mgr, const char *id)
+{
+    SeafCommitManagerPriv *priv = mgr->priv;
+    GList *link;
+    SeafCommit *commit;
+
+    pthread_mutex_lock (&priv->cache_lock);
+
+    link = g_hash_table_lookup (priv->commit_cache, id);
+    if (link) {
+        commit = link->data;
+        g_hash_table_remove (priv->commit_cache, id);
+        g_queue_delete_link (priv->cache_lru, link);
+        seaf_commit_unref (commit);
+    }
+
+    pthread_mutex_unlock (&priv->cache_lock);
 }
 
-inline static void
-remove_commit_from_cache (SeafCommitManager *mgr, SeafCommit *commit)
+void
+seaf_commit_manager_set_cache_size (SeafCommitManager *mgr, int size)
 {
-    g_hash_table_remove (mgr->priv->commit_cache, commit->commit_id);
-    seaf_commit_unref (commit);
+    SeafCommitManagerPriv *priv = mgr->priv;
+
+    pthread_mutex_lock (&priv->cache_lock);
+    priv->cache_size = size > 0 ? size : 0;
+    evict_commits (priv);
+    pthread_mutex_unlock (&priv->cache_lock);
+}
+
+SeafileCacheStats *
+seaf_commit_manager_get_cache_stats (SeafCommitManager *mgr)
+{
+    SeafCommitManagerPriv *priv = mgr->priv;
+    SeafileCacheStats *stats;
+
+    pthread_mutex_lock (&priv->cache_lock);
+    stats = g_object_new (SEAFILE_TYPE_CACHE_STATS,
+                          "name", "commit",
+                          "size", (gint64)g_queue_get_length (priv->cache_lru),
+                          "capacity", (gint64)priv->cache_size,
+                          "hits", priv->cache_hits,
+                          "misses", priv->cache_misses,
+                          "evictions", priv->cache_evictions,
+                          NULL);
+    pthread_mutex_unlock (&priv->cache_lock);
+
+    return stats;
 }
-#endif
 
 int
 seaf_commit_manager_add_commit (SeafCommitManager *mgr, SeafCommit *commit)
 {
     int ret;
 
-    /* add_commit_to_cache (mgr, commit); */
     if ((ret = save_commit (mgr, commit)) < 0)
         return -1;
     
@@ -235,21 +366,7 @@ seaf_commit_manager_del_commit (SeafCommitManager *mgr, const char *id)
 {
     g_assert (id != NULL);
 
-#if 0
-    commit = g_hash_table_lookup(mgr->priv->commit_cache, id);
-    if (!commit)
-        goto delete;
-
-    /*
-     * Catch ref count bug here. We have bug in commit ref, the
-     * following assert can't pass. TODO: fix the commit ref bug
-     */
-    /* g_assert (commit->ref <= 1); */
-    remove_commit_from_cache (mgr, commit);
-
-delete:
-#endif
-
+    remove_commit_from_cache (mgr, id);
     delete_commit (mgr, id);
 }
 
@@ -258,19 +375,15 @@ seaf_commit_manager_get_commit (SeafCommitManager *mgr, const char *id)
 {
     SeafCommit *commit;
 
-#if 0
-    commit = g_hash_table_lookup (mgr->priv->commit_cache, id);
-    if (commit != NULL) {
-        seaf_commit_ref (commit);
+    commit = lookup_commit_cache (mgr, id);
+    if (commit != NULL)
         return commit;
-    }
-#endif
 
     commit = load_commit (mgr, id);
     if (!commit)
         return NULL;
 
-    /* add_commit_to_cache (mgr, commit); */
+    add_commit_to_cache (mgr, commit);
 
     return commit;
 }
@@ -612,11 +725,13 @@ end:
 gboolean
 seaf_commit_manager_commit_exists (SeafCommitManager *mgr, const char *id)
 {
-#if 0
-    commit = g_hash_table_lookup (mgr->priv->commit_cache, id);
-    if (commit != NULL)
+    gboolean cached;
+
+    pthread_mutex_lock (&mgr->priv->cache_lock);
+    cached = (g_hash_table_lookup (mgr->priv->commit_cache, id) != NULL);
+    pthread_mutex_unlock (&mgr->priv->cache_lock);
+    if (cached)
         return TRUE;
-#endif
 
     return seaf_obj_store_obj_exists (mgr->obj_store, id);
 }
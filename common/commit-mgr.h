@@ -10,6 +10,7 @@ typedef struct _SeafCommit SeafCommit;
 #include "db.h"
 
 #include "obj-store.h"
+#include "seafile-object.h"
 
 struct _SeafCommit {
     struct _SeafCommitManager *manager;
@@ -109,7 +110,8 @@ seaf_commit_manager_del_commit (SeafCommitManager *mgr, const char *id);
 /**
  * Find a commit object.
  * This function increments ref count of returned object.
- * Not MT safe.
+ * The returned object may be shared with other callers through the commit
+ * cache, so it must not be modified.
  */
 SeafCommit* 
 seaf_commit_manager_get_commit (SeafCommitManager *mgr, const char *id);
@@ -159,4 +161,14 @@ seaf_commit_manager_get_repo_commits (SeafCommitManager *mgr, const char *repo_i
 gboolean
 seaf_commit_manager_commit_exists (SeafCommitManager *mgr, const char *id);
 
+/**
+ * Set the max number of commits kept in the commit cache. 0 disables it.
+ * Can be set with "commit_cache_size" in the "cache" section of seafile.conf.
+ */
+void
+seaf_commit_manager_set_cache_size (SeafCommitManager *mgr, int size);
+
+SeafileCacheStats *
+seaf_commit_manager_get_cache_stats (SeafCommitManager *mgr);
+
 #endif
@@ -2,6 +2,7 @@
 
 #include "common.h"
 
+#include <pthread.h>
 #include <ccnet.h>
 
 #include <sys/stat.h>
@@ -34,9 +35,65 @@
 
 #define SEAF_TMP_EXT ".seaftmp~"
 
+#define FS_CACHE_N_SHARDS 16
+
+#ifdef SEAFILE_SERVER
+#define DEFAULT_FS_CACHE_SIZE ((gint64)64 << 20) /* 64MB */
+#else
+#define DEFAULT_FS_CACHE_SIZE 0
+#endif
+
+typedef struct FSCacheEntry {
+    char     obj_id[41];
+    int      type;              /* SEAF_METADATA_TYPE_FILE or _DIR */
+    void    *obj;               /* Seafile or SeafDir */
+    gint64   size;              /* estimated memory used by obj */
+} FSCacheEntry;
+
+#ifdef SEAFILE_SERVER
+#define DEFAULT_PATH_CACHE_SIZE 50000
+#else
+#define DEFAULT_PATH_CACHE_SIZE 0
+#endif
+
+typedef struct PathCacheEntry {
+    char    *key;               /* "<root id>/<path>" */
+    char     obj_id[41];
+    guint32  mode;
+} PathCacheEntry;
+
+typedef struct FSCacheShard {
+    pthread_mutex_t  lock;
+    GHashTable      *entries;   /* obj id -> link in lru */
+    GQueue          *lru;       /* most recently used first */
+    gint64           size;
+    gint64           capacity;  /* in bytes, 0 disables the cache */
+
+    gint64           hits;
+    gint64           misses;
+    gint64           evictions;
+} FSCacheShard;
+
 struct _SeafFSManagerPriv {
     /* GHashTable      *seafile_cache; */
     GHashTable      *bl_cache;
+
+    /*
+     * LRU cache of parsed fs objects. fs objects are immutable, the cache
+     * is split into shards by object id so that threads seldom wait for
+     * each other's lock.
+     */
+    FSCacheShard     cache_shards[FS_CACHE_N_SHARDS];
+
+    /* LRU cache of (root id, path) -> (object id, mode). */
+    pthread_mutex_t  path_cache_lock;
+    GHashTable      *path_cache;    /* key -> link in path_lru */
+    GQueue          *path_lru;      /* most recently used first */
+    int              path_cache_size;   /* 0 disables the cache */
+
+    gint64           path_hits;
+    gint64           path_misses;
+    gint64           path_evictions;
 };
 
 typedef struct SeafileOndisk {
@@ -57,6 +114,11 @@ typedef struct SeafdirOndisk {
     char    dirents[0];
 } __attribute__((gcc_struct, __packed__)) SeafdirOndisk;
 
+static void
+fs_cache_init (SeafFSManagerPriv *priv);
+static void
+path_cache_init (SeafFSManagerPriv *priv);
+
 #ifndef SEAFILE_SERVER
 uint32_t
 calculate_chunk_size (uint64_t total_size);
@@ -80,6 +142,8 @@ seaf_fs_manager_new (SeafileSession *seaf,
     }
 
     mgr->priv = g_new0(SeafFSManagerPriv, 1);
+    fs_cache_init (mgr->priv);
+    path_cache_init (mgr->priv);
     
     return mgr;
 }
@@ -87,6 +151,27 @@ seaf_fs_manager_new (SeafileSession *seaf,
 int
 seaf_fs_manager_init (SeafFSManager *mgr)
 {
+#ifdef SEAFILE_SERVER
+    GError *error = NULL;
+    int cache_size_mb, cache_size;
+
+    cache_size_mb = g_key_file_get_integer (mgr->seaf->config,
+                                            "cache", "fs_cache_size",
+                                            &error);
+    if (!error)
+        seaf_fs_manager_set_cache_size (mgr, (gint64)cache_size_mb << 20);
+    else
+        g_clear_error (&error);
+
+    cache_size = g_key_file_get_integer (mgr->seaf->config,
+                                         "cache", "path_cache_size",
+                                         &error);
+    if (!error)
+        seaf_fs_manager_set_path_cache_size (mgr, cache_size);
+    else
+        g_clear_error (&error);
+#endif
+
 #if defined SEAFILE_SERVER && defined FULL_FEATURE
     if (seaf_obj_store_init (mgr->obj_store, TRUE, seaf->ev_mgr) < 0) {
         g_warning ("[fs mgr] Failed to init fs object store.\n");
@@ -466,6 +551,294 @@ seaf_fs_manager_index_blocks (SeafFSManager *mgr,
     return 0;
 }
 
+struct SeafFileIndexer {
+    SeafFSManager *mgr;
+    CDCFileDescriptor cdc;
+    CDCStream *stream;
+};
+
+SeafFileIndexer *
+seaf_fs_manager_file_indexer_new (SeafFSManager *mgr,
+                                  gint64 size_hint,
+                                  SeafileCrypt *crypt)
+{
+    SeafFileIndexer *indexer = g_new0 (SeafFileIndexer, 1);
+
+    indexer->mgr = mgr;
+    indexer->cdc.block_sz = calculate_chunk_size (size_hint);
+    indexer->cdc.block_min_sz = indexer->cdc.block_sz >> 2;
+    indexer->cdc.block_max_sz = indexer->cdc.block_sz << 2;
+    indexer->cdc.write_block = seafile_write_chunk;
+
+    indexer->stream = cdc_stream_new (&indexer->cdc, crypt, TRUE);
+    if (!indexer->stream) {
+        g_free (indexer);
+        return NULL;
+    }
+
+    return indexer;
+}
+
+int
+seaf_file_indexer_feed (SeafFileIndexer *indexer,
+                        const char *data,
+                        size_t len)
+{
+    if (cdc_stream_feed (indexer->stream, data, len) < 0) {
+        g_warning ("Failed to chunk file with CDC.\n");
+        return -1;
+    }
+
+    return 0;
+}
+
+int
+seaf_file_indexer_finish (SeafFileIndexer *indexer, unsigned char sha1[])
+{
+    CDCFileDescriptor empty;
+
+    if (indexer->cdc.file_size == 0) {
+        /* handle empty file. */
+        memset (sha1, 0, 20);
+        create_cdc_for_empty_file (&empty);
+        if (write_seafile (indexer->mgr, &empty) < 0) {
+            g_warning ("Failed to write seafile for empty file.\n");
+            return -1;
+        }
+        return 0;
+    }
+
+    if (cdc_stream_finish (indexer->stream) < 0) {
+        g_warning ("Failed to chunk file with CDC.\n");
+        return -1;
+    }
+    memcpy (sha1, indexer->cdc.file_sum, 20);
+
+    if (write_seafile (indexer->mgr, &indexer->cdc) < 0) {
+        g_warning ("Failed to write seafile.\n");
+        return -1;
+    }
+
+    return 0;
+}
+
+void
+seaf_file_indexer_free (SeafFileIndexer *indexer)
+{
+    if (!indexer)
+        return;
+
+    cdc_stream_free (indexer->stream);
+    if (indexer->cdc.blk_sha1s)
+        free (indexer->cdc.blk_sha1s);
+    g_free (indexer);
+}
+
+/* fs object cache */
+
+static void
+fs_cache_init (SeafFSManagerPriv *priv)
+{
+    FSCacheShard *shard;
+    int i;
+
+    for (i = 0; i < FS_CACHE_N_SHARDS; ++i) {
+        shard = &priv->cache_shards[i];
+        pthread_mutex_init (&shard->lock, NULL);
+        /* Keys are owned by the entries. */
+        shard->entries = g_hash_table_new (g_str_hash, g_str_equal);
+        shard->lru = g_queue_new ();
+        shard->capacity = DEFAULT_FS_CACHE_SIZE / FS_CACHE_N_SHARDS;
+    }
+}
+
+inline static FSCacheShard *
+get_cache_shard (SeafFSManager *mgr, const char *obj_id)
+{
+    int v = g_ascii_xdigit_value (obj_id[0]);
+
+    return &mgr->priv->cache_shards[v > 0 ? v % FS_CACHE_N_SHARDS : 0];
+}
+
+static void
+fs_cache_entry_free (FSCacheEntry *entry)
+{
+    if (entry->type == SEAF_METADATA_TYPE_FILE)
+        seafile_unref ((Seafile *)entry->obj);
+    else
+        seaf_dir_free ((SeafDir *)entry->obj);
+    g_free (entry);
+}
+
+/* Called with shard->lock held. */
+static void
+evict_fs_objects (FSCacheShard *shard)
+{
+    FSCacheEntry *entry;
+
+    while (shard->size > shard->capacity) {
+        entry = g_queue_pop_tail (shard->lru);
+        g_hash_table_remove (shard->entries, entry->obj_id);
+        shard->size -= entry->size;
+        fs_cache_entry_free (entry);
+        ++shard->evictions;
+    }
+}
+
+static SeafDir *
+copy_dir (SeafDir *dir)
+{
+    SeafDir *copy;
+    GList *ptr;
+
+    copy = g_new0 (SeafDir, 1);
+    memcpy (copy->dir_id, dir->dir_id, 41);
+    for (ptr = dir->entries; ptr; ptr = ptr->next)
+        copy->entries = g_list_prepend (copy->entries,
+                                        seaf_dirent_dup (ptr->data));
+    copy->entries = g_list_reverse (copy->entries);
+
+    return copy;
+}
+
+/*
+ * Return the cached object of @obj_id. Seafile objects are shared with
+ * the cache and returned with an additional reference. SeafDir objects
+ * are copied, since callers own and modify the dirs they get.
+ */
+static void *
+fs_cache_lookup (SeafFSManager *mgr, const char *obj_id, int type)
+{
+    FSCacheShard *shard = get_cache_shard (mgr, obj_id);
+    GList *link;
+    FSCacheEntry *entry;
+    void *obj = NULL;
+
+    pthread_mutex_lock (&shard->lock);
+
+    if (shard->capacity <= 0)
+        goto out;
+
+    link = g_hash_table_lookup (shard->entries, obj_id);
+    if (!link || ((FSCacheEntry *)link->data)->type != type) {
+        ++shard->misses;
+        goto out;
+    }
+
+    g_queue_unlink (shard->lru, link);
+    g_queue_push_head_link (shard->lru, link);
+    entry = link->data;
+    if (type == SEAF_METADATA_TYPE_FILE) {
+        seafile_ref ((Seafile *)entry->obj);
+        obj = entry->obj;
+    } else {
+        obj = copy_dir ((SeafDir *)entry->obj);
+    }
+    ++shard->hits;
+
+out:
+    pthread_mutex_unlock (&shard->lock);
+    return obj;
+}
+
+static gint64
+fs_object_size (void *obj, int type)
+{
+    if (type == SEAF_METADATA_TYPE_FILE) {
+        Seafile *file = obj;
+        return sizeof(Seafile) + file->n_blocks * (sizeof(char *) + 41);
+    } else {
+        SeafDir *dir = obj;
+        return sizeof(SeafDir) +
+            g_list_length (dir->entries) * (sizeof(SeafDirent) + sizeof(GList));
+    }
+}
+
+/* The cache keeps its own reference or copy of @obj. */
+static void
+fs_cache_add (SeafFSManager *mgr, const char *obj_id, int type, void *obj)
+{
+    FSCacheShard *shard = get_cache_shard (mgr, obj_id);
+    FSCacheEntry *entry;
+    gint64 size;
+
+    if (shard->capacity <= 0)
+        return;
+
+    size = fs_object_size (obj, type);
+
+    pthread_mutex_lock (&shard->lock);
+
+    /* The object may have been loaded by another thread meanwhile. */
+    if (size > shard->capacity ||
+        g_hash_table_lookup (shard->entries, obj_id) != NULL) {
+        pthread_mutex_unlock (&shard->lock);
+        return;
+    }
+
+    entry = g_new0 (FSCacheEntry, 1);
+    memcpy (entry->obj_id, obj_id, 40);
+    entry->type = type;
+    entry->size = size;
+    if (type == SEAF_METADATA_TYPE_FILE) {
+        seafile_ref ((Seafile *)obj);
+        entry->obj = obj;
+    } else {
+        entry->obj = copy_dir ((SeafDir *)obj);
+    }
+
+    g_queue_push_head (shard->lru, entry);
+    g_hash_table_insert (shard->entries, entry->obj_id,
+                         g_queue_peek_head_link (shard->lru));
+    shard->size += size;
+    evict_fs_objects (shard);
+
+    pthread_mutex_unlock (&shard->lock);
+}
+
+void
+seaf_fs_manager_set_cache_size (SeafFSManager *mgr, gint64 size)
+{
+    FSCacheShard *shard;
+    int i;
+
+    for (i = 0; i < FS_CACHE_N_SHARDS; ++i) {
+        shard = &mgr->priv->cache_shards[i];
+        pthread_mutex_lock (&shard->lock);
+        shard->capacity = size > 0 ? size / FS_CACHE_N_SHARDS : 0;
+        evict_fs_objects (shard);
+        pthread_mutex_unlock (&shard->lock);
+    }
+}
+
+SeafileCacheStats *
+seaf_fs_manager_get_cache_stats (SeafFSManager *mgr)
+{
+    FSCacheShard *shard;
+    gint64 size = 0, capacity = 0, hits = 0, misses = 0, evictions = 0;
+    int i;
+
+    for (i = 0; i < FS_CACHE_N_SHARDS; ++i) {
+        shard = &mgr->priv->cache_shards[i];
+        pthread_mutex_lock (&shard->lock);
+        size += shard->size;
+        capacity += shard->capacity;
+        hits += shard->hits;
+        misses += shard->misses;
+        evictions += shard->evictions;
+        pthread_mutex_unlock (&shard->lock);
+    }
+
+    return g_object_new (SEAFILE_TYPE_CACHE_STATS,
+                         "name", "fs",
+                         "size", size,
+                         "capacity", capacity,
+                         "hits", hits,
+                         "misses", misses,
+                         "evictions", evictions,
+                         NULL);
+}
+
 Seafile *
 seafile_from_data (const char *id, const void *data, int len)
 {
@@ -520,7 +893,7 @@ seafile_to_data (Seafile *seafile, int *len)
 void
 seafile_ref (Seafile *seafile)
 {
-    ++seafile->ref_count;
+    g_atomic_int_inc (&seafile->ref_count);
 }
 
 static void
@@ -543,7 +916,7 @@ seafile_unref (Seafile *seafile)
     if (!seafile)
         return;
 
-    if (--seafile->ref_count <= 0)
+    if (g_atomic_int_dec_and_test (&seafile->ref_count))
         seafile_free (seafile);
 }
 
@@ -554,14 +927,6 @@ seaf_fs_manager_get_seafile (SeafFSManager *mgr, const char *file_id)
     int len;
     Seafile *seafile;
 
-#if 0
-    seafile = g_hash_table_lookup (mgr->priv->seafile_cache, file_id);
-    if (seafile) {
-        seafile_ref (seafile);
-        return seafile;
-    }
-#endif
-
     if (memcmp (file_id, EMPTY_SHA1, 40) == 0) {
         seafile = g_new0 (Seafile, 1);
         memset (seafile->file_id, '0', 40);
@@ -569,6 +934,10 @@ seaf_fs_manager_get_seafile (SeafFSManager *mgr, const char *file_id)
         return seafile;
     }
 
+    seafile = fs_cache_lookup (mgr, file_id, SEAF_METADATA_TYPE_FILE);
+    if (seafile)
+        return seafile;
+
     if (seaf_obj_store_read_obj (mgr->obj_store, file_id, &data, &len) < 0) {
         g_warning ("[fs mgr] Failed to read file %s.\n", file_id);
         return NULL;
@@ -577,13 +946,8 @@ seaf_fs_manager_get_seafile (SeafFSManager *mgr, const char *file_id)
     seafile = seafile_from_data (file_id, data, len);
     g_free (data);
 
-#if 0
-    /*
-     * Add to cache. Also increase ref count.
-     */
-    seafile_ref (seafile);
-    g_hash_table_insert (mgr->priv->seafile_cache, g_strdup(file_id), seafile);
-#endif
+    if (seafile)
+        fs_cache_add (mgr, file_id, SEAF_METADATA_TYPE_FILE, seafile);
 
     return seafile;
 }
@@ -788,14 +1152,16 @@ seaf_fs_manager_get_seafdir (SeafFSManager *mgr, const char *dir_id)
     int len;
     SeafDir *dir;
 
-    /* TODO: add hash cache */
-
     if (memcmp (dir_id, EMPTY_SHA1, 40) == 0) {
         dir = g_new0 (SeafDir, 1);
         memset (dir->dir_id, '0', 40);
         return dir;
     }
 
+    dir = fs_cache_lookup (mgr, dir_id, SEAF_METADATA_TYPE_DIR);
+    if (dir)
+        return dir;
+
     if (seaf_obj_store_read_obj (mgr->obj_store, dir_id, &data, &len) < 0) {
         g_warning ("[fs mgr] Failed to read dir %s.\n", dir_id);
         return NULL;
@@ -804,6 +1170,9 @@ seaf_fs_manager_get_seafdir (SeafFSManager *mgr, const char *dir_id)
     dir = seaf_dir_from_data (dir_id, data, len);
     g_free (data);
 
+    if (dir)
+        fs_cache_add (mgr, dir_id, SEAF_METADATA_TYPE_DIR, dir);
+
     return dir;
 }
 
@@ -1164,6 +1533,111 @@ seaf_fs_manager_get_fs_size (SeafFSManager *mgr,
      return get_dir_size (mgr, root_id);
 }
 
+static gint64
+get_dirent_size (SeafFSManager *mgr, SeafDirent *dent)
+{
+    if (S_ISREG(dent->mode))
+        return seaf_fs_manager_get_file_size (mgr, dent->id);
+    else if (S_ISDIR(dent->mode))
+        return get_dir_size (mgr, dent->id);
+    return 0;
+}
+
+/*
+ * Entries with the same id in both dirs are skipped, so only the
+ * changed parts of the trees are visited.
+ */
+static int
+get_dir_size_delta (SeafFSManager *mgr, const char *old_id,
+                    const char *new_id, gint64 *delta)
+{
+    SeafDir *old_dir = NULL, *new_dir = NULL;
+    GHashTable *old_dents;
+    SeafDirent *old_dent, *new_dent;
+    GList *p;
+    gint64 size;
+    int ret = 0;
+
+    if (strcmp (old_id, new_id) == 0)
+        return 0;
+
+    old_dir = seaf_fs_manager_get_seafdir (mgr, old_id);
+    new_dir = seaf_fs_manager_get_seafdir (mgr, new_id);
+    if (!old_dir || !new_dir) {
+        ret = -1;
+        goto out;
+    }
+
+    old_dents = g_hash_table_new (g_str_hash, g_str_equal);
+    for (p = old_dir->entries; p; p = p->next) {
+        old_dent = p->data;
+        g_hash_table_insert (old_dents, old_dent->name, old_dent);
+    }
+
+    for (p = new_dir->entries; p; p = p->next) {
+        new_dent = p->data;
+        old_dent = g_hash_table_lookup (old_dents, new_dent->name);
+        if (old_dent) {
+            g_hash_table_remove (old_dents, new_dent->name);
+            if (old_dent->mode == new_dent->mode &&
+                strcmp (old_dent->id, new_dent->id) == 0)
+                continue;
+            if (S_ISDIR(old_dent->mode) && S_ISDIR(new_dent->mode)) {
+                if (get_dir_size_delta (mgr, old_dent->id,
+                                        new_dent->id, delta) < 0) {
+                    ret = -1;
+                    break;
+                }
+                continue;
+            }
+            if ((size = get_dirent_size (mgr, old_dent)) < 0) {
+                ret = -1;
+                break;
+            }
+            *delta -= size;
+        }
+        if ((size = get_dirent_size (mgr, new_dent)) < 0) {
+            ret = -1;
+            break;
+        }
+        *delta += size;
+    }
+
+    if (ret == 0) {
+        /* Entries left are removed in the new dir. */
+        GHashTableIter iter;
+        gpointer key, value;
+
+        g_hash_table_iter_init (&iter, old_dents);
+        while (g_hash_table_iter_next (&iter, &key, &value)) {
+            if ((size = get_dirent_size (mgr, value)) < 0) {
+                ret = -1;
+                break;
+            }
+            *delta -= size;
+        }
+    }
+
+    g_hash_table_destroy (old_dents);
+
+out:
+    if (old_dir)
+        seaf_dir_free (old_dir);
+    if (new_dir)
+        seaf_dir_free (new_dir);
+    return ret;
+}
+
+int
+seaf_fs_manager_get_fs_size_delta (SeafFSManager *mgr,
+                                   const char *old_root_id,
+                                   const char *new_root_id,
+                                   gint64 *delta)
+{
+    *delta = 0;
+    return get_dir_size_delta (mgr, old_root_id, new_root_id, delta);
+}
+
 static int
 count_dir_files (SeafFSManager *mgr, const char *id)
 {
@@ -1205,58 +1679,291 @@ seaf_fs_manager_count_fs_files (SeafFSManager *mgr,
      return count_dir_files (mgr, root_id);
 }
 
-SeafDir *
-seaf_fs_manager_get_seafdir_by_path (SeafFSManager *mgr,
-                                     const char *root_id,
-                                     const char *path,
-                                     GError **error)
+/* Path resolution cache */
+
+static void
+path_cache_init (SeafFSManagerPriv *priv)
 {
-    SeafDir *dir;
-    SeafDirent *dent;
-    const char *dir_id = root_id;
-    char *name, *saveptr;
-    char *tmp_path = g_strdup(path);
+    pthread_mutex_init (&priv->path_cache_lock, NULL);
+    /* Keys are owned by the entries. */
+    priv->path_cache = g_hash_table_new (g_str_hash, g_str_equal);
+    priv->path_lru = g_queue_new ();
+    priv->path_cache_size = DEFAULT_PATH_CACHE_SIZE;
+}
 
-    dir = seaf_fs_manager_get_seafdir (mgr, dir_id);
-    if (!dir) {
-        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_DIR_MISSING, "directory is missing");
-        return NULL;
+/* Called with path_cache_lock held. */
+static void
+evict_paths (SeafFSManagerPriv *priv)
+{
+    PathCacheEntry *entry;
+
+    while ((int)g_queue_get_length (priv->path_lru) > priv->path_cache_size) {
+        entry = g_queue_pop_tail (priv->path_lru);
+        g_hash_table_remove (priv->path_cache, entry->key);
+        g_free (entry->key);
+        g_free (entry);
+        ++priv->path_evictions;
     }
+}
 
-    name = strtok_r (tmp_path, "/", &saveptr);
-    while (name != NULL) {
-        GList *l;
-        for (l = dir->entries; l != NULL; l = l->next) {
-            dent = l->data;
-            
-            if (strcmp(dent->name, name) == 0 && S_ISDIR(dent->mode)) {
-                dir_id = dent->id;
-                break;
-            }
-        }
+/*
+ * Find the longest cached prefix of a path. @key is the cache key of the
+ * whole path, and @key_lens[i] is the length of the key of its first i+1
+ * parts. The id and mode of the prefix are copied to @obj_id and @mode.
+ *
+ * All prefixes are probed under one lock hold, and the lookup counts as
+ * one hit or one miss.
+ *
+ * Returns the number of parts in the prefix, 0 if no prefix is cached.
+ */
+static int
+path_cache_lookup_prefix (SeafFSManager *mgr, GString *key,
+                          const int *key_lens, int n_parts,
+                          char *obj_id, guint32 *mode)
+{
+    SeafFSManagerPriv *priv = mgr->priv;
+    GList *link = NULL;
+    PathCacheEntry *entry;
+    int i, n_found = 0;
+    char saved;
 
-        if (!l) {
-            g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_PATH_NO_EXIST,
-                         "Path does not exists %s", path);
-            seaf_dir_free (dir);
-            dir = NULL;
+    if (n_parts == 0)
+        return 0;
+
+    pthread_mutex_lock (&priv->path_cache_lock);
+
+    if (priv->path_cache_size <= 0)
+        goto out;
+
+    for (i = n_parts - 1; i >= 0; --i) {
+        /* Terminate the key at the prefix instead of copying it. */
+        saved = key->str[key_lens[i]];
+        key->str[key_lens[i]] = '\0';
+        link = g_hash_table_lookup (priv->path_cache, key->str);
+        key->str[key_lens[i]] = saved;
+        if (link)
             break;
-        }
+    }
+
+    if (link) {
+        g_queue_unlink (priv->path_lru, link);
+        g_queue_push_head_link (priv->path_lru, link);
+        entry = link->data;
+        memcpy (obj_id, entry->obj_id, 41);
+        *mode = entry->mode;
+        n_found = i + 1;
+        ++priv->path_hits;
+    } else {
+        ++priv->path_misses;
+    }
 
-        SeafDir *prev = dir;
-        dir = seaf_fs_manager_get_seafdir (mgr, dir_id);
-        seaf_dir_free (prev);
+out:
+    pthread_mutex_unlock (&priv->path_cache_lock);
+    return n_found;
+}
+
+static void
+path_cache_add (SeafFSManager *mgr, const char *key,
+                const char *obj_id, guint32 mode)
+{
+    SeafFSManagerPriv *priv = mgr->priv;
+    PathCacheEntry *entry;
+
+    pthread_mutex_lock (&priv->path_cache_lock);
+
+    if (priv->path_cache_size <= 0 ||
+        g_hash_table_lookup (priv->path_cache, key) != NULL)
+        goto out;
+
+    entry = g_new0 (PathCacheEntry, 1);
+    entry->key = g_strdup (key);
+    memcpy (entry->obj_id, obj_id, 41);
+    entry->mode = mode;
+
+    g_queue_push_head (priv->path_lru, entry);
+    g_hash_table_insert (priv->path_cache, entry->key,
+                         g_queue_peek_head_link (priv->path_lru));
+    evict_paths (priv);
+
+out:
+    pthread_mutex_unlock (&priv->path_cache_lock);
+}
+
+void
+seaf_fs_manager_set_path_cache_size (SeafFSManager *mgr, int size)
+{
+    SeafFSManagerPriv *priv = mgr->priv;
+
+    pthread_mutex_lock (&priv->path_cache_lock);
+    priv->path_cache_size = size > 0 ? size : 0;
+    evict_paths (priv);
+    pthread_mutex_unlock (&priv->path_cache_lock);
+}
+
+SeafileCacheStats *
+seaf_fs_manager_get_path_cache_stats (SeafFSManager *mgr)
+{
+    SeafFSManagerPriv *priv = mgr->priv;
+    SeafileCacheStats *stats;
+
+    pthread_mutex_lock (&priv->path_cache_lock);
+    stats = g_object_new (SEAFILE_TYPE_CACHE_STATS,
+                          "name", "path",
+                          "size", (gint64)g_queue_get_length (priv->path_lru),
+                          "capacity", (gint64)priv->path_cache_size,
+                          "hits", priv->path_hits,
+                          "misses", priv->path_misses,
+                          "evictions", priv->path_evictions,
+                          NULL);
+    pthread_mutex_unlock (&priv->path_cache_lock);
+
+    return stats;
+}
+
+/*
+ * Split @path into its non-empty components, returned in @parts. Returns
+ * the path cache key of the whole path. @key_lens[i] is set to the length
+ * of the key of the first i+1 parts.
+ */
+static GString *
+split_path_key (const char *root_id, const char *path,
+                char ***parts, int *n_parts, int **key_lens)
+{
+    char **p;
+    int i, n = 0;
+    GString *key;
+
+    p = g_strsplit (path, "/", -1);
+    for (i = 0; p[i] != NULL; ++i) {
+        if (p[i][0] != '\0')
+            p[n++] = p[i];
+        else
+            g_free (p[i]);
+    }
+    p[n] = NULL;
+
+    key = g_string_new_len (root_id, 40);
+    *key_lens = g_new0 (int, n + 1);
+    for (i = 0; i < n; ++i) {
+        g_string_append_c (key, '/');
+        g_string_append (key, p[i]);
+        (*key_lens)[i] = key->len;
+    }
+
+    *parts = p;
+    *n_parts = n;
+    return key;
+}
+
+/*
+ * Resolve @path in the tree of @root_id, all components but the last must
+ * be dirs. On success, the 40-char id and the mode of the object are copied
+ * to @obj_id and @mode.
+ *
+ * The (root id, path) -> object mapping never changes, so every resolved
+ * prefix of @path is cached. Resolution starts from the longest cached
+ * prefix, and only reads the dirs below it.
+ *
+ * Returns FALSE if the path doesn't exist, or if a dir can't be read, in
+ * which case @error is set.
+ */
+static gboolean
+resolve_path (SeafFSManager *mgr, const char *root_id, const char *path,
+              char *obj_id, guint32 *mode, GError **error)
+{
+    char **parts;
+    int n_parts, i, start;
+    GString *key;
+    int *key_lens;
+    char *prefix;
+    char cur_id[41];
+    guint32 cur_mode = S_IFDIR;
+    SeafDir *dir;
+    SeafDirent *dent = NULL;
+    GList *ptr;
+    gboolean found = FALSE;
 
+    key = split_path_key (root_id, path, &parts, &n_parts, &key_lens);
+
+    memcpy (cur_id, root_id, 40);
+    cur_id[40] = '\0';
+
+    start = path_cache_lookup_prefix (mgr, key, key_lens, n_parts,
+                                      cur_id, &cur_mode);
+
+    found = TRUE;
+    for (i = start; i < n_parts; ++i) {
+        /* Only the last component may be a file. */
+        if (!S_ISDIR(cur_mode)) {
+            found = FALSE;
+            break;
+        }
+
+        dir = seaf_fs_manager_get_seafdir (mgr, cur_id);
         if (!dir) {
-            g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_DIR_MISSING, 
+            g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_DIR_MISSING,
                          "directory is missing");
+            found = FALSE;
+            break;
+        }
+
+        for (ptr = dir->entries; ptr != NULL; ptr = ptr->next) {
+            dent = ptr->data;
+            if (strcmp (dent->name, parts[i]) == 0)
+                break;
+        }
+        if (!ptr) {
+            seaf_dir_free (dir);
+            found = FALSE;
             break;
         }
 
-        name = strtok_r (NULL, "/", &saveptr);
+        memcpy (cur_id, dent->id, 41);
+        cur_mode = dent->mode;
+        seaf_dir_free (dir);
+
+        prefix = g_strndup (key->str, key_lens[i]);
+        path_cache_add (mgr, prefix, cur_id, cur_mode);
+        g_free (prefix);
     }
 
-    g_free (tmp_path);
+    if (found) {
+        memcpy (obj_id, cur_id, 41);
+        *mode = cur_mode;
+    }
+
+    g_free (key_lens);
+    g_string_free (key, TRUE);
+    g_strfreev (parts);
+    return found;
+}
+
+SeafDir *
+seaf_fs_manager_get_seafdir_by_path (SeafFSManager *mgr,
+                                     const char *root_id,
+                                     const char *path,
+                                     GError **error)
+{
+    SeafDir *dir;
+    char dir_id[41];
+    guint32 mode;
+    GError *tmp_error = NULL;
+
+    if (!resolve_path (mgr, root_id, path, dir_id, &mode, &tmp_error) ||
+        !S_ISDIR(mode)) {
+        if (tmp_error)
+            g_propagate_error (error, tmp_error);
+        else
+            g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_PATH_NO_EXIST,
+                         "Path does not exists %s", path);
+        return NULL;
+    }
+
+    dir = seaf_fs_manager_get_seafdir (mgr, dir_id);
+    if (!dir)
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_DIR_MISSING,
+                     "directory is missing");
+
     return dir;
 }
 
@@ -1267,73 +1974,204 @@ seaf_fs_manager_path_to_obj_id (SeafFSManager *mgr,
                                  guint32 *mode,
                                  GError **error)
 {
-    char *copy = g_strdup (path);
-    int off = strlen(copy) - 1;
-    char *slash, *name;
-    SeafDir *base_dir = NULL;
+    char obj_id[41];
+    guint32 obj_mode;
+
+    if (!resolve_path (mgr, root_id, path, obj_id, &obj_mode, error))
+        return NULL;
+
+    if (mode)
+        *mode = obj_mode;
+    return g_strdup (obj_id);
+}
+
+typedef struct PathNode PathNode;
+
+static void
+path_node_free (PathNode *node);
+
+struct PathNode {
+    GHashTable *children;       /* name -> PathNode */
+    GList *indexes;             /* indexes of the paths ending at this node */
+};
+
+static PathNode *
+path_node_new ()
+{
+    PathNode *node = g_new0 (PathNode, 1);
+
+    node->children = g_hash_table_new_full (g_str_hash, g_str_equal,
+                                            g_free,
+                                            (GDestroyNotify)path_node_free);
+    return node;
+}
+
+static void
+path_node_free (PathNode *node)
+{
+    g_hash_table_destroy (node->children);
+    g_list_free (node->indexes);
+    g_free (node);
+}
+
+/*
+ * Walk the dir @dir_id along the paths under @node. @key is the path cache
+ * key of the dir, and every resolved path is added to the cache.
+ */
+static int
+walk_path_tree (SeafFSManager *mgr, const char *dir_id, PathNode *node,
+                GString *key, char **file_ids, GError **error)
+{
+    SeafDir *dir;
     SeafDirent *dent;
-    GList *p;
-    char *obj_id = NULL;
+    PathNode *child;
+    GList *ptr, *p;
+    gsize key_len = key->len;
+    int ret = 0;
 
-    while (off >= 0 && copy[off] == '/')
-        copy[off--] = 0;
+    dir = seaf_fs_manager_get_seafdir (mgr, dir_id);
+    if (!dir) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_DIR_MISSING,
+                     "directory is missing");
+        return -1;
+    }
 
-    if (strlen(copy) == 0) {
-        /* the path is root "/" */
-        if (mode) {
-            *mode = S_IFDIR;
+    for (ptr = dir->entries; ptr != NULL; ptr = ptr->next) {
+        dent = ptr->data;
+        child = g_hash_table_lookup (node->children, dent->name);
+        if (!child)
+            continue;
+
+        g_string_append_c (key, '/');
+        g_string_append (key, dent->name);
+        path_cache_add (mgr, key->str, dent->id, dent->mode);
+
+        if (!S_ISDIR(dent->mode)) {
+            for (p = child->indexes; p; p = p->next)
+                file_ids[(long)p->data] = g_strdup (dent->id);
+        } else if (g_hash_table_size (child->children) > 0) {
+            if (walk_path_tree (mgr, dent->id, child, key,
+                                file_ids, error) < 0) {
+                ret = -1;
+                break;
+            }
         }
-        obj_id = g_strdup(root_id);
-        goto out;
+
+        g_string_truncate (key, key_len);
     }
 
-    slash = strrchr (copy, '/');
-    if (!slash) {
-        base_dir = seaf_fs_manager_get_seafdir (mgr, root_id);
-        if (!base_dir) {
-            g_warning ("Failed to find root dir %s.\n", root_id);
-            g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL, " ");
-            goto out;
+    seaf_dir_free (dir);
+    return ret;
+}
+
+/* A dir that the walk of a batch of paths starts from. */
+typedef struct WalkStart {
+    char dir_id[41];
+    GString *key;               /* path cache key of the dir */
+    PathNode *root;
+} WalkStart;
+
+static void
+walk_start_free (WalkStart *ws)
+{
+    g_string_free (ws->key, TRUE);
+    path_node_free (ws->root);
+    g_free (ws);
+}
+
+char **
+seaf_fs_manager_get_file_ids_by_paths (SeafFSManager *mgr,
+                                       const char *root_id,
+                                       char **paths,
+                                       int n_paths,
+                                       GError **error)
+{
+    GHashTable *starts;
+    GHashTableIter iter;
+    gpointer value;
+    WalkStart *ws;
+    PathNode *node, *child;
+    GString *key;
+    char **parts, **file_ids;
+    int *key_lens;
+    int n_parts, n_cached, i, j;
+    char cur_id[41];
+    guint32 cur_mode;
+    char *start_key;
+
+    file_ids = g_new0 (char *, n_paths + 1);
+
+    /* Each path is walked from its longest cached prefix. Paths starting
+     * from the same dir are merged into a tree, so that common prefixes
+     * are walked once.
+     */
+    starts = g_hash_table_new_full (g_str_hash, g_str_equal,
+                                    g_free, (GDestroyNotify)walk_start_free);
+    for (i = 0; i < n_paths; ++i) {
+        key = split_path_key (root_id, paths[i], &parts, &n_parts, &key_lens);
+
+        memcpy (cur_id, root_id, 40);
+        cur_id[40] = '\0';
+        cur_mode = S_IFDIR;
+        n_cached = path_cache_lookup_prefix (mgr, key, key_lens, n_parts,
+                                             cur_id, &cur_mode);
+
+        /* The root is a dir, it never matches a file. Only the last
+         * component may be a file.
+         */
+        if (n_parts == 0 || !S_ISDIR(cur_mode)) {
+            if (n_parts > 0 && n_cached == n_parts)
+                file_ids[i] = g_strdup (cur_id);
+            goto next;
         }
-        name = copy;
-    } else {
-        *slash = 0;
-        name = slash + 1;
-        GError *tmp_error = NULL;
-        base_dir = seaf_fs_manager_get_seafdir_by_path (mgr,
-                                                        root_id,
-                                                        copy,
-                                                        &tmp_error);
-        if (tmp_error &&
-            !g_error_matches(tmp_error,
-                             SEAFILE_DOMAIN,
-                             SEAF_ERR_PATH_NO_EXIST)) {
-            g_warning ("Failed to get dir for %s.\n", copy);
-            g_propagate_error (error, tmp_error);
-            goto out;
+        if (n_cached == n_parts)
+            goto next;
+
+        start_key = g_strndup (key->str,
+                               n_cached > 0 ? key_lens[n_cached - 1] : 40);
+        ws = g_hash_table_lookup (starts, start_key);
+        if (!ws) {
+            ws = g_new0 (WalkStart, 1);
+            memcpy (ws->dir_id, cur_id, 41);
+            ws->key = g_string_new (start_key);
+            ws->root = path_node_new ();
+            g_hash_table_insert (starts, start_key, ws);
+        } else {
+            g_free (start_key);
         }
 
-        /* The path doesn't exist in this commit. */
-        if (!base_dir)
-            goto out;
+        node = ws->root;
+        for (j = n_cached; j < n_parts; ++j) {
+            child = g_hash_table_lookup (node->children, parts[j]);
+            if (!child) {
+                child = path_node_new ();
+                g_hash_table_insert (node->children, g_strdup(parts[j]), child);
+            }
+            node = child;
+        }
+        node->indexes = g_list_prepend (node->indexes, (gpointer)(long)i);
+
+    next:
+        g_free (key_lens);
+        g_string_free (key, TRUE);
+        g_strfreev (parts);
     }
 
-    for (p = base_dir->entries; p != NULL; p = p->next) {
-        dent = p->data;
-        if (strcmp (dent->name, name) == 0) {
-            obj_id = g_strdup (dent->id);
-            if (mode) {
-                *mode = dent->mode;
-            }
+    g_hash_table_iter_init (&iter, starts);
+    while (g_hash_table_iter_next (&iter, NULL, &value)) {
+        ws = value;
+        if (walk_path_tree (mgr, ws->dir_id, ws->root, ws->key,
+                            file_ids, error) < 0) {
+            for (i = 0; i < n_paths; ++i)
+                g_free (file_ids[i]);
+            g_free (file_ids);
+            file_ids = NULL;
             break;
         }
     }
 
-out:
-    if (base_dir)
-        seaf_dir_free (base_dir);
-    g_free (copy);
-    return obj_id;
+    g_hash_table_destroy (starts);
+    return file_ids;
 }
 
 char *
@@ -124,6 +124,28 @@ seaf_fs_manager_new (struct _SeafileSession *seaf,
 int
 seaf_fs_manager_init (SeafFSManager *mgr);
 
+/*
+ * Set the memory budget in bytes of the cache of parsed fs objects.
+ * 0 disables it. Can be set in MB with "fs_cache_size" in the "cache"
+ * section of seafile.conf.
+ */
+void
+seaf_fs_manager_set_cache_size (SeafFSManager *mgr, gint64 size);
+
+SeafileCacheStats *
+seaf_fs_manager_get_cache_stats (SeafFSManager *mgr);
+
+/*
+ * Set the max number of resolved paths kept in the path cache.
+ * 0 disables it. Can be set with "path_cache_size" in the "cache"
+ * section of seafile.conf.
+ */
+void
+seaf_fs_manager_set_path_cache_size (SeafFSManager *mgr, int size);
+
+SeafileCacheStats *
+seaf_fs_manager_get_path_cache_stats (SeafFSManager *mgr);
+
 #ifndef SEAFILE_SERVER
 
 char *
@@ -157,6 +179,33 @@ seaf_fs_manager_index_blocks (SeafFSManager *mgr,
                               unsigned char sha1[],
                               SeafileCrypt *crypt);
 
+/*
+ * Check in blocks of a file whose content is received in pieces, without
+ * storing it in a temp file first. @size_hint is an upper bound of the
+ * file size, used to choose the block size. @crypt must stay valid until
+ * the indexer is freed.
+ */
+typedef struct SeafFileIndexer SeafFileIndexer;
+
+SeafFileIndexer *
+seaf_fs_manager_file_indexer_new (SeafFSManager *mgr,
+                                  gint64 size_hint,
+                                  SeafileCrypt *crypt);
+
+int
+seaf_file_indexer_feed (SeafFileIndexer *indexer,
+                        const char *data,
+                        size_t len);
+
+/* Write the last block and the seafile object. Returns sha1 id for the
+ * seafile object in @sha1 parameter.
+ */
+int
+seaf_file_indexer_finish (SeafFileIndexer *indexer, unsigned char sha1[]);
+
+void
+seaf_file_indexer_free (SeafFileIndexer *indexer);
+
 uint32_t
 seaf_fs_manager_get_type (SeafFSManager *mgr, const char *id);
 
@@ -201,6 +250,17 @@ seaf_fs_manager_get_file_size (SeafFSManager *mgr, const char *file_id);
 gint64
 seaf_fs_manager_get_fs_size (SeafFSManager *mgr, const char *root_id);
 
+/*
+ * Set @delta to the size of the files under @new_root_id minus the size
+ * of the files under @old_root_id, visiting only the parts of the trees
+ * that differ. Returns -1 on error.
+ */
+int
+seaf_fs_manager_get_fs_size_delta (SeafFSManager *mgr,
+                                   const char *old_root_id,
+                                   const char *new_root_id,
+                                   gint64 *delta);
+
 #ifndef SEAFILE_SERVER
 int
 seafile_write_chunk (CDCDescriptor *chunk,
@@ -239,4 +299,18 @@ seaf_fs_manager_get_seafdir_id_by_path (SeafFSManager *mgr,
                                         const char *path,
                                         GError **error);
 
+/*
+ * Get the file ids of @paths in a single walk of the tree of @root_id.
+ * Each path is walked from its longest prefix in the path cache, and the
+ * resolved paths are added to the cache. Returns an array of @n_paths
+ * file ids, an element is NULL if the path doesn't exist or is a dir.
+ * Returns NULL on error.
+ */
+char **
+seaf_fs_manager_get_file_ids_by_paths (SeafFSManager *mgr,
+                                       const char *root_id,
+                                       char **paths,
+                                       int n_paths,
+                                       GError **error);
+
 #endif
@@ -17,6 +17,8 @@
 #include "seafile-config.h"
 
 #ifdef SEAFILE_SERVER
+#include <ccnet/ccnet-object.h>
+#include <json-glib/json-glib.h>
 #include "monitor-rpc-wrappers.h"
 #include "web-accesstoken-mgr.h"
 #endif
@@ -1214,6 +1216,36 @@ seafile_gc_get_progress (GError **error)
 
 #ifdef SEAFILE_SERVER
 
+GList *
+seafile_get_repo_list_after (const char *last_repo_id, int limit,
+                             GError **error)
+{
+    GList *repos, *ret, *ptr;
+
+    if (limit <= 0) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Invalid limit");
+        return NULL;
+    }
+
+    if (last_repo_id && last_repo_id[0] != '\0' && !is_uuid_valid (last_repo_id)) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Invalid repo id");
+        return NULL;
+    }
+
+    repos = seaf_repo_manager_get_repo_list_after (seaf->repo_mgr,
+                                                   last_repo_id, limit,
+                                                   error);
+    if (*error != NULL)
+        return NULL;
+    ret = convert_repo_list (repos);
+
+    for (ptr = repos; ptr != NULL; ptr = ptr->next)
+        seaf_repo_unref ((SeafRepo *)ptr->data);
+    g_list_free (repos);
+
+    return ret;
+}
+
 int
 seafile_edit_repo (const char *repo_id,
                    const char *name,
@@ -1548,6 +1580,21 @@ seafile_get_monitor (GError **error)
     return g_strdup (seaf->monitor_id);
 }
 
+
+GList *
+seafile_get_cache_stats (GError **error)
+{
+    GList *ret = NULL;
+
+    ret = g_list_prepend (ret,
+                          seaf_commit_manager_get_cache_stats (seaf->commit_mgr));
+    ret = g_list_prepend (ret,
+                          seaf_fs_manager_get_cache_stats (seaf->fs_mgr));
+    ret = g_list_prepend (ret,
+                          seaf_fs_manager_get_path_cache_stats (seaf->fs_mgr));
+
+    return g_list_reverse (ret);
+}
 gint64
 seafile_get_user_quota_usage (const char *email, GError **error)
 {
@@ -1586,6 +1633,50 @@ seafile_get_user_share_usage (const char *email, GError **error)
     return ret;
 }
 
+int
+seafile_group_members_changed (int group_id, GError **error)
+{
+    if (group_id < 0) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Invalid group id");
+        return -1;
+    }
+
+    if (seaf_quota_manager_invalidate_group_share_counts (seaf->quota_mgr,
+                                                          group_id) < 0) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL, "Internal server error");
+        return -1;
+    }
+
+    return 0;
+}
+
+GList *
+seafile_get_users_quota_usage (const char *users, GError **error)
+{
+    char **names, **p;
+    GList *user_list = NULL, *ret;
+
+    if (!users) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Bad user id");
+        return NULL;
+    }
+
+    names = g_strsplit (users, "\n", -1);
+    for (p = names; *p != NULL; ++p) {
+        if (**p != '\0')
+            user_list = g_list_prepend (user_list, *p);
+    }
+    user_list = g_list_reverse (user_list);
+
+    ret = seaf_quota_manager_get_users_quota_usage (seaf->quota_mgr, user_list);
+    if (!ret && user_list)
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL, "Internal server error");
+
+    g_list_free (user_list);
+    g_strfreev (names);
+    return ret;
+}
+
 gint64
 seafile_get_org_quota_usage (int org_id, GError **error)
 {
@@ -1811,6 +1902,35 @@ seafile_list_share_repos (const char *email, const char *type,
                                                 start, limit);
 }
 
+GList *
+seafile_list_share_repos_after (const char *email, const char *type,
+                                const char *last_repo_id,
+                                const char *last_user,
+                                int limit, GError **error)
+{
+    if (g_strcmp0 (type, "from_email") != 0 &&
+        g_strcmp0 (type, "to_email") != 0 ) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS,
+                     "Wrong type argument");
+        return NULL;
+    }
+
+    if (limit <= 0) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Invalid limit");
+        return NULL;
+    }
+
+    if (last_repo_id && last_repo_id[0] != '\0' && !is_uuid_valid (last_repo_id)) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Invalid repo id");
+        return NULL;
+    }
+
+    return seaf_share_manager_list_share_repos_after (seaf->share_mgr,
+                                                      email, type,
+                                                      last_repo_id, last_user,
+                                                      limit, error);
+}
+
 GList *
 seafile_list_org_share_repos (int org_id, const char *email, const char *type,
                               int start, int limit, GError **error)
@@ -1844,6 +1964,57 @@ seafile_remove_share (const char *repo_id, const char *from_email,
     return ret;
 }
 
+static char *
+related_users_to_string (GList *users)
+{
+    GString *result = g_string_new ("");
+    GList *ptr;
+
+    for (ptr = users; ptr; ptr = ptr->next) {
+        g_string_append_printf (result, "%s\n", (char *)ptr->data);
+        g_free (ptr->data);
+    }
+    g_list_free (users);
+
+    return g_string_free (result, FALSE);
+}
+
+char *
+seafile_get_related_users_by_repo (const char *repo_id, GError **error)
+{
+    GList *users;
+
+    if (!repo_id || !is_uuid_valid (repo_id)) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Invalid repo id");
+        return NULL;
+    }
+
+    users = seaf_share_manager_get_related_users (seaf->share_mgr, -1, repo_id);
+    if (!users)
+        return NULL;
+
+    return related_users_to_string (users);
+}
+
+char *
+seafile_get_related_users_by_org_repo (int org_id, const char *repo_id,
+                                       GError **error)
+{
+    GList *users;
+
+    if (org_id < 0 || !repo_id || !is_uuid_valid (repo_id)) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Bad args");
+        return NULL;
+    }
+
+    users = seaf_share_manager_get_related_users (seaf->share_mgr, org_id,
+                                                  repo_id);
+    if (!users)
+        return NULL;
+
+    return related_users_to_string (users);
+}
+
 /* Group repo RPC. */
 
 int
@@ -1929,6 +2100,125 @@ seafile_get_shared_groups_by_repo(const char *repo_id, GError **error)
     return g_string_free (result, FALSE);
 }
 
+/* Get the ccnet group objects of @group_ids. Frees @group_ids. */
+static GList *
+get_groups_by_ids (GList *group_ids, GError **error)
+{
+    SearpcClient *client;
+    GObject *group;
+    GList *ret = NULL, *ptr;
+
+    if (!group_ids)
+        return NULL;
+
+    client = ccnet_create_pooled_rpc_client (seaf->client_pool,
+                                             NULL,
+                                             "ccnet-threaded-rpcserver");
+    if (!client) {
+        seaf_warning ("Failed to alloc rpc client.\n");
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL,
+                     "Failed to get groups");
+        g_list_free (group_ids);
+        return NULL;
+    }
+
+    for (ptr = group_ids; ptr; ptr = ptr->next) {
+        group = searpc_client_call__object (client, "get_group",
+                                            CCNET_TYPE_GROUP, NULL,
+                                            1, "int", (int)(long)ptr->data);
+        if (group)
+            ret = g_list_prepend (ret, group);
+    }
+
+    ccnet_rpc_client_free (client);
+    g_list_free (group_ids);
+
+    return g_list_reverse (ret);
+}
+
+GList *
+seafile_list_groups_by_repo (const char *repo_id, GError **error)
+{
+    GList *group_ids;
+
+    if (!repo_id || !is_uuid_valid (repo_id)) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Invalid repo id");
+        return NULL;
+    }
+
+    group_ids = seaf_repo_manager_get_groups_by_repo (seaf->repo_mgr,
+                                                      repo_id, error);
+    return get_groups_by_ids (group_ids, error);
+}
+
+char *
+seafile_get_org_ids_by_groups (const char *group_ids_json, GError **error)
+{
+    JsonParser *parser;
+    JsonNode *root;
+    JsonArray *array;
+    SearpcClient *client;
+    GError *tmp_error = NULL;
+    GString *result;
+    guint i, n;
+    int group_id, org_id;
+
+    if (!group_ids_json) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Bad arguments");
+        return NULL;
+    }
+
+    parser = json_parser_new ();
+    if (!json_parser_load_from_data (parser, group_ids_json, -1, NULL) ||
+        (root = json_parser_get_root (parser)) == NULL ||
+        !JSON_NODE_HOLDS_ARRAY (root)) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS,
+                     "Invalid group id list");
+        g_object_unref (parser);
+        return NULL;
+    }
+    array = json_node_get_array (root);
+    n = json_array_get_length (array);
+
+    /* All groups are looked up through one client, so that a list of
+     * groups costs one rpc from the caller.
+     */
+    client = ccnet_create_pooled_rpc_client (seaf->client_pool,
+                                             NULL,
+                                             "ccnet-threaded-rpcserver");
+    if (!client) {
+        seaf_warning ("Failed to alloc rpc client.\n");
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL,
+                     "Failed to get org ids");
+        g_object_unref (parser);
+        return NULL;
+    }
+
+    result = g_string_new ("[");
+    for (i = 0; i < n; ++i) {
+        group_id = (int)json_array_get_int_element (array, i);
+        org_id = searpc_client_call__int (client, "get_org_id_by_group",
+                                          &tmp_error, 1, "int", group_id);
+        if (tmp_error) {
+            seaf_warning ("Failed to get org id of group %d: %s.\n",
+                          group_id, tmp_error->message);
+            g_propagate_error (error, tmp_error);
+            g_string_free (result, TRUE);
+            result = NULL;
+            break;
+        }
+        g_string_append_printf (result, "%s%d", i > 0 ? "," : "", org_id);
+    }
+
+    ccnet_rpc_client_free (client);
+    g_object_unref (parser);
+
+    if (!result)
+        return NULL;
+    g_string_append_c (result, ']');
+    return g_string_free (result, FALSE);
+}
+
 char *
 seafile_get_group_repoids (int group_id, GError **error)
 {
@@ -1953,6 +2243,17 @@ seafile_get_group_repoids (int group_id, GError **error)
     return g_string_free (result, FALSE);
 }
 
+GList *
+seafile_get_group_repos (int group_id, GError **error)
+{
+    if (group_id < 0) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Bad group id");
+        return NULL;
+    }
+
+    return seaf_repo_manager_get_repos_by_group (seaf->repo_mgr, group_id, error);
+}
+
 GList *
 seafile_get_group_repos_by_owner (char *user, GError **error)
 {
@@ -2237,6 +2538,18 @@ seafile_get_org_group_repo_owner (int org_id, int group_id,
     
 }
 
+GList *
+seafile_get_org_group_repos (int org_id, int group_id, GError **error)
+{
+    if (org_id < 0 || group_id < 0) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Bad args");
+        return NULL;
+    }
+
+    return seaf_repo_manager_get_org_repos_by_group (seaf->repo_mgr,
+                                                     org_id, group_id, error);
+}
+
 GList *
 seafile_get_org_group_repos_by_owner (int org_id, const char *user,
                                       GError **error)
@@ -2295,6 +2608,23 @@ seafile_get_org_groups_by_repo (int org_id, const char *repo_id,
     return g_string_free (result, FALSE);
 }
 
+GList *
+seafile_list_org_groups_by_repo (int org_id, const char *repo_id,
+                                 GError **error)
+{
+    GList *group_ids;
+
+    if (org_id < 0 || !repo_id || !is_uuid_valid (repo_id)) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Bad args");
+        return NULL;
+    }
+
+    group_ids = seaf_repo_manager_get_org_groups_by_repo (seaf->repo_mgr,
+                                                          org_id, repo_id,
+                                                          error);
+    return get_groups_by_ids (group_ids, error);
+}
+
 /* Org inner public repo RPC */
 
 int
@@ -2568,6 +2898,38 @@ seafile_post_multi_files (const char *repo_id,
     return 0;
 }
 
+int
+seafile_post_indexed_files (const char *repo_id,
+                            const char *parent_dir,
+                            const char *filenames_json,
+                            const char *file_ids_json,
+                            const char *user,
+                            GError **error)
+{
+    if (!repo_id || !filenames_json || !parent_dir || !file_ids_json || !user) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS,
+                     "Argument should not be null");
+        return -1;
+    }
+
+    if (!is_uuid_valid (repo_id)) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Invalid repo id");
+        return -1;
+    }
+
+    if (seaf_repo_manager_post_indexed_files (seaf->repo_mgr,
+                                              repo_id,
+                                              parent_dir,
+                                              filenames_json,
+                                              file_ids_json,
+                                              user,
+                                              error) < 0) {
+        return -1;
+    }
+
+    return 0;
+}
+
 char *
 seafile_put_file (const char *repo_id, const char *temp_file_path,
                   const char *parent_dir, const char *file_name,
@@ -2593,6 +2955,31 @@ seafile_put_file (const char *repo_id, const char *temp_file_path,
     return new_file_id;
 }
 
+char *
+seafile_put_indexed_file (const char *repo_id, const char *file_id,
+                          const char *parent_dir, const char *file_name,
+                          const char *user, const char *head_id,
+                          GError **error)
+{
+    if (!repo_id || !file_id || !parent_dir || !file_name || !user) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS,
+                     "Argument should not be null");
+        return NULL;
+    }
+
+    if (!is_uuid_valid (repo_id)) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Invalid repo id");
+        return NULL;
+    }
+
+    char *new_file_id = NULL;
+    seaf_repo_manager_put_indexed_file (seaf->repo_mgr, repo_id,
+                                        file_id, parent_dir,
+                                        file_name, user, head_id,
+                                        &new_file_id, error);
+    return new_file_id;
+}
+
 int
 seafile_post_dir (const char *repo_id, const char *parent_dir,
                   const char *new_dir_name, const char *user,
@@ -3020,6 +3407,73 @@ char *seafile_get_dir_id_by_path (const char *repo_id,
     return get_obj_id_by_path (repo_id, path, TRUE, error);
 }
 
+char *
+seafile_get_file_ids_by_paths (const char *repo_id,
+                               const char *paths,
+                               GError **error)
+{
+    SeafRepo *repo = NULL;
+    SeafCommit *commit = NULL;
+    char **path_list = NULL, **file_ids = NULL;
+    int n_paths, i;
+    GString *buf;
+    char *ret = NULL;
+
+    if (!repo_id || !paths) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS,
+                     "Bad arguments");
+        return NULL;
+    }
+
+    if (!is_uuid_valid (repo_id)) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Invalid repo id");
+        return NULL;
+    }
+
+    repo = seaf_repo_manager_get_repo (seaf->repo_mgr, repo_id);
+    if (!repo) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_INTERNAL,
+                     "Get repo error");
+        goto out;
+    }
+
+    commit = seaf_commit_manager_get_commit (seaf->commit_mgr,
+                                             repo->head->commit_id);
+    if (!commit) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_INTERNAL,
+                     "Get commit error");
+        goto out;
+    }
+
+    path_list = g_strsplit (paths, "\n", -1);
+    n_paths = g_strv_length (path_list);
+    file_ids = seaf_fs_manager_get_file_ids_by_paths (seaf->fs_mgr,
+                                                      commit->root_id,
+                                                      path_list, n_paths,
+                                                      error);
+    if (!file_ids)
+        goto out;
+
+    buf = g_string_new ("");
+    for (i = 0; i < n_paths; ++i) {
+        if (i > 0)
+            g_string_append_c (buf, '\n');
+        if (file_ids[i])
+            g_string_append (buf, file_ids[i]);
+        g_free (file_ids[i]);
+    }
+    g_free (file_ids);
+    ret = g_string_free (buf, FALSE);
+
+out:
+    if (repo)
+        seaf_repo_unref (repo);
+    if (commit)
+        seaf_commit_unref (commit);
+    g_strfreev (path_list);
+    return ret;
+}
+
 GList *
 seafile_list_file_revisions (const char *repo_id,
                              const char *path,
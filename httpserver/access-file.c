@@ -22,6 +22,8 @@
 #include "httpserver.h"
 #include "access-file.h"
 #include "pack-dir.h"
+#include "archive-cache.h"
+#include "block-prefetch.h"
 
 #define CONTENT_TYPE_FILENAME "content-type.txt"
 #define FILE_TYPE_MAP_DEFAULT_LEN 1
@@ -37,10 +39,20 @@ typedef struct SendfileData {
     SeafileCrypt *crypt;
     gboolean enc_init;
     EVP_CIPHER_CTX ctx;
-    BlockHandle *handle;
+    BlockPrefetcher *prefetcher;
+    /* Content of the current block, and bytes of it not sent yet. */
+    char *block;
+    guint32 block_size;
     size_t remain;
     int idx;
 
+    /* For range requests. Bytes to skip at the start of the first block,
+     * and bytes left to send.
+     */
+    gboolean ranged;
+    guint64 range_skip;
+    guint64 range_remain;
+
     bufferevent_data_cb saved_read_cb;
     bufferevent_data_cb saved_write_cb;
     bufferevent_event_cb saved_event_cb;
@@ -49,10 +61,9 @@ typedef struct SendfileData {
 
 typedef struct SendDirData {
     evhtp_request_t *req;
-    size_t remain;
-
-    int zipfd;
-    char *zipfile;
+    PackDir *pack;
+    struct evbuffer *buf;
+    SeafileCrypt *crypt;
 
     bufferevent_data_cb saved_read_cb;
     bufferevent_data_cb saved_write_cb;
@@ -60,6 +71,21 @@ typedef struct SendDirData {
     void *saved_cb_arg;
 } SendDirData;
 
+typedef struct SendArchiveData {
+    evhtp_request_t *req;
+    CachedArchive *archive;
+    int fd;
+    gint64 offset;
+    /* The archive is still being built and its size is unknown. */
+    gboolean chunked;
+    /* Polls for more data while the archive is being built. */
+    struct event *timer;
+
+    bufferevent_data_cb saved_read_cb;
+    bufferevent_data_cb saved_write_cb;
+    bufferevent_event_cb saved_event_cb;
+    void *saved_cb_arg;
+} SendArchiveData;
 
 
 extern SeafileSession *seaf;
@@ -77,10 +103,8 @@ static struct file_type_map ftmap[] = {
 static void
 free_sendfile_data (SendfileData *data)
 {
-    if (data->handle) {
-        seaf_block_manager_close_block(seaf->block_mgr, data->handle);
-        seaf_block_manager_block_handle_free(seaf->block_mgr, data->handle);
-    }
+    block_prefetcher_free (data->prefetcher);
+    g_free (data->block);
 
     if (data->enc_init)
         EVP_CIPHER_CTX_cleanup (&data->ctx);
@@ -93,40 +117,69 @@ free_sendfile_data (SendfileData *data)
 static void
 free_senddir_data (SendDirData *data)
 {
-    close (data->zipfd);
-    g_unlink (data->zipfile);
-    
-    g_free (data->zipfile);
+    pack_dir_free (data->pack);
+    evbuffer_free (data->buf);
+    g_free (data->crypt);
     g_free (data);
 }
 
+static void
+free_sendarchive_data (SendArchiveData *data)
+{
+    if (data->timer)
+        event_free (data->timer);
+    if (data->fd >= 0)
+        close (data->fd);
+    cached_archive_unref (data->archive);
+    g_free (data);
+}
+
+static void
+finish_sendfile (struct bufferevent *bev, SendfileData *data)
+{
+    /* Recover evhtp's callbacks */
+    bev->readcb = data->saved_read_cb;
+    bev->writecb = data->saved_write_cb;
+    bev->errorcb = data->saved_event_cb;
+    bev->cbarg = data->saved_cb_arg;
+
+    /* Resume reading incomming requests. */
+    evhtp_request_resume (data->req);
+
+    evhtp_send_reply_end (data->req);
+
+    free_sendfile_data (data);
+}
+
+/* Block data is written to the connection in pieces of this size. */
+#define SEND_PIECE_SIZE (64 * 1024)
+
 static void
 write_data_cb (struct bufferevent *bev, void *ctx)
 {
     SendfileData *data = ctx;
     char *blk_id;
-    BlockHandle *handle;
-    char buf[1024 * 64];
+    char *buf;
+    char *p;
     int n;
 
+    if (data->ranged && data->range_remain == 0) {
+        finish_sendfile (bev, data);
+        return;
+    }
+
 next:
     blk_id = data->file->blk_sha1s[data->idx];
 
-    if (!data->handle) {
-        data->handle = seaf_block_manager_open_block(seaf->block_mgr,
-                                                     blk_id, BLOCK_READ);
-        if (!data->handle) {
-            seaf_warning ("Failed to open block %s\n", blk_id);
+    if (!data->block) {
+        /* The following blocks are read ahead by the prefetcher. */
+        data->block = block_prefetcher_next (data->prefetcher,
+                                             &data->block_size);
+        if (!data->block) {
+            seaf_warning ("Failed to read block %s\n", blk_id);
             goto err;
         }
-
-        BlockMetadata *bmd;
-        bmd = seaf_block_manager_stat_block_by_handle (seaf->block_mgr,
-                                                       data->handle);
-        if (!bmd)
-            goto err;
-        data->remain = bmd->size;
-        g_free (bmd);
+        data->remain = data->block_size;
 
         if (data->crypt) {
             if (seafile_decrypt_init (&data->ctx,
@@ -139,36 +192,20 @@ next:
             data->enc_init = TRUE;
         }
     }
-    handle = data->handle;
-
-    n = seaf_block_manager_read_block(seaf->block_mgr, handle, buf, sizeof(buf));
+    buf = data->block + (data->block_size - data->remain);
+    n = MIN (data->remain, SEND_PIECE_SIZE);
     data->remain -= n;
-    if (n < 0) {
-        seaf_warning ("Error when reading from block %s.\n", blk_id);
-        goto err;
-    } else if (n == 0) {
-        /* We've read up the data of this block, finish or try next block. */
-        seaf_block_manager_close_block (seaf->block_mgr, handle);
-        seaf_block_manager_block_handle_free (seaf->block_mgr, handle);
-        data->handle = NULL;
+    if (n == 0) {
+        /* We've sent the data of this block, finish or try next block. */
+        g_free (data->block);
+        data->block = NULL;
         if (data->crypt != NULL) {
             EVP_CIPHER_CTX_cleanup (&data->ctx);
             data->enc_init = FALSE;
         }
 
         if (data->idx == data->file->n_blocks - 1) {
-            /* Recover evhtp's callbacks */
-            bev->readcb = data->saved_read_cb;
-            bev->writecb = data->saved_write_cb;
-            bev->errorcb = data->saved_event_cb;
-            bev->cbarg = data->saved_cb_arg;
-
-            /* Resume reading incomming requests. */
-            evhtp_request_resume (data->req);
-
-            evhtp_send_reply_end (data->req);
-
-            free_sendfile_data (data);
+            finish_sendfile (bev, data);
             return;
         }
 
@@ -226,7 +263,22 @@ next:
         evbuffer_free (tmp_buf);
         g_free (dec_out);
     } else {
-        bufferevent_write (bev, buf, n);
+        p = buf;
+        if (data->range_skip > 0) {
+            if (data->range_skip >= n) {
+                data->range_skip -= n;
+                goto next;
+            }
+            p += data->range_skip;
+            n -= data->range_skip;
+            data->range_skip = 0;
+        }
+        if (data->ranged) {
+            if (n > data->range_remain)
+                n = data->range_remain;
+            data->range_remain -= n;
+        }
+        bufferevent_write (bev, p, n);
     }
 
     return;
@@ -237,38 +289,132 @@ err:
     return;
 }
 
+/* The zip archive is generated as the client reads it. Each time the
+ * output buffer is drained, this much more of the archive is produced.
+ */
+#define DIR_DATA_CHUNK_SIZE (256 * 1024)
+
 static void
 write_dir_data_cb (struct bufferevent *bev, void *ctx)
 {
     SendDirData *data = ctx;
-    char buf[64 * 1024];
-    int n;
+    int ret;
 
-    n = readn (data->zipfd, buf, sizeof(buf));
-    if (n < 0) {
-        seaf_warning ("failed to read zipfile %s\n", data->zipfile);
+    ret = pack_dir_continue (data->pack, DIR_DATA_CHUNK_SIZE);
+    if (ret < 0) {
+        seaf_warning ("failed to pack dir.\n");
         evhtp_connection_free (evhtp_request_get_connection (data->req));
         free_senddir_data (data);
-    } else if (n > 0) {
-        bufferevent_write (bev, buf, n);
-        data->remain -= n;
+        return;
+    }
 
-        if (data->remain == 0) {
-            /* Recover evhtp's callbacks */
-            bev->readcb = data->saved_read_cb;
-            bev->writecb = data->saved_write_cb;
-            bev->errorcb = data->saved_event_cb;
-            bev->cbarg = data->saved_cb_arg;
+    evhtp_send_reply_chunk (data->req, data->buf);
+
+    if (ret == 0) {
+        /* Recover evhtp's callbacks */
+        bev->readcb = data->saved_read_cb;
+        bev->writecb = data->saved_write_cb;
+        bev->errorcb = data->saved_event_cb;
+        bev->cbarg = data->saved_cb_arg;
+
+        /* Resume reading incomming requests. */
+        evhtp_request_resume (data->req);
+
+        evhtp_send_reply_chunk_end (data->req);
+
+        free_senddir_data (data);
+    }
+}
+
+/* How often to check for more data of an archive being built. */
+#define ARCHIVE_POLL_INTERVAL_MS 100
+
+static void
+write_archive_data_cb (struct bufferevent *bev, void *ctx)
+{
+    SendArchiveData *data = ctx;
+    char buf[1024 * 64];
+    gint64 avail;
+    gboolean complete, failed;
+    struct timeval tv;
+    int n;
+
+    avail = cached_archive_get_state (data->archive, &complete, &failed);
+    if (failed) {
+        seaf_warning ("failed to pack dir.\n");
+        goto err;
+    }
+
+    if (complete && data->offset == avail) {
+        /* Recover evhtp's callbacks */
+        bev->readcb = data->saved_read_cb;
+        bev->writecb = data->saved_write_cb;
+        bev->errorcb = data->saved_event_cb;
+        bev->cbarg = data->saved_cb_arg;
 
-            /* Resume reading incomming requests. */
-            evhtp_request_resume (data->req);
+        /* Resume reading incomming requests. */
+        evhtp_request_resume (data->req);
 
+        if (data->chunked)
+            evhtp_send_reply_chunk_end (data->req);
+        else
             evhtp_send_reply_end (data->req);
 
-            free_senddir_data (data);
-            return;
-        }
+        free_sendarchive_data (data);
+        return;
+    }
+
+    if (data->offset == avail) {
+        /* Wait for the build to produce more data. */
+        tv.tv_sec = 0;
+        tv.tv_usec = ARCHIVE_POLL_INTERVAL_MS * 1000;
+        evtimer_add (data->timer, &tv);
+        return;
     }
+
+    n = read (data->fd, buf, MIN (sizeof(buf), avail - data->offset));
+    if (n <= 0) {
+        seaf_warning ("failed to read cached archive: %s.\n", strerror(errno));
+        goto err;
+    }
+    data->offset += n;
+
+    /* This may call write_archive_data_cb() recursively, so don't use
+     * "data" variable after here.
+     */
+    if (data->chunked) {
+        struct evbuffer *tmp_buf = evbuffer_new ();
+        evbuffer_add (tmp_buf, buf, n);
+        evhtp_send_reply_chunk (data->req, tmp_buf);
+        evbuffer_free (tmp_buf);
+    } else {
+        bufferevent_write (bev, buf, n);
+    }
+
+    return;
+
+err:
+    evhtp_connection_free (evhtp_request_get_connection (data->req));
+    free_sendarchive_data (data);
+}
+
+static void
+archive_timer_cb (evutil_socket_t fd, short events, void *ctx)
+{
+    SendArchiveData *data = ctx;
+
+    write_archive_data_cb (evhtp_request_get_bev (data->req), data);
+}
+
+static void
+my_archive_event_cb (struct bufferevent *bev, short events, void *ctx)
+{
+    SendArchiveData *data = ctx;
+
+    data->saved_event_cb (bev, events, data->saved_cb_arg);
+
+    /* Free aux data. */
+    free_sendarchive_data (data);
 }
 
 static void
@@ -347,6 +493,105 @@ test_firefox (evhtp_request_t *req)
     }
 }
 
+/*
+ * Parse a Range header with a single byte range. Returns -1 if the header
+ * should be ignored, 0 if the range is satisfiable and 1 if it's not.
+ * @start and @end are inclusive.
+ */
+static int
+parse_range_header (const char *value, guint64 file_size,
+                    guint64 *start, guint64 *end)
+{
+    char *dash, *endptr;
+    guint64 first, last;
+
+    if (strncmp (value, "bytes=", 6) != 0)
+        return -1;
+    value += 6;
+
+    /* Multiple ranges are not supported, send the whole file. */
+    if (strchr (value, ',') != NULL)
+        return -1;
+
+    dash = strchr (value, '-');
+    if (!dash)
+        return -1;
+
+    if (dash == value) {
+        /* Suffix range "-N": the last N bytes. */
+        last = g_ascii_strtoull (dash + 1, &endptr, 10);
+        if (endptr == dash + 1 || *endptr != '\0')
+            return -1;
+        if (last == 0)
+            return 1;
+        *start = last >= file_size ? 0 : file_size - last;
+        *end = file_size - 1;
+        return 0;
+    }
+
+    first = g_ascii_strtoull (value, &endptr, 10);
+    if (endptr != dash)
+        return -1;
+
+    if (*(dash + 1) == '\0') {
+        last = file_size - 1;
+    } else {
+        last = g_ascii_strtoull (dash + 1, &endptr, 10);
+        if (*endptr != '\0' || last < first)
+            return -1;
+        if (last >= file_size)
+            last = file_size - 1;
+    }
+
+    if (first >= file_size)
+        return 1;
+
+    *start = first;
+    *end = last;
+    return 0;
+}
+
+static gboolean
+etag_matches (const char *header, const char *etag)
+{
+    return (strcmp (header, "*") == 0 || strstr (header, etag) != NULL);
+}
+
+/*
+ * Find the blocks containing the first and the last byte of a range.
+ * Only the block sizes are read. Sets @block_offset to the offset of
+ * @start in @start_block.
+ */
+static int
+find_range_blocks (Seafile *file, guint64 start, guint64 end,
+                   int *start_block, guint64 *block_offset, int *end_block)
+{
+    BlockMetadata *bmd;
+    guint64 offset = 0;
+    int i;
+
+    *start_block = -1;
+    for (i = 0; i < file->n_blocks; ++i) {
+        bmd = seaf_block_manager_stat_block (seaf->block_mgr,
+                                             file->blk_sha1s[i]);
+        if (!bmd)
+            return -1;
+        if (*start_block < 0 && start < offset + bmd->size) {
+            *start_block = i;
+            *block_offset = start - offset;
+        }
+        if (end < offset + bmd->size) {
+            g_free (bmd);
+            *end_block = i;
+            return 0;
+        }
+        offset += bmd->size;
+        g_free (bmd);
+    }
+
+    return -1;
+}
+
 static int
 do_file(evhtp_request_t *req, SeafRepo *repo, const char *file_id,
         const char *filename, const char *operation,
@@ -361,11 +606,63 @@ do_file(evhtp_request_t *req, SeafRepo *repo, const char *file_id,
     unsigned char enc_key[16], enc_iv[16];
     SeafileCrypt *crypt = NULL;
     SendfileData *data;
+    char etag[64];
+    const char *header;
+    char content_range[255];
+    guint64 range_start = 0, range_end = 0, block_offset = 0;
+    int start_block = 0, end_block;
+    int range_ret = -1;
+
+    /* File ids are content hashes, so the id is a strong validator and
+     * a matching request can be answered without reading the file.
+     */
+    snprintf (etag, sizeof(etag), "\"%s\"", file_id);
+    evhtp_headers_add_header (req->headers_out,
+                              evhtp_header_new("ETag", etag, 1, 1));
+
+    header = evhtp_kv_find (req->headers_in, "If-None-Match");
+    if (header && etag_matches (header, etag)) {
+        evhtp_send_reply (req, EVHTP_RES_NOTMOD);
+        return 0;
+    }
 
     file = seaf_fs_manager_get_seafile(seaf->fs_mgr, file_id);
     if (file == NULL)
         return -1;
 
+    /* Encrypted blocks have to be decrypted from their start, and their
+     * plain text sizes are unknown, so ranges are only served for
+     * unencrypted repos.
+     */
+    header = evhtp_kv_find (req->headers_in, "Range");
+    if (header && crypt_key == NULL && file->file_size > 0) {
+        const char *if_range = evhtp_kv_find (req->headers_in, "If-Range");
+
+        if (!if_range || strcmp (if_range, etag) == 0)
+            range_ret = parse_range_header (header, file->file_size,
+                                            &range_start, &range_end);
+    }
+
+    if (range_ret == 1) {
+        snprintf (content_range, sizeof(content_range),
+                  "bytes */%"G_GINT64_FORMAT"", file->file_size);
+        evhtp_headers_add_header (req->headers_out,
+                                  evhtp_header_new("Content-Range",
+                                                   content_range, 1, 1));
+        evhtp_send_reply (req, EVHTP_RES_RANGENOTSC);
+        seafile_unref (file);
+        return 0;
+    }
+
+    end_block = file->n_blocks - 1;
+    if (range_ret == 0) {
+        if (find_range_blocks (file, range_start, range_end, &start_block,
+                               &block_offset, &end_block) < 0) {
+            seafile_unref (file);
+            return -1;
+        }
+    }
+
     if (crypt_key != NULL) {
         g_object_get (crypt_key,
                       "key", &key_hex,
@@ -397,7 +694,25 @@ do_file(evhtp_request_t *req, SeafRepo *repo, const char *file_id,
         g_free (content_type);
     }
 
-    snprintf(file_size, sizeof(file_size), "%"G_GINT64_FORMAT"", file->file_size);
+    if (crypt == NULL)
+        evhtp_headers_add_header (req->headers_out,
+                                  evhtp_header_new("Accept-Ranges", "bytes",
+                                                   1, 1));
+
+    if (range_ret == 0) {
+        snprintf (content_range, sizeof(content_range),
+                  "bytes %"G_GUINT64_FORMAT"-%"G_GUINT64_FORMAT
+                  "/%"G_GINT64_FORMAT"",
+                  range_start, range_end, file->file_size);
+        evhtp_headers_add_header (req->headers_out,
+                                  evhtp_header_new("Content-Range",
+                                                   content_range, 1, 1));
+        snprintf(file_size, sizeof(file_size), "%"G_GUINT64_FORMAT"",
+                 range_end - range_start + 1);
+    } else {
+        snprintf(file_size, sizeof(file_size), "%"G_GINT64_FORMAT"",
+                 file->file_size);
+    }
     evhtp_headers_add_header (req->headers_out,
                               evhtp_header_new("Content-Length", file_size, 1, 1));
 
@@ -433,6 +748,14 @@ do_file(evhtp_request_t *req, SeafRepo *repo, const char *file_id,
     data->req = req;
     data->file = file;
     data->crypt = crypt;
+    if (range_ret == 0) {
+        data->ranged = TRUE;
+        data->idx = start_block;
+        data->range_skip = block_offset;
+        data->range_remain = range_end - range_start + 1;
+    }
+    /* Don't read ahead past the end of the range. */
+    data->prefetcher = block_prefetcher_new (file, data->idx, end_block);
 
     /* We need to overwrite evhtp's callback functions to
      * write file data piece by piece.
@@ -457,7 +780,100 @@ do_file(evhtp_request_t *req, SeafRepo *repo, const char *file_id,
         evbuffer_defer_callbacks (bev->output, bev->ev_base);
 
     /* Kick start data transfer by sending out http headers. */
-    evhtp_send_reply_start(req, EVHTP_RES_OK);
+    if (range_ret == 0)
+        evhtp_send_reply_start(req, EVHTP_RES_PARTIAL);
+    else
+        evhtp_send_reply_start(req, EVHTP_RES_OK);
+
+    return 0;
+}
+
+static void
+add_dir_headers (evhtp_request_t *req, const char *filename)
+{
+    char cont_filename[SEAF_PATH_MAX];
+
+    evhtp_headers_add_header(req->headers_out,
+                evhtp_header_new("Content-Type", "application/zip", 1, 1));
+
+    if (test_firefox (req)) {
+        snprintf(cont_filename, SEAF_PATH_MAX,
+                 "attachment;filename*=\"utf8\' \'%s.zip\"", filename);
+    } else {
+        snprintf(cont_filename, SEAF_PATH_MAX,
+                 "attachment;filename=\"%s.zip\"", filename);
+    }
+
+    evhtp_headers_add_header(req->headers_out,
+            evhtp_header_new("Content-Disposition", cont_filename, 1, 1));
+}
+
+/* Serve the archive of a dir from the archive cache. If the archive is
+ * being built, it's sent while it grows.
+ */
+static int
+do_cached_dir (evhtp_request_t *req, const char *dir_id,
+               const char *dirname, const char *filename)
+{
+    CachedArchive *archive;
+    SendArchiveData *data;
+    gint64 size;
+    gboolean complete, failed;
+    char content_len[32];
+    int fd;
+
+    archive = archive_cache_get (seaf->archive_cache, dir_id, dirname,
+                                 test_windows(req));
+    fd = cached_archive_open (archive);
+    if (fd < 0) {
+        cached_archive_unref (archive);
+        return -1;
+    }
+
+    add_dir_headers (req, filename);
+
+    data = g_new0 (SendArchiveData, 1);
+    data->req = req;
+    data->archive = archive;
+    data->fd = fd;
+
+    size = cached_archive_get_state (archive, &complete, &failed);
+    if (complete) {
+        snprintf (content_len, sizeof(content_len), "%"G_GINT64_FORMAT, size);
+        evhtp_headers_add_header (req->headers_out,
+                evhtp_header_new("Content-Length", content_len, 1, 1));
+    } else {
+        data->chunked = TRUE;
+    }
+
+    /* We need to overwrite evhtp's callback functions to
+     * write file data piece by piece.
+     */
+    struct bufferevent *bev = evhtp_request_get_bev (req);
+    data->timer = evtimer_new (bev->ev_base, archive_timer_cb, data);
+    data->saved_read_cb = bev->readcb;
+    data->saved_write_cb = bev->writecb;
+    data->saved_event_cb = bev->errorcb;
+    data->saved_cb_arg = bev->cbarg;
+    bufferevent_setcb (bev,
+                       NULL,
+                       write_archive_data_cb,
+                       my_archive_event_cb,
+                       data);
+    /* Block any new request from this connection before finish
+     * handling this request.
+     */
+    evhtp_request_pause (req);
+
+    /* Avoid recursive call of write_archive_data_cb(). */
+    if (req->htp->ssl_cfg != NULL)
+        evbuffer_defer_callbacks (bev->output, bev->ev_base);
+
+    /* Kick start data transfer by sending out http headers. */
+    if (data->chunked)
+        evhtp_send_reply_chunk_start(req, EVHTP_RES_OK);
+    else
+        evhtp_send_reply_start(req, EVHTP_RES_OK);
 
     return 0;
 }
@@ -467,15 +883,12 @@ do_dir (evhtp_request_t *req, SeafRepo *repo, const char *dir_id,
         const char *filename, const char *operation,
         SeafileCryptKey *crypt_key)
 {
-    char *zipfile = NULL;
     char *filename_escaped = NULL;
-    char cont_filename[SEAF_PATH_MAX];
-    char file_size[255];
-    SeafStat st;
     char *key_hex, *iv_hex;
     unsigned char enc_key[16], enc_iv[16];
     SeafileCrypt *crypt = NULL;
-    int zipfd = 0;
+    struct evbuffer *buf = NULL;
+    PackDir *pack = NULL;
     int ret = 0;
     gint64 dir_size = 0;
 
@@ -487,7 +900,6 @@ do_dir (evhtp_request_t *req, SeafRepo *repo, const char *dir_id,
         goto out;
     }
 
-    /* Let's zip the directory first */
     filename_escaped = g_uri_unescape_string (filename, NULL);
     if (!filename_escaped) {
         seaf_warning ("failed to unescape string %s\n", filename);
@@ -495,6 +907,15 @@ do_dir (evhtp_request_t *req, SeafRepo *repo, const char *dir_id,
         goto out;
     }
 
+    /* Archives of encrypted repos are not cached, to avoid keeping
+     * decrypted data on disk.
+     */
+    if (crypt_key == NULL && seaf->archive_cache != NULL &&
+        dir_size <= archive_cache_get_capacity (seaf->archive_cache)) {
+        if (do_cached_dir (req, dir_id, filename_escaped, filename) == 0)
+            goto out;
+    }
+
     if (crypt_key != NULL) {
         g_object_get (crypt_key,
                       "key", &key_hex,
@@ -507,49 +928,25 @@ do_dir (evhtp_request_t *req, SeafRepo *repo, const char *dir_id,
         g_free (iv_hex);
     }
 
-    zipfile = pack_dir (filename_escaped, dir_id, crypt, test_windows(req));
-    if (!zipfile) {
-        ret = -1;
-        goto out;
-    }
-    
-    /* OK, the dir is zipped */
-    evhtp_headers_add_header(req->headers_out,
-                evhtp_header_new("Content-Type", "application/zip", 1, 1));
-    
-    if (seaf_stat(zipfile, &st) < 0) {
+    /* The zip archive is streamed to the client while it's generated, so
+     * its size is unknown and the reply is chunked.
+     */
+    buf = evbuffer_new ();
+    pack = pack_dir_new (filename_escaped, dir_id, crypt,
+                         test_windows(req), buf);
+    if (!pack) {
         ret = -1;
         goto out;
     }
 
-    snprintf (file_size, sizeof(file_size), "%"G_GUINT64_FORMAT"", st.st_size);
-    evhtp_headers_add_header (req->headers_out,
-            evhtp_header_new("Content-Length", file_size, 1, 1));
-
-    if (test_firefox (req)) {
-        snprintf(cont_filename, SEAF_PATH_MAX,
-                 "attachment;filename*=\"utf8\' \'%s.zip\"", filename);
-    } else {
-        snprintf(cont_filename, SEAF_PATH_MAX,
-                 "attachment;filename=\"%s.zip\"", filename);
-    }
-
-    evhtp_headers_add_header(req->headers_out,
-            evhtp_header_new("Content-Disposition", cont_filename, 1, 1));
-
-    zipfd = g_open (zipfile, O_RDONLY | O_BINARY, 0);
-    if (zipfd < 0) {
-        seaf_warning ("failed to open zipfile %s\n", zipfile);
-        ret = -1;
-        goto out;
-    }
+    add_dir_headers (req, filename);
 
     SendDirData *data;
     data = g_new0 (SendDirData, 1);
     data->req = req;
-    data->zipfd = zipfd;
-    data->zipfile = zipfile;
-    data->remain = st.st_size;
+    data->pack = pack;
+    data->buf = buf;
+    data->crypt = crypt;
 
     /* We need to overwrite evhtp's callback functions to
      * write file data piece by piece.
@@ -574,19 +971,16 @@ do_dir (evhtp_request_t *req, SeafRepo *repo, const char *dir_id,
         evbuffer_defer_callbacks (bev->output, bev->ev_base);
 
     /* Kick start data transfer by sending out http headers. */
-    evhtp_send_reply_start(req, EVHTP_RES_OK);
+    evhtp_send_reply_chunk_start(req, EVHTP_RES_OK);
 
 out:
     g_free (filename_escaped);
     if (ret < 0) {
-        if (zipfile != NULL) {
-            g_unlink (zipfile);
-            g_free (zipfile);
-        }
-
-        if (zipfd > 0) {
-            close (zipfd);
-        }
+        if (pack)
+            pack_dir_free (pack);
+        if (buf)
+            evbuffer_free (buf);
+        g_free (crypt);
     }
 
     return ret;
@@ -610,6 +1004,8 @@ access_cb(evhtp_request_t *req, void *arg)
     SeafileCryptKey *key = NULL;
     SeafileWebAccess *webaccess = NULL;
 
+    httpserver_count_request (req);
+
     /* Skip the first '/'. */
     char **parts = g_strsplit (req->uri->path->full + 1, "/", 0);
     if (!parts || g_strv_length (parts) < 3 ||
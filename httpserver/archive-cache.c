@@ -0,0 +1,513 @@
+#include "common.h"
+
+#define DEBUG_FLAG SEAFILE_DEBUG_HTTP
+#include "log.h"
+
+#include <event.h>
+#include <pthread.h>
+#include <fcntl.h>
+#include <glib/gstdio.h>
+
+#include "seafile-object.h"
+#include "seafile-crypt.h"
+
+#include "utils.h"
+
+#include "seafile-session.h"
+#include "httpserver.h"
+#include "pack-dir.h"
+#include "archive-cache.h"
+
+#define BUILD_CHUNK_SIZE (256 * 1024)
+
+struct CachedArchive {
+    ArchiveCache *cache;
+    int ref;
+
+    char *key;
+    char *path;
+    char *tmp_path;
+
+    char *dir_id;
+    char *dirname;
+    gboolean is_windows;
+
+    /* The tmp file being written by the build. */
+    int fd;
+
+    /* Protected by the cache lock. */
+    gint64 size;
+    gboolean complete;
+    gboolean failed;
+    gboolean cancelled;
+    int n_readers;
+    GList *lru_link;
+};
+
+struct ArchiveCache {
+    char *cache_dir;
+    gint64 capacity;
+
+    pthread_mutex_t lock;
+    /* Key -> archive, complete or being built. */
+    GHashTable *archives;
+    /* Complete archives, most recently used first. */
+    GQueue *lru;
+    /* Total size of the complete archives and the archives being built. */
+    gint64 total_size;
+    /* Size of the archives being built. */
+    gint64 building_size;
+    /* Used to give each build its own tmp file. */
+    guint build_seq;
+
+    GThreadPool *build_pool;
+};
+
+static CachedArchive *
+cached_archive_new (ArchiveCache *cache, const char *key)
+{
+    CachedArchive *archive = g_new0 (CachedArchive, 1);
+    char *filename;
+
+    archive->cache = cache;
+    archive->ref = 1;
+    archive->key = g_strdup (key);
+    archive->fd = -1;
+
+    filename = g_strconcat (key, ".zip", NULL);
+    archive->path = g_build_filename (cache->cache_dir, filename, NULL);
+    g_free (filename);
+
+    return archive;
+}
+
+static void
+cached_archive_free (CachedArchive *archive)
+{
+    g_free (archive->key);
+    g_free (archive->path);
+    g_free (archive->tmp_path);
+    g_free (archive->dir_id);
+    g_free (archive->dirname);
+    g_free (archive);
+}
+
+static void
+archive_unref (CachedArchive *archive)
+{
+    if (g_atomic_int_dec_and_test (&archive->ref))
+        cached_archive_free (archive);
+}
+
+/* Called with the cache lock held. The build stops at its next chunk,
+ * or doesn't start if it's still queued.
+ */
+static void
+cancel_build (ArchiveCache *cache, CachedArchive *archive)
+{
+    archive->cancelled = TRUE;
+    g_hash_table_remove (cache->archives, archive->key);
+    archive_unref (archive);
+}
+
+void
+cached_archive_unref (CachedArchive *archive)
+{
+    ArchiveCache *cache;
+
+    if (!archive)
+        return;
+
+    cache = archive->cache;
+
+    pthread_mutex_lock (&cache->lock);
+    if (--archive->n_readers == 0 &&
+        !archive->complete && !archive->failed && !archive->cancelled)
+        /* Nobody is waiting for the archive. */
+        cancel_build (cache, archive);
+    pthread_mutex_unlock (&cache->lock);
+
+    archive_unref (archive);
+}
+
+/* Called with the cache lock held. */
+static void
+evict_archives (ArchiveCache *cache)
+{
+    CachedArchive *archive;
+
+    while (cache->total_size > cache->capacity &&
+           (archive = g_queue_pop_tail (cache->lru)) != NULL) {
+        archive->lru_link = NULL;
+        cache->total_size -= archive->size;
+        g_hash_table_remove (cache->archives, archive->key);
+
+        /* Readers of this archive keep their open files. */
+        g_unlink (archive->path);
+        archive_unref (archive);
+    }
+}
+
+/* Called with the cache lock held. The size of the archive is already
+ * counted in the total size while it's built.
+ */
+static void
+add_complete_archive (ArchiveCache *cache, CachedArchive *archive)
+{
+    archive->complete = TRUE;
+    g_queue_push_head (cache->lru, archive);
+    archive->lru_link = cache->lru->head;
+
+    evict_archives (cache);
+}
+
+static int
+write_archive_data (int fd, struct evbuffer *buf, gint64 *written)
+{
+    int n;
+
+    *written = 0;
+    while (evbuffer_get_length (buf) > 0) {
+        n = evbuffer_write (buf, fd);
+        if (n < 0)
+            return -1;
+        *written += n;
+    }
+
+    return 0;
+}
+
+static gboolean
+build_cancelled (ArchiveCache *cache, CachedArchive *archive)
+{
+    gboolean cancelled;
+
+    pthread_mutex_lock (&cache->lock);
+    cancelled = archive->cancelled;
+    pthread_mutex_unlock (&cache->lock);
+
+    return cancelled;
+}
+
+static void
+build_archive (gpointer vdata, gpointer user_data)
+{
+    CachedArchive *archive = vdata;
+    ArchiveCache *cache = archive->cache;
+    struct evbuffer *buf = NULL;
+    PackDir *pack = NULL;
+    gint64 written;
+    int ret = 1;
+
+    if (build_cancelled (cache, archive)) {
+        ret = -1;
+        goto out;
+    }
+
+    buf = evbuffer_new ();
+    pack = pack_dir_new (archive->dirname, archive->dir_id, NULL,
+                         archive->is_windows, buf);
+    if (!pack) {
+        ret = -1;
+        goto out;
+    }
+
+    while (ret > 0) {
+        if (build_cancelled (cache, archive)) {
+            ret = -1;
+            break;
+        }
+
+        ret = pack_dir_continue (pack, BUILD_CHUNK_SIZE);
+        if (ret < 0)
+            break;
+
+        if (write_archive_data (archive->fd, buf, &written) < 0) {
+            seaf_warning ("Failed to write %s: %s.\n",
+                          archive->tmp_path, strerror(errno));
+            ret = -1;
+            break;
+        }
+
+        pthread_mutex_lock (&cache->lock);
+        archive->size += written;
+        cache->building_size += written;
+        cache->total_size += written;
+        evict_archives (cache);
+        pthread_mutex_unlock (&cache->lock);
+    }
+
+out:
+    if (pack)
+        pack_dir_free (pack);
+    if (buf)
+        evbuffer_free (buf);
+    close (archive->fd);
+    archive->fd = -1;
+
+    pthread_mutex_lock (&cache->lock);
+    cache->building_size -= archive->size;
+    if (ret == 0 && !archive->cancelled &&
+        g_rename (archive->tmp_path, archive->path) == 0) {
+        add_complete_archive (cache, archive);
+    } else {
+        archive->failed = TRUE;
+        cache->total_size -= archive->size;
+        g_unlink (archive->tmp_path);
+        /* Cancelled builds are already removed from the table. */
+        if (!archive->cancelled) {
+            g_hash_table_remove (cache->archives, archive->key);
+            archive_unref (archive);
+        }
+    }
+    pthread_mutex_unlock (&cache->lock);
+
+    /* Release the reference of the build. */
+    archive_unref (archive);
+}
+
+static char *
+archive_key (const char *dir_id, const char *dirname, gboolean is_windows)
+{
+    char *s, *key;
+
+    s = g_strdup_printf ("%s\n%d\n%s", dir_id, is_windows ? 1 : 0, dirname);
+    key = g_compute_checksum_for_string (G_CHECKSUM_SHA1, s, -1);
+    g_free (s);
+
+    return key;
+}
+
+CachedArchive *
+archive_cache_get (ArchiveCache *cache,
+                   const char *dir_id,
+                   const char *dirname,
+                   gboolean is_windows)
+{
+    CachedArchive *archive;
+    GError *error = NULL;
+    char *key;
+
+    /* File names are only converted when an encoding is configured. */
+    is_windows = is_windows && seaf->windows_encoding != NULL;
+    key = archive_key (dir_id, dirname, is_windows);
+
+    pthread_mutex_lock (&cache->lock);
+
+    archive = g_hash_table_lookup (cache->archives, key);
+    if (archive) {
+        g_atomic_int_inc (&archive->ref);
+        ++archive->n_readers;
+        if (archive->lru_link) {
+            g_queue_unlink (cache->lru, archive->lru_link);
+            g_queue_push_head_link (cache->lru, archive->lru_link);
+        }
+        pthread_mutex_unlock (&cache->lock);
+        g_free (key);
+        return archive;
+    }
+
+    archive = cached_archive_new (cache, key);
+    archive->dir_id = g_strdup (dir_id);
+    archive->dirname = g_strdup (dirname);
+    archive->is_windows = is_windows;
+    archive->n_readers = 1;
+    archive->tmp_path = g_strdup_printf ("%s.%u.tmp", archive->path,
+                                         ++cache->build_seq);
+
+    /* Don't start more builds when the archives being built already
+     * take the whole capacity. The caller then packs the dir without
+     * the cache.
+     */
+    if (cache->building_size >= cache->capacity) {
+        archive->failed = TRUE;
+        goto out;
+    }
+
+    /* Create the tmp file now, so that it can be opened by readers
+     * while the build is queued.
+     */
+    archive->fd = g_open (archive->tmp_path,
+                          O_WRONLY | O_CREAT | O_TRUNC | O_BINARY, 0666);
+    if (archive->fd < 0) {
+        seaf_warning ("Failed to open %s: %s.\n",
+                      archive->tmp_path, strerror(errno));
+        archive->failed = TRUE;
+        goto out;
+    }
+
+    /* One reference for the table, one for the build and one for
+     * the caller.
+     */
+    archive->ref = 3;
+    g_hash_table_insert (cache->archives, archive->key, archive);
+
+    /* If no new thread can be started, the build stays queued until
+     * a running one finishes.
+     */
+    g_thread_pool_push (cache->build_pool, archive, &error);
+    if (error) {
+        seaf_warning ("Failed to start archive build thread: %s.\n",
+                      error->message);
+        g_clear_error (&error);
+    }
+
+out:
+    pthread_mutex_unlock (&cache->lock);
+    g_free (key);
+
+    return archive;
+}
+
+int
+cached_archive_open (CachedArchive *archive)
+{
+    ArchiveCache *cache = archive->cache;
+    int fd;
+
+    /* Hold the lock so that the file is not renamed or removed while
+     * it's opened.
+     */
+    pthread_mutex_lock (&cache->lock);
+    if (archive->failed)
+        fd = -1;
+    else if (archive->complete)
+        fd = g_open (archive->path, O_RDONLY | O_BINARY, 0);
+    else
+        fd = g_open (archive->tmp_path, O_RDONLY | O_BINARY, 0);
+    pthread_mutex_unlock (&cache->lock);
+
+    return fd;
+}
+
+gint64
+cached_archive_get_state (CachedArchive *archive,
+                          gboolean *complete,
+                          gboolean *failed)
+{
+    ArchiveCache *cache = archive->cache;
+    gint64 size;
+
+    pthread_mutex_lock (&cache->lock);
+    size = archive->size;
+    *complete = archive->complete;
+    *failed = archive->failed;
+    pthread_mutex_unlock (&cache->lock);
+
+    return size;
+}
+
+static gint
+compare_archives_by_mtime (gconstpointer a, gconstpointer b, gpointer mtimes)
+{
+    gint64 ta = *(gint64 *)g_hash_table_lookup (mtimes, a);
+    gint64 tb = *(gint64 *)g_hash_table_lookup (mtimes, b);
+
+    /* Most recent first. */
+    return (ta < tb) - (ta > tb);
+}
+
+/*
+ * Load the archives left by previous runs. Archives that were being built
+ * are removed.
+ */
+static void
+load_cached_archives (ArchiveCache *cache)
+{
+    GDir *dir;
+    const char *name;
+    char *path, *key;
+    SeafStat st;
+    GHashTable *mtimes;
+    GList *archives = NULL, *ptr;
+    CachedArchive *archive;
+    gint64 *mtime;
+
+    dir = g_dir_open (cache->cache_dir, 0, NULL);
+    if (!dir)
+        return;
+
+    mtimes = g_hash_table_new_full (g_direct_hash, g_direct_equal,
+                                    NULL, g_free);
+
+    while ((name = g_dir_read_name (dir)) != NULL) {
+        path = g_build_filename (cache->cache_dir, name, NULL);
+
+        if (!g_str_has_suffix (name, ".zip") || seaf_stat (path, &st) < 0) {
+            g_unlink (path);
+            g_free (path);
+            continue;
+        }
+        g_free (path);
+
+        key = g_strndup (name, strlen(name) - strlen(".zip"));
+        archive = cached_archive_new (cache, key);
+        archive->size = (gint64)st.st_size;
+        g_free (key);
+
+        mtime = g_new (gint64, 1);
+        *mtime = (gint64)st.st_mtime;
+        g_hash_table_insert (mtimes, archive, mtime);
+        archives = g_list_prepend (archives, archive);
+    }
+    g_dir_close (dir);
+
+    archives = g_list_sort_with_data (archives, compare_archives_by_mtime,
+                                      mtimes);
+    for (ptr = archives; ptr; ptr = ptr->next) {
+        archive = ptr->data;
+        archive->complete = TRUE;
+        g_queue_push_tail (cache->lru, archive);
+        archive->lru_link = cache->lru->tail;
+        cache->total_size += archive->size;
+        g_hash_table_insert (cache->archives, archive->key, archive);
+    }
+
+    g_list_free (archives);
+    g_hash_table_destroy (mtimes);
+
+    evict_archives (cache);
+}
+
+ArchiveCache *
+archive_cache_new (const char *cache_dir, gint64 capacity, int max_builds)
+{
+    ArchiveCache *cache;
+    GError *error = NULL;
+
+    if (checkdir_with_mkdir (cache_dir) < 0) {
+        seaf_warning ("Failed to create archive cache dir %s.\n", cache_dir);
+        return NULL;
+    }
+
+    cache = g_new0 (ArchiveCache, 1);
+    cache->cache_dir = g_strdup (cache_dir);
+    cache->capacity = capacity;
+    pthread_mutex_init (&cache->lock, NULL);
+    cache->archives = g_hash_table_new (g_str_hash, g_str_equal);
+    cache->lru = g_queue_new ();
+
+    cache->build_pool = g_thread_pool_new (build_archive, NULL,
+                                           max_builds, FALSE, &error);
+    if (!cache->build_pool) {
+        seaf_warning ("Failed to create archive build thread pool: %s.\n",
+                      error->message);
+        g_clear_error (&error);
+        pthread_mutex_destroy (&cache->lock);
+        g_hash_table_destroy (cache->archives);
+        g_queue_free (cache->lru);
+        g_free (cache->cache_dir);
+        g_free (cache);
+        return NULL;
+    }
+
+    load_cached_archives (cache);
+
+    return cache;
+}
+
+gint64
+archive_cache_get_capacity (ArchiveCache *cache)
+{
+    return cache->capacity;
+}
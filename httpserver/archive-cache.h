@@ -0,0 +1,51 @@
+#ifndef ARCHIVE_CACHE_H
+#define ARCHIVE_CACHE_H
+
+/*
+ * On-disk cache of zip archives of directories.
+ *
+ * A dir id determines the content of the dir, so the archive of a dir is
+ * identified by the dir id, the name of its top dir and whether file
+ * names are converted for Windows. Archives are built by a pool of at
+ * most @max_builds threads, and can be read while they are being built.
+ * A build is cancelled when all its readers are gone. Archives being
+ * built count against the capacity: complete archives are evicted in
+ * LRU order when the total size exceeds it, and no new build is started
+ * while the archives being built take the whole capacity.
+ */
+
+typedef struct ArchiveCache ArchiveCache;
+typedef struct CachedArchive CachedArchive;
+
+ArchiveCache *
+archive_cache_new (const char *cache_dir, gint64 capacity, int max_builds);
+
+gint64
+archive_cache_get_capacity (ArchiveCache *cache);
+
+/* Get the archive of a dir, starting to build it if it's not cached.
+ * Concurrent requests for the same archive share one build.
+ * The returned archive should be released with cached_archive_unref().
+ * If no build can be started, the returned archive is failed and
+ * cached_archive_open() returns -1.
+ */
+CachedArchive *
+archive_cache_get (ArchiveCache *cache,
+                   const char *dir_id,
+                   const char *dirname,
+                   gboolean is_windows);
+
+/* Open the archive for reading. The data may still be growing. */
+int
+cached_archive_open (CachedArchive *archive);
+
+/* Returns the number of bytes available for reading. */
+gint64
+cached_archive_get_state (CachedArchive *archive,
+                          gboolean *complete,
+                          gboolean *failed);
+
+void
+cached_archive_unref (CachedArchive *archive);
+
+#endif
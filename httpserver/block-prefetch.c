@@ -0,0 +1,330 @@
+#include "common.h"
+
+#define DEBUG_FLAG SEAFILE_DEBUG_HTTP
+#include "log.h"
+
+#include <pthread.h>
+
+#include "utils.h"
+
+#include "seafile-session.h"
+#include "httpserver.h"
+#include "block-prefetch.h"
+
+enum {
+    /* Queued in the thread pool. */
+    BLOCK_PENDING,
+    BLOCK_READING,
+    BLOCK_READY,
+    BLOCK_FAILED,
+};
+
+typedef struct BlockSlot {
+    /* Referenced by the prefetcher and by the read task.
+     * Protected by the prefetcher lock.
+     */
+    int ref;
+    char block_id[41];
+    int state;
+    char *data;
+    guint32 size;
+    /* Bytes counted against the budget of the request. */
+    gint64 reserved;
+} BlockSlot;
+
+struct BlockPrefetcher {
+    int ref;
+
+    pthread_mutex_t lock;
+    pthread_cond_t cond;
+
+    Seafile *file;
+    /* Index of the next block to be read. */
+    int next_idx;
+    /* Index of the last block to be read. */
+    int end_idx;
+    /* Blocks being read or read, in file order. */
+    GQueue *slots;
+    gint64 reserved;
+    /* Estimated size of a block that's not read yet. */
+    gint64 block_size_hint;
+    gboolean freed;
+};
+
+typedef struct ReadTask {
+    BlockPrefetcher *pf;
+    BlockSlot *slot;
+} ReadTask;
+
+static GThreadPool *read_tpool;
+static int prefetch_max_blocks;
+static gint64 prefetch_max_bytes;
+
+static int
+read_block (const char *block_id, char **data, guint32 *size)
+{
+    BlockHandle *handle;
+    BlockMetadata *bmd;
+    char *buf = NULL;
+    guint32 len;
+    int n;
+
+    handle = seaf_block_manager_open_block (seaf->block_mgr,
+                                            block_id, BLOCK_READ);
+    if (!handle) {
+        seaf_warning ("Failed to open block %s\n", block_id);
+        return -1;
+    }
+
+    bmd = seaf_block_manager_stat_block_by_handle (seaf->block_mgr, handle);
+    if (!bmd)
+        goto err;
+    len = bmd->size;
+    g_free (bmd);
+
+    buf = g_new (char, len > 0 ? len : 1);
+    *size = 0;
+    while (*size < len) {
+        n = seaf_block_manager_read_block (seaf->block_mgr, handle,
+                                           buf + *size, len - *size);
+        if (n <= 0) {
+            seaf_warning ("Error when reading from block %s.\n", block_id);
+            goto err;
+        }
+        *size += n;
+    }
+
+    seaf_block_manager_close_block (seaf->block_mgr, handle);
+    seaf_block_manager_block_handle_free (seaf->block_mgr, handle);
+
+    *data = buf;
+    return 0;
+
+err:
+    g_free (buf);
+    seaf_block_manager_close_block (seaf->block_mgr, handle);
+    seaf_block_manager_block_handle_free (seaf->block_mgr, handle);
+    return -1;
+}
+
+/* Called with the lock held. */
+static void
+block_slot_unref (BlockSlot *slot)
+{
+    if (--(slot->ref) > 0)
+        return;
+
+    g_free (slot->data);
+    g_free (slot);
+}
+
+/* Read the block of a slot in state BLOCK_READING.
+ * Called with the lock held, which is released during the read.
+ */
+static void
+read_slot (BlockPrefetcher *pf, BlockSlot *slot)
+{
+    char *data = NULL;
+    guint32 size = 0;
+    int ret;
+
+    pthread_mutex_unlock (&pf->lock);
+    ret = read_block (slot->block_id, &data, &size);
+    pthread_mutex_lock (&pf->lock);
+
+    if (ret < 0) {
+        slot->state = BLOCK_FAILED;
+    } else {
+        slot->state = BLOCK_READY;
+        slot->data = data;
+        slot->size = size;
+        if (!pf->freed) {
+            pf->reserved += (gint64)size - slot->reserved;
+            slot->reserved = size;
+        }
+    }
+    pthread_cond_broadcast (&pf->cond);
+}
+
+static void
+block_prefetcher_unref (BlockPrefetcher *pf)
+{
+    if (!g_atomic_int_dec_and_test (&pf->ref))
+        return;
+
+    pthread_mutex_destroy (&pf->lock);
+    pthread_cond_destroy (&pf->cond);
+    seafile_unref (pf->file);
+    g_queue_free (pf->slots);
+    g_free (pf);
+}
+
+static void
+reader_thread (gpointer vdata, gpointer unused)
+{
+    ReadTask *task = vdata;
+    BlockPrefetcher *pf = task->pf;
+    BlockSlot *slot = task->slot;
+
+    pthread_mutex_lock (&pf->lock);
+    /* Skip the block if the request is gone, or if the writer needed it
+     * before we got to it and has read it itself.
+     */
+    if (!pf->freed && slot->state == BLOCK_PENDING) {
+        slot->state = BLOCK_READING;
+        read_slot (pf, slot);
+    }
+    block_slot_unref (slot);
+    pthread_mutex_unlock (&pf->lock);
+
+    block_prefetcher_unref (pf);
+    g_free (task);
+}
+
+int
+block_prefetch_init (int n_threads, int max_blocks, gint64 max_bytes)
+{
+    GError *error = NULL;
+
+    prefetch_max_blocks = max_blocks;
+    prefetch_max_bytes = max_bytes;
+
+    if (max_blocks <= 0)
+        return 0;
+
+    read_tpool = g_thread_pool_new (reader_thread, NULL,
+                                    n_threads, FALSE, &error);
+    if (!read_tpool) {
+        seaf_warning ("Failed to create block prefetch thread pool: %s.\n",
+                      error->message);
+        g_clear_error (&error);
+        return -1;
+    }
+
+    return 0;
+}
+
+/* Start reading the next blocks, as far as the limits allow.
+ * Called with the lock held.
+ */
+static void
+schedule_reads (BlockPrefetcher *pf)
+{
+    Seafile *file = pf->file;
+    BlockSlot *slot;
+    ReadTask *task;
+
+    while (pf->next_idx <= pf->end_idx &&
+           (int)g_queue_get_length (pf->slots) < prefetch_max_blocks) {
+        /* Always read the block that's needed next. */
+        if (!g_queue_is_empty (pf->slots) &&
+            pf->reserved + pf->block_size_hint > prefetch_max_bytes)
+            break;
+
+        slot = g_new0 (BlockSlot, 1);
+        /* One reference for the queue, one for the read task. */
+        slot->ref = 2;
+        g_strlcpy (slot->block_id, file->blk_sha1s[pf->next_idx],
+                   sizeof(slot->block_id));
+        slot->state = BLOCK_PENDING;
+        slot->reserved = pf->block_size_hint;
+        pf->reserved += slot->reserved;
+        g_queue_push_tail (pf->slots, slot);
+        ++(pf->next_idx);
+
+        task = g_new0 (ReadTask, 1);
+        g_atomic_int_inc (&pf->ref);
+        task->pf = pf;
+        task->slot = slot;
+        g_thread_pool_push (read_tpool, task, NULL);
+    }
+}
+
+BlockPrefetcher *
+block_prefetcher_new (Seafile *file, int start_block, int end_block)
+{
+    BlockPrefetcher *pf = g_new0 (BlockPrefetcher, 1);
+
+    pf->ref = 1;
+    pthread_mutex_init (&pf->lock, NULL);
+    pthread_cond_init (&pf->cond, NULL);
+    seafile_ref (file);
+    pf->file = file;
+    pf->next_idx = start_block;
+    pf->end_idx = end_block;
+    pf->slots = g_queue_new ();
+    if (file->n_blocks > 0)
+        pf->block_size_hint = (gint64)file->file_size / file->n_blocks;
+
+    return pf;
+}
+
+char *
+block_prefetcher_next (BlockPrefetcher *pf, guint32 *size)
+{
+    BlockSlot *slot;
+    char *data = NULL;
+
+    if (pf->next_idx > pf->end_idx && g_queue_is_empty (pf->slots))
+        return NULL;
+
+    /* Read-ahead is disabled. */
+    if (!read_tpool) {
+        if (read_block (pf->file->blk_sha1s[pf->next_idx], &data, size) < 0)
+            return NULL;
+        ++(pf->next_idx);
+        return data;
+    }
+
+    pthread_mutex_lock (&pf->lock);
+
+    schedule_reads (pf);
+
+    slot = g_queue_peek_head (pf->slots);
+    /* Don't wait for the block behind the reads queued by other requests,
+     * read it now. If a reader has started reading it, wait for that read
+     * only.
+     */
+    if (slot->state == BLOCK_PENDING) {
+        slot->state = BLOCK_READING;
+        read_slot (pf, slot);
+    }
+    while (slot->state == BLOCK_READING)
+        pthread_cond_wait (&pf->cond, &pf->lock);
+
+    g_queue_pop_head (pf->slots);
+    pf->reserved -= slot->reserved;
+
+    if (slot->state == BLOCK_READY) {
+        data = slot->data;
+        *size = slot->size;
+        slot->data = NULL;
+    }
+    block_slot_unref (slot);
+
+    /* Replace the consumed block in the read-ahead window. */
+    if (data)
+        schedule_reads (pf);
+
+    pthread_mutex_unlock (&pf->lock);
+
+    return data;
+}
+
+void
+block_prefetcher_free (BlockPrefetcher *pf)
+{
+    BlockSlot *slot;
+
+    if (!pf)
+        return;
+
+    pthread_mutex_lock (&pf->lock);
+    pf->freed = TRUE;
+    /* Slots still referenced by read tasks are freed by the readers. */
+    while ((slot = g_queue_pop_head (pf->slots)) != NULL)
+        block_slot_unref (slot);
+    pthread_mutex_unlock (&pf->lock);
+
+    block_prefetcher_unref (pf);
+}
@@ -0,0 +1,39 @@
+#ifndef BLOCK_PREFETCH_H
+#define BLOCK_PREFETCH_H
+
+/*
+ * Read-ahead of the blocks of a file being downloaded.
+ *
+ * Blocks are read by a shared pool of threads, ahead of the request that
+ * sends them. Each request reads ahead at most a number of blocks, and at
+ * most a number of bytes.
+ */
+
+typedef struct BlockPrefetcher BlockPrefetcher;
+
+/*
+ * @n_threads: number of reader threads.
+ * @max_blocks: max number of blocks read ahead for a request,
+ *              0 disables read-ahead.
+ * @max_bytes: max size of the blocks read ahead for a request.
+ */
+int
+block_prefetch_init (int n_threads, int max_blocks, gint64 max_bytes);
+
+/* Read the blocks of @file in order, from @start_block to @end_block. */
+BlockPrefetcher *
+block_prefetcher_new (Seafile *file, int start_block, int end_block);
+
+/*
+ * Get the content of the next block. If its read has not started yet, it's
+ * read in the calling thread; if it's being read, wait for that read.
+ * The returned data should be freed with g_free().
+ * Returns NULL on error.
+ */
+char *
+block_prefetcher_next (BlockPrefetcher *pf, guint32 *size);
+
+void
+block_prefetcher_free (BlockPrefetcher *pf);
+
+#endif
@@ -4,6 +4,7 @@
 #include "log.h"
 
 #include <getopt.h>
+#include <pthread.h>
 
 #include <event.h>
 #include <evhtp.h>
@@ -14,19 +15,29 @@
 #include "httpserver.h"
 #include "access-file.h"
 #include "upload-file.h"
+#include "archive-cache.h"
+#include "block-prefetch.h"
 
 #include "utils.h"
 
 #define DEFAULT_BIND_PORT  8082
 #define DEFAULT_MAX_UPLOAD_SIZE 100 * ((gint64)1 << 20) /* 100MB */
 #define DEFAULT_MAX_DOWNLOAD_DIR_SIZE 100 * ((gint64)1 << 20) /* 100MB */
+#define DEFAULT_ARCHIVE_CACHE_SIZE 1024 * ((gint64)1 << 20) /* 1GB */
+#define DEFAULT_ARCHIVE_BUILD_THREADS 2
+#define DEFAULT_WORKER_THREADS 10
+#define DEFAULT_STATS_INTERVAL 300 /* seconds */
+#define DEFAULT_PREFETCH_BLOCKS 4
+#define DEFAULT_PREFETCH_MEMORY 16 * ((gint64)1 << 20) /* 16MB */
 
 static char *config_dir = NULL;
 static char *seafile_dir = NULL;
 static char *bind_addr = "0.0.0.0";
 static gboolean use_https = FALSE;
 static uint16_t bind_port = 0;
-static int num_threads = 10;
+/* -1 means not set on the command line. */
+static int num_threads = -1;
+static int stats_interval = DEFAULT_STATS_INTERVAL;
 static char *pemfile = NULL;
 static char *privkey = NULL;
 
@@ -57,9 +68,104 @@ static void usage ()
              "usage: httpserver [-c config_dir] [-d seafile_dir] \n");
 }
 
+/*
+ * Per-thread request counters. Requests are handled by a pool of worker
+ * threads, each running its own event loop. Every worker has its own
+ * counters, attached to its evthr. The counters are logged periodically
+ * by the main thread.
+ */
+typedef struct ThreadStats {
+    int index;
+    pthread_mutex_t lock;
+    gint64 n_requests;
+    gint64 last_n_requests;     /* only used by the main thread */
+} ThreadStats;
+
+static ThreadStats **thread_stats;
+static int n_thread_stats;
+static pthread_mutex_t thread_stats_lock = PTHREAD_MUTEX_INITIALIZER;
+
+/* Requests handled in the main thread, when there are no workers. */
+static ThreadStats main_thread_stats = {
+    -1, PTHREAD_MUTEX_INITIALIZER, 0, 0
+};
+
+static void
+init_worker_thread (evhtp_t *htp, evthr_t *thr, void *arg)
+{
+    ThreadStats *stats = g_new0 (ThreadStats, 1);
+
+    pthread_mutex_init (&stats->lock, NULL);
+
+    pthread_mutex_lock (&thread_stats_lock);
+    stats->index = n_thread_stats;
+    thread_stats[n_thread_stats++] = stats;
+    pthread_mutex_unlock (&thread_stats_lock);
+
+    evthr_set_aux (thr, stats);
+}
+
+void
+httpserver_count_request (evhtp_request_t *req)
+{
+    evhtp_connection_t *conn = evhtp_request_get_connection (req);
+    ThreadStats *stats = NULL;
+
+    if (conn && conn->thread)
+        stats = evthr_get_aux (conn->thread);
+    if (!stats)
+        stats = &main_thread_stats;
+
+    pthread_mutex_lock (&stats->lock);
+    ++(stats->n_requests);
+    pthread_mutex_unlock (&stats->lock);
+}
+
+static void
+log_thread_stats (ThreadStats *stats)
+{
+    gint64 n_requests;
+
+    pthread_mutex_lock (&stats->lock);
+    n_requests = stats->n_requests;
+    pthread_mutex_unlock (&stats->lock);
+
+    if (stats->index < 0)
+        seaf_message ("main thread: %"G_GINT64_FORMAT" requests, "
+                      "%"G_GINT64_FORMAT" in the last %d seconds.\n",
+                      n_requests, n_requests - stats->last_n_requests,
+                      stats_interval);
+    else
+        seaf_message ("worker thread %d: %"G_GINT64_FORMAT" requests, "
+                      "%"G_GINT64_FORMAT" in the last %d seconds.\n",
+                      stats->index, n_requests,
+                      n_requests - stats->last_n_requests,
+                      stats_interval);
+
+    stats->last_n_requests = n_requests;
+}
+
+static void
+log_stats_cb (evutil_socket_t fd, short events, void *arg)
+{
+    int i;
+
+    if (num_threads <= 0) {
+        log_thread_stats (&main_thread_stats);
+        return;
+    }
+
+    pthread_mutex_lock (&thread_stats_lock);
+    for (i = 0; i < n_thread_stats; ++i)
+        log_thread_stats (thread_stats[i]);
+    pthread_mutex_unlock (&thread_stats_lock);
+}
+
 static void
 default_cb(evhtp_request_t *req, void *arg)
 {
+    httpserver_count_request (req);
+
     /* Return empty page. */
     evhtp_send_reply (req, EVHTP_RES_OK);
 }
@@ -114,6 +220,15 @@ load_httpserver_config (SeafileSession *session)
     int port = 0;
     int max_upload_size_mb;
     int max_download_dir_size_mb;
+    int worker_threads;
+    int interval;
+    int archive_cache_size_mb;
+    gint64 archive_cache_size;
+    char *archive_cache_dir;
+    int archive_build_threads;
+    int prefetch_blocks;
+    int prefetch_memory_mb;
+    gint64 prefetch_memory;
 
     port = g_key_file_get_integer (session->config, "httpserver", "port", &error);
     if (!error) {
@@ -190,6 +305,102 @@ load_httpserver_config (SeafileSession *session)
         else
             session->max_download_dir_size = max_download_dir_size_mb * ((gint64)1 << 20);
     }
+
+    /* The command line option takes precedence. */
+    if (num_threads < 0) {
+        worker_threads = g_key_file_get_integer (session->config,
+                                                 "httpserver",
+                                                 "worker_threads",
+                                                 &error);
+        if (error) {
+            num_threads = DEFAULT_WORKER_THREADS;
+            g_clear_error (&error);
+        } else if (worker_threads < 0) {
+            num_threads = DEFAULT_WORKER_THREADS;
+        } else {
+            num_threads = worker_threads;
+        }
+    }
+
+    /* Interval to log per-thread request counters. 0 disables logging. */
+    interval = g_key_file_get_integer (session->config,
+                                       "httpserver", "stats_interval",
+                                       &error);
+    if (error) {
+        stats_interval = DEFAULT_STATS_INTERVAL;
+        g_clear_error (&error);
+    } else if (interval < 0) {
+        stats_interval = DEFAULT_STATS_INTERVAL;
+    } else {
+        stats_interval = interval;
+    }
+
+    /* Archives of downloaded dirs are cached on disk. 0 disables the cache. */
+    archive_cache_size_mb = g_key_file_get_integer (session->config,
+                                                    "httpserver",
+                                                    "archive_cache_size",
+                                                    &error);
+    if (error) {
+        archive_cache_size = DEFAULT_ARCHIVE_CACHE_SIZE;
+        g_clear_error (&error);
+    } else if (archive_cache_size_mb < 0) {
+        archive_cache_size = DEFAULT_ARCHIVE_CACHE_SIZE;
+    } else {
+        archive_cache_size = archive_cache_size_mb * ((gint64)1 << 20);
+    }
+
+    /* Max number of archives built at the same time. */
+    archive_build_threads = g_key_file_get_integer (session->config,
+                                                    "httpserver",
+                                                    "archive_build_threads",
+                                                    &error);
+    if (error) {
+        archive_build_threads = DEFAULT_ARCHIVE_BUILD_THREADS;
+        g_clear_error (&error);
+    } else if (archive_build_threads <= 0) {
+        archive_build_threads = DEFAULT_ARCHIVE_BUILD_THREADS;
+    }
+
+    if (archive_cache_size > 0) {
+        archive_cache_dir = g_build_filename (session->http_temp_dir,
+                                              "archive-cache", NULL);
+        session->archive_cache = archive_cache_new (archive_cache_dir,
+                                                    archive_cache_size,
+                                                    archive_build_threads);
+        g_free (archive_cache_dir);
+    }
+
+    /* Blocks of downloaded files are read ahead. 0 disables read-ahead. */
+    prefetch_blocks = g_key_file_get_integer (session->config,
+                                              "httpserver", "prefetch_blocks",
+                                              &error);
+    if (error) {
+        prefetch_blocks = DEFAULT_PREFETCH_BLOCKS;
+        g_clear_error (&error);
+    } else if (prefetch_blocks < 0) {
+        prefetch_blocks = DEFAULT_PREFETCH_BLOCKS;
+    }
+
+    /* Memory used to read ahead for a download, in MB. */
+    prefetch_memory_mb = g_key_file_get_integer (session->config,
+                                                 "httpserver",
+                                                 "prefetch_memory",
+                                                 &error);
+    if (error) {
+        prefetch_memory = DEFAULT_PREFETCH_MEMORY;
+        g_clear_error (&error);
+    } else if (prefetch_memory_mb <= 0) {
+        prefetch_memory = DEFAULT_PREFETCH_MEMORY;
+    } else {
+        prefetch_memory = prefetch_memory_mb * ((gint64)1 << 20);
+    }
+
+    /* Use as many reader threads as worker threads, so that each worker
+     * can have a block being read.
+     */
+    if (block_prefetch_init (MAX (num_threads, 1),
+                             prefetch_blocks, prefetch_memory) < 0)
+        exit (1);
 }
 
 #ifdef WIN32
@@ -223,6 +434,7 @@ main(int argc, char *argv[])
 {
     evbase_t *evbase = NULL;
     evhtp_t *htp = NULL;
+    struct event *stats_timer = NULL;
     int daemon_mode = 1;
     int c;
     char *logfile = NULL;
@@ -360,7 +572,18 @@ main(int argc, char *argv[])
 
     evhtp_set_gencb(htp, default_cb, NULL);
 
-    evhtp_use_threads(htp, NULL, num_threads, NULL);
+    /* With 0 worker threads, requests are handled in the main event loop. */
+    if (num_threads > 0) {
+        thread_stats = g_new0 (ThreadStats *, num_threads);
+        evhtp_use_threads(htp, init_worker_thread, num_threads, NULL);
+    }
+    seaf_message ("worker threads = %d\n", num_threads);
+
+    if (stats_interval > 0) {
+        struct timeval tv = { stats_interval, 0 };
+        stats_timer = event_new (evbase, -1, EV_PERSIST, log_stats_cb, NULL);
+        event_add (stats_timer, &tv);
+    }
 
     if (evhtp_bind_socket(htp, bind_addr, bind_port, 128) < 0) {
         g_warning ("Could not bind socket: %s\n", strerror(errno));
@@ -1,6 +1,12 @@
 #ifndef HTTPSERVER_H
 #define HTTPSERVER_H
 
+#include <evhtp.h>
+
 extern SeafileSession *seaf;
 
+/* Count a request in the counters of the thread that handles it. */
+void
+httpserver_count_request (evhtp_request_t *req);
+
 #endif /* HTTPSERVER_H */
@@ -3,6 +3,7 @@
 #define DEBUG_FLAG SEAFILE_DEBUG_HTTP
 #include "log.h"
 
+#include <event.h>
 #include <ccnet.h>
 
 #include "seafile-object.h"
@@ -13,6 +14,7 @@
 
 #include "seafile-session.h"
 #include "httpserver.h"
+#include "pack-dir.h"
 
 #include <archive.h>
 #include <archive_entry.h>
@@ -24,14 +26,34 @@
 #endif
 
 
-typedef struct {
+struct PackDir {
     struct archive *a;
+    struct evbuffer *out;
     SeafileCrypt *crypt;
-    const char *top_dir_name;
+    char *top_dir_name;
     gboolean is_windows;
     time_t mtime;
 
-} PackDirData;
+    /* PackDirFrame of the dirs being added, innermost first. */
+    GList *stack;
+
+    /* The file being added. */
+    Seafile *file;
+    int idx;
+    BlockHandle *handle;
+    uint32_t remain;
+    EVP_CIPHER_CTX ctx;
+    gboolean enc_init;
+
+    gboolean finished;
+};
+
+typedef struct PackDirFrame {
+    SeafDir *dir;
+    /* Next entry to add. */
+    GList *next;
+    char *dirpath;
+} PackDirFrame;
 
 static char *
 do_iconv (char *fromcode, char *tocode, char *in)
@@ -62,34 +84,41 @@ do_iconv (char *fromcode, char *tocode, char *in)
     return g_strndup(out, outlen);
 }
 
+static ssize_t
+archive_write_cb (struct archive *a, void *client_data,
+                  const void *buffer, size_t length)
+{
+    PackDir *pd = client_data;
+
+    if (evbuffer_add (pd->out, buffer, length) < 0)
+        return -1;
+    return length;
+}
+
+static void
+close_current_block (PackDir *pd)
+{
+    if (pd->handle) {
+        seaf_block_manager_close_block (seaf->block_mgr, pd->handle);
+        seaf_block_manager_block_handle_free (seaf->block_mgr, pd->handle);
+        pd->handle = NULL;
+    }
+    if (pd->enc_init) {
+        EVP_CIPHER_CTX_cleanup (&pd->ctx);
+        pd->enc_init = FALSE;
+    }
+}
+
 static int
-add_file_to_archive (PackDirData *data,
-                     const char *parent_dir,
-                     SeafDirent *dent)
+start_file (PackDir *pd, const char *parent_dir, SeafDirent *dent)
 {
-    struct archive *a = data->a;
-    struct SeafileCrypt *crypt = data->crypt;
-    gboolean is_windows = data->is_windows;
-    const char *top_dir_name = data->top_dir_name;
-    
     struct archive_entry *entry = NULL;
     Seafile *file = NULL;
     char *pathname = NULL;
-    char buf[64 * 1024];
-    int len = 0;
-    int n = 0;
-    int idx = 0;
-    BlockHandle *handle = NULL;
-    BlockMetadata *bmd = NULL;
-    char *blk_id = NULL;
-    uint32_t remain = 0;
-    EVP_CIPHER_CTX ctx;
-    gboolean enc_init = FALSE;
-    char *dec_out = NULL;
-    int dec_out_len = -1;
+    int n;
     int ret = 0;
 
-    pathname = g_build_filename (top_dir_name, parent_dir, dent->name, NULL);
+    pathname = g_build_filename (pd->top_dir_name, parent_dir, dent->name, NULL);
 
     file = seaf_fs_manager_get_seafile (seaf->fs_mgr, dent->id);
     if (!file) {
@@ -100,7 +129,7 @@ add_file_to_archive (PackDirData *data,
     entry = archive_entry_new ();
 
     /* File name fixup for WinRAR */
-    if (is_windows && seaf->windows_encoding) {
+    if (pd->is_windows && seaf->windows_encoding) {
         char *win_file_name = do_iconv ("UTF-8", seaf->windows_encoding, pathname);
         if (!win_file_name) {
             seaf_warning ("Failed to convert file name to %s\n", seaf->windows_encoding);
@@ -117,245 +146,315 @@ add_file_to_archive (PackDirData *data,
     /* FIXME: 0644 should be set when upload files in repo-mgr.c */
     archive_entry_set_mode (entry, dent->mode | 0644);
     archive_entry_set_size (entry, file->file_size);
-    archive_entry_set_mtime (entry, data->mtime, 0);
+    archive_entry_set_mtime (entry, pd->mtime, 0);
 
-    n = archive_write_header (a, entry);
+    n = archive_write_header (pd->a, entry);
     if (n != ARCHIVE_OK) {
-        seaf_warning ("archive_write_header  error: %s\n", archive_error_string(a));
+        seaf_warning ("archive_write_header  error: %s\n", archive_error_string(pd->a));
         ret = -1;
         goto out;
     }
 
-    /* Read data of this entry block by block */
-    while (idx < file->n_blocks) {
-        blk_id = file->blk_sha1s[idx];
-        handle = seaf_block_manager_open_block (seaf->block_mgr,
-                                                blk_id, BLOCK_READ);
-        if (!handle) {
+    pd->file = file;
+    pd->idx = 0;
+    file = NULL;
+
+out:
+    g_free (pathname);
+    if (entry)
+        archive_entry_free (entry);
+    if (file)
+        seafile_unref (file);
+
+    return ret;
+}
+
+static int
+write_archive_data (PackDir *pd, const char *buf, int n)
+{
+    int len = archive_write_data (pd->a, buf, n);
+    if (len <= 0) {
+        seaf_warning ("archive_write_data returned %d\n", len);
+        return -1;
+    }
+    return 0;
+}
+
+/*
+ * Add the next piece of the current file to the archive.
+ */
+static int
+write_file_data (PackDir *pd)
+{
+    SeafileCrypt *crypt = pd->crypt;
+    char buf[64 * 1024];
+    char *blk_id;
+    BlockMetadata *bmd;
+    char *dec_out = NULL;
+    int dec_out_len = -1;
+    int n, r;
+    int ret = 0;
+
+    if (pd->idx >= pd->file->n_blocks) {
+        /* This file is finished. */
+        seafile_unref (pd->file);
+        pd->file = NULL;
+        return 0;
+    }
+
+    blk_id = pd->file->blk_sha1s[pd->idx];
+
+    if (!pd->handle) {
+        pd->handle = seaf_block_manager_open_block (seaf->block_mgr,
+                                                    blk_id, BLOCK_READ);
+        if (!pd->handle) {
             seaf_warning ("Failed to open block %s\n", blk_id);
-            ret = -1;
-            goto out;
+            return -1;
         }
 
         bmd = seaf_block_manager_stat_block_by_handle (seaf->block_mgr,
-                                                       handle);
+                                                       pd->handle);
         if (!bmd) {
             seaf_warning ("Failed to stat block %s\n", blk_id);
-            ret = -1;
-            goto out;
+            return -1;
         }
-        remain = bmd->size;
+        pd->remain = bmd->size;
         g_free (bmd);
 
         if (crypt) {
-            if (seafile_decrypt_init (&ctx, crypt->version,
+            if (seafile_decrypt_init (&pd->ctx, crypt->version,
                                       crypt->key, crypt->iv) < 0) {
                 seaf_warning ("Failed to init decrypt.\n");
-                ret = -1;
-                goto out;
+                return -1;
             }
-            enc_init = TRUE;
+            pd->enc_init = TRUE;
         }
+    }
 
-        while (remain != 0) {
-            n = seaf_block_manager_read_block (seaf->block_mgr, handle,
-                                               buf, sizeof(buf));
-            if (n <= 0) {
-                seaf_warning ("failed to read block %s\n", blk_id);
+    if (pd->remain == 0)
+        goto block_done;
+
+    n = seaf_block_manager_read_block (seaf->block_mgr, pd->handle,
+                                       buf, sizeof(buf));
+    if (n <= 0) {
+        seaf_warning ("failed to read block %s\n", blk_id);
+        return -1;
+    }
+    pd->remain -= n;
+
+    /* OK, We're read some data of this block  */
+    if (crypt == NULL) {
+        /* not encrypted */
+        if (write_archive_data (pd, buf, n) < 0)
+            return -1;
+    } else {
+        /* an encrypted block */
+        dec_out = g_new (char, n + 16);
+
+        r = EVP_DecryptUpdate (&pd->ctx,
+                               (unsigned char *)dec_out,
+                               &dec_out_len,
+                               (unsigned char *)buf,
+                               n);
+
+        /* EVP_DecryptUpdate returns 1 on success, 0 on failure */
+        if (r != 1) {
+            seaf_warning ("Decrypt block %s failed.\n", blk_id);
+            ret = -1;
+            goto out;
+        }
+
+        if (dec_out_len > 0 &&
+            write_archive_data (pd, dec_out, dec_out_len) < 0) {
+            ret = -1;
+            goto out;
+        }
+
+        /* If it's the last piece of a block, call decrypt_final()
+         * to decrypt the possible partial block. */
+        if (pd->remain == 0) {
+            r = EVP_DecryptFinal_ex (&pd->ctx,
+                                     (unsigned char *)dec_out,
+                                     &dec_out_len);
+            if (r != 1) {
+                seaf_warning ("Decrypt block %s failed.\n", blk_id);
                 ret = -1;
                 goto out;
             }
-            remain -= n;
-
-            /* OK, We're read some data of this block  */
-            if (crypt == NULL) {
-                /* not encrypted */
-                len = archive_write_data (a, buf, n);
-                if (len <= 0) {
-                    seaf_warning ("archive_write_data returned %d\n", len);
-                    ret = -1;
-                    goto out;
-                }
-
-            } else {
-                /* an encrypted block */
-                dec_out = g_new (char, n + 16);
-                if (!dec_out) {
-                    seaf_warning ("Failed to alloc memory.\n");
-                    ret = -1;
-                    goto out;
-                }
-
-                int r = EVP_DecryptUpdate (&ctx,
-                                           (unsigned char *)dec_out,
-                                           &dec_out_len,
-                                           (unsigned char *)buf,
-                                           n);
-
-                /* EVP_DecryptUpdate returns 1 on success, 0 on failure */
-                if (r != 1) {
-                    seaf_warning ("Decrypt block %s failed.\n", blk_id);
-                    ret = -1;
-                    goto out;
-                }
-
-                if (dec_out_len > 0) {
-                    len = archive_write_data (a, dec_out, dec_out_len);
-                    if (len <= 0) {
-                        seaf_warning ("archive_write_data returned %d\n", len);
-                        ret = -1;
-                        goto out;
-                    }
-                }
-
-                /* If it's the last piece of a block, call decrypt_final()
-                 * to decrypt the possible partial block. */
-                if (remain == 0) {
-                    r = EVP_DecryptFinal_ex (&ctx,
-                                             (unsigned char *)dec_out,
-                                             &dec_out_len);
-                    if (r != 1) {
-                        seaf_warning ("Decrypt block %s failed.\n", blk_id);
-                        ret = -1;
-                        goto out;
-                    }
-
-                    if (dec_out_len != 0) {
-                        len = archive_write_data (a, dec_out, dec_out_len);
-                        if (len <= 0) {
-                            seaf_warning ("archive_write_data returned %d\n", len);
-                            ret = -1;
-                            goto out;
-                        }
-                    }
-                }
-
-                g_free (dec_out);
-                dec_out = NULL;
+
+            if (dec_out_len != 0 &&
+                write_archive_data (pd, dec_out, dec_out_len) < 0) {
+                ret = -1;
+                goto out;
             }
         }
+    }
 
-        seaf_block_manager_close_block (seaf->block_mgr, handle);
-        seaf_block_manager_block_handle_free (seaf->block_mgr, handle);
-        handle = NULL;
+    if (pd->remain != 0)
+        goto out;
 
-        /* turn to next block */
-        idx++;
-    }
+block_done:
+    /* turn to next block */
+    close_current_block (pd);
+    pd->idx++;
 
 out:
-    g_free (pathname);
-    if (entry)
-        archive_entry_free (entry);
-    if (file)
-        seafile_unref (file);
-    if (handle) {
-        seaf_block_manager_close_block (seaf->block_mgr, handle);
-        seaf_block_manager_block_handle_free(seaf->block_mgr, handle);
-    }
-    if (crypt != NULL && enc_init)
-        EVP_CIPHER_CTX_cleanup (&ctx);
     g_free (dec_out);
-
     return ret;
 }
 
+static void
+push_dir (PackDir *pd, SeafDir *dir, char *dirpath)
+{
+    PackDirFrame *frame = g_new0 (PackDirFrame, 1);
+
+    frame->dir = dir;
+    frame->next = dir->entries;
+    frame->dirpath = dirpath;
+    pd->stack = g_list_prepend (pd->stack, frame);
+}
+
+static void
+pop_dir (PackDir *pd)
+{
+    PackDirFrame *frame = pd->stack->data;
+
+    pd->stack = g_list_delete_link (pd->stack, pd->stack);
+    seaf_dir_free (frame->dir);
+    g_free (frame->dirpath);
+    g_free (frame);
+}
+
+/*
+ * Start adding the next file, or enter the next subdir.
+ * Returns 0 if there are no entries left.
+ */
 static int
-archive_dir (PackDirData *data,
-             const char *root_id,
-             const char *dirpath)
-             
+add_next_entry (PackDir *pd)
 {
-    SeafDir *dir = NULL;
+    PackDirFrame *frame;
     SeafDirent *dent;
-    GList *ptr;
-    char *subpath = NULL;
-    int ret = 0;
+    SeafDir *dir;
 
-    dir = seaf_fs_manager_get_seafdir (seaf->fs_mgr, root_id);
-    if (!dir) {
-        seaf_warning ("failed to get dir %s\n", root_id);
-        goto out;
-    }
+    while (pd->stack) {
+        frame = pd->stack->data;
+        if (!frame->next) {
+            pop_dir (pd);
+            continue;
+        }
+
+        dent = frame->next->data;
+        frame->next = frame->next->next;
 
-    for (ptr = dir->entries; ptr; ptr = ptr->next) {
-        dent = ptr->data;
         if (S_ISREG(dent->mode)) {
-            ret = add_file_to_archive (data, dirpath, dent);
+            return (start_file (pd, frame->dirpath, dent) < 0) ? -1 : 1;
 
         } else if (S_ISLNK(dent->mode)) {
             if (archive_version_number() >= 3000001) {
                 /* Symlink in zip arhive is not supported in earlier version
                  * of libarchive */
-                ret = add_file_to_archive (data, dirpath, dent);
+                return (start_file (pd, frame->dirpath, dent) < 0) ? -1 : 1;
             }
 
         } else if (S_ISDIR(dent->mode)) {
-            subpath = g_build_filename (dirpath, dent->name, NULL);
-            ret = archive_dir (data, dent->id, subpath);
-            g_free (subpath);
-        }
-
-        if (ret < 0) {
-            goto out;
+            dir = seaf_fs_manager_get_seafdir (seaf->fs_mgr, dent->id);
+            if (!dir) {
+                seaf_warning ("failed to get dir %s\n", dent->id);
+                continue;
+            }
+            push_dir (pd, dir,
+                      g_build_filename (frame->dirpath, dent->name, NULL));
+            return 1;
         }
     }
 
-out:
-    if (dir)
-        seaf_dir_free (dir);
-
-    return ret;
+    return 0;
 }
 
-char *pack_dir (const char *dirname,
-                const char *root_id,
-                SeafileCrypt *crypt,
-                gboolean is_windows)
+PackDir *
+pack_dir_new (const char *dirname,
+              const char *root_id,
+              SeafileCrypt *crypt,
+              gboolean is_windows,
+              struct evbuffer *out)
 {
-    struct archive *a = NULL;
-    char *tmpfile_name = NULL ;
-    char *ret = NULL;
-    int fd = -1;
-    PackDirData *data = NULL;
-
-    fd = g_file_open_tmp ("seafile-XXXXXX.zip", &tmpfile_name, NULL);
-    if (fd < 0) {
-        goto out;
+    PackDir *pd;
+    SeafDir *root;
+
+    root = seaf_fs_manager_get_seafdir (seaf->fs_mgr, root_id);
+    if (!root) {
+        seaf_warning ("failed to get dir %s\n", root_id);
+        return NULL;
     }
 
-    a = archive_write_new ();
-    archive_write_set_compression_none (a);
-    archive_write_set_format_zip (a);
-    archive_write_open_fd (a, fd);
+    pd = g_new0 (PackDir, 1);
+    pd->out = out;
+    pd->crypt = crypt;
+    pd->is_windows = is_windows;
+    pd->top_dir_name = g_strdup (dirname);
+    pd->mtime = time(NULL);
+    push_dir (pd, root, g_strdup(""));
+
+    pd->a = archive_write_new ();
+    archive_write_set_compression_none (pd->a);
+    archive_write_set_format_zip (pd->a);
+    /* Pass the data on as soon as it's written. */
+    archive_write_set_bytes_per_block (pd->a, 0);
+    if (archive_write_open (pd->a, pd, NULL,
+                            archive_write_cb, NULL) != ARCHIVE_OK) {
+        seaf_warning ("Failed to open archive: %s\n",
+                      archive_error_string(pd->a));
+        pack_dir_free (pd);
+        return NULL;
+    }
 
-    data = g_new0 (PackDirData, 1);
-    data->crypt = crypt;
-    data->is_windows = is_windows;
-    data->a = a;
-    data->top_dir_name = dirname;
-    data->mtime = time(NULL);
+    return pd;
+}
 
-    if (archive_dir (data, root_id, "") < 0) {
-        g_debug ("failed to archive_dir\n");
-        goto out;
-    }
+int
+pack_dir_continue (PackDir *pd, size_t min_bytes)
+{
+    int ret;
 
-    if (archive_write_finish(a) < 0) {
-        goto out;
-    }
+    if (pd->finished)
+        return 0;
 
-    ret = g_strdup (tmpfile_name);
+    while (evbuffer_get_length (pd->out) < min_bytes) {
+        if (pd->file) {
+            if (write_file_data (pd) < 0)
+                return -1;
+            continue;
+        }
 
-out:
-    if (data) g_free (data);
-    if (fd > 0) close (fd);
-    
-    if (!ret && tmpfile_name) {
-        /* zip failed: remove tmp file */
-        g_unlink (tmpfile_name);
+        ret = add_next_entry (pd);
+        if (ret < 0)
+            return -1;
+
+        if (ret == 0) {
+            /* Write the central directory. */
+            if (archive_write_close (pd->a) != ARCHIVE_OK) {
+                seaf_warning ("Failed to close archive: %s\n",
+                              archive_error_string(pd->a));
+                return -1;
+            }
+            pd->finished = TRUE;
+            return 0;
+        }
     }
-    g_free (tmpfile_name);
 
-    return ret;
+    return 1;
+}
+
+void
+pack_dir_free (PackDir *pd)
+{
+    close_current_block (pd);
+    if (pd->file)
+        seafile_unref (pd->file);
+    while (pd->stack)
+        pop_dir (pd);
+    if (pd->a)
+        archive_write_finish (pd->a);
+    g_free (pd->top_dir_name);
+    g_free (pd);
 }
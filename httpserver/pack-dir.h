@@ -1,11 +1,24 @@
 #ifndef PACK_DIR_H
 #define PACK_DIR_H
 
-/* Pack a seafile directory to a zipped archive, saved in a temporary file.
-   Return the path of this temporary file.
+typedef struct PackDir PackDir;
+
+/* Start packing a seafile directory to a zipped archive. The archive is
+   written to @out piece by piece, by calls to pack_dir_continue().
+   Return NULL on error.
+ */
+PackDir *pack_dir_new (const char *dirname,
+                       const char *root_id,
+                       SeafileCrypt *crypt,
+                       gboolean is_windows,
+                       struct evbuffer *out);
+
+/* Write more of the archive, until @out holds at least @min_bytes or the
+   archive is complete. Return 1 if there is more to write, 0 if the
+   archive is complete and -1 on error.
  */
-char *pack_dir (const char *dirname,
-                const char *root_id,
-                SeafileCrypt *crypt,
-                gboolean is_windows);
+int pack_dir_continue (PackDir *pd, size_t min_bytes);
+
+void pack_dir_free (PackDir *pd);
+
 #endif
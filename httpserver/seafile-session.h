@@ -17,6 +17,7 @@ struct _CcnetClient;
 typedef struct _SeafileSession SeafileSession;
 
 struct CcnetClientPool;
+struct ArchiveCache;
 
 struct _SeafileSession {
     struct _CcnetClient *session;
@@ -30,6 +31,8 @@ struct _SeafileSession {
     gint64               max_upload_size;
     gint64               max_download_dir_size;
     char                *http_temp_dir;
+    /* NULL if archives of dirs are not cached. */
+    struct ArchiveCache *archive_cache;
 
     struct CcnetClientPool     *client_pool;
 
@@ -64,13 +64,17 @@ typedef struct RecvFSM {
 
     GHashTable *form_kvs;       /* key/value of form fields */
     GList *filenames;           /* uploaded file names */
-    GList *files;               /* paths for completely uploaded tmp files. */
+    GList *files;               /* ids of completely uploaded files. */
 
     gboolean recved_crlf; /* Did we recv a CRLF when write out the last line? */
     char *file_name;
-    char *tmp_file;
-    int fd;
-    GList *tmp_files;           /* tmp files for each uploading file */
+
+    /* File data is chunked and stored in blocks as it's received. */
+    SeafFileIndexer *indexer;   /* indexer of the uploading file */
+    SeafileCrypt *crypt;        /* set if the repo is encrypted */
+    gint64 size_hint;           /* upper bound of the size of a file */
+    gint64 total_size;          /* total size of the uploaded files */
+    gboolean too_large;         /* total size exceeds the upload limit */
 
     /* For upload progress. */
     char *progress_id;
@@ -197,26 +201,9 @@ redirect_to_success_page (evhtp_request_t *req,
 }
 
 static gboolean
-check_tmp_file_list (GList *tmp_files, int *error_code)
+check_upload_size (RecvFSM *fsm, int *error_code)
 {
-    GList *ptr;
-    char *tmp_file;
-    SeafStat st;
-    gint64 total_size = 0;
-
-    for (ptr = tmp_files; ptr; ptr = ptr->next) {
-        tmp_file = ptr->data;
-
-        if (seaf_stat (tmp_file, &st) < 0) {
-            seaf_warning ("[upload] Failed to stat temp file %s.\n", tmp_file);
-            *error_code = ERROR_RECV;
-            return FALSE;
-        }
-
-        total_size += (gint64)st.st_size;
-    }
-
-    if (total_size > seaf->max_upload_size) {
+    if (fsm->too_large) {
         seaf_warning ("[upload] File size is too large.\n");
         *error_code = ERROR_SIZE;
         return FALSE;
@@ -263,7 +250,7 @@ upload_cb(evhtp_request_t *req, void *arg)
     GError *error = NULL;
     int error_code = ERROR_INTERNAL;
     char *err_file = NULL;
-    char *filenames_json, *tmp_files_json;
+    char *filenames_json, *file_ids_json;
 
     /* After upload_headers_cb() returns an error, libevhtp may still
      * receive data from the web browser and call into this cb.
@@ -272,7 +259,7 @@ upload_cb(evhtp_request_t *req, void *arg)
     if (!fsm || fsm->state == RECV_ERROR)
         return;
 
-    if (!fsm->files) {
+    if (!fsm->filenames) {
         seaf_warning ("[upload] No file uploaded.\n");
         set_content_length_header (req);
         evhtp_send_reply (req, EVHTP_RES_BADREQ);
@@ -288,7 +275,7 @@ upload_cb(evhtp_request_t *req, void *arg)
         return;
     }
 
-    if (!check_tmp_file_list (fsm->files, &error_code))
+    if (!check_upload_size (fsm, &error_code))
         goto error;
 
     rpc_client = ccnet_create_pooled_rpc_client (seaf->client_pool,
@@ -302,17 +289,17 @@ upload_cb(evhtp_request_t *req, void *arg)
     }
 
     filenames_json = file_list_to_json (fsm->filenames);
-    tmp_files_json = file_list_to_json (fsm->files);
-
-    seafile_post_multi_files (rpc_client,
-                              fsm->repo_id,
-                              parent_dir,
-                              filenames_json,
-                              tmp_files_json,
-                              fsm->user,
-                              &error);
+    file_ids_json = file_list_to_json (fsm->files);
+
+    seafile_post_indexed_files (rpc_client,
+                                fsm->repo_id,
+                                parent_dir,
+                                filenames_json,
+                                file_ids_json,
+                                fsm->user,
+                                &error);
     g_free (filenames_json);
-    g_free (tmp_files_json);
+    g_free (file_ids_json);
     if (error) {
         if (error->code == POST_FILE_ERR_FILENAME) {
             error_code = ERROR_FILENAME;
@@ -345,7 +332,7 @@ upload_api_cb(evhtp_request_t *req, void *arg)
     char *parent_dir;
     GError *error = NULL;
     int error_code = ERROR_INTERNAL;
-    char *filenames_json, *tmp_files_json;
+    char *filenames_json, *file_ids_json;
 
     /* After upload_headers_cb() returns an error, libevhtp may still
      * receive data from the web browser and call into this cb.
@@ -354,7 +341,7 @@ upload_api_cb(evhtp_request_t *req, void *arg)
     if (!fsm || fsm->state == RECV_ERROR)
         return;
 
-    if (!fsm->files) {
+    if (!fsm->filenames) {
         seaf_warning ("[upload] No file uploaded.\n");
         set_content_length_header (req);
         evhtp_send_reply (req, EVHTP_RES_BADREQ);
@@ -370,7 +357,7 @@ upload_api_cb(evhtp_request_t *req, void *arg)
         return;
     }
 
-    if (!check_tmp_file_list (fsm->files, &error_code))
+    if (!check_upload_size (fsm, &error_code))
         goto error;
 
     rpc_client = ccnet_create_pooled_rpc_client (seaf->client_pool,
@@ -384,17 +371,17 @@ upload_api_cb(evhtp_request_t *req, void *arg)
     }
 
     filenames_json = file_list_to_json (fsm->filenames);
-    tmp_files_json = file_list_to_json (fsm->files);
-
-    seafile_post_multi_files (rpc_client,
-                              fsm->repo_id,
-                              parent_dir,
-                              filenames_json,
-                              tmp_files_json,
-                              fsm->user,
-                              &error);
+    file_ids_json = file_list_to_json (fsm->files);
+
+    seafile_post_indexed_files (rpc_client,
+                                fsm->repo_id,
+                                parent_dir,
+                                filenames_json,
+                                file_ids_json,
+                                fsm->user,
+                                &error);
     g_free (filenames_json);
-    g_free (tmp_files_json);
+    g_free (file_ids_json);
     if (error) {
         if (error->code == POST_FILE_ERR_FILENAME) {
             error_code = ERROR_FILENAME;
@@ -456,7 +443,7 @@ update_cb(evhtp_request_t *req, void *arg)
     if (!fsm || fsm->state == RECV_ERROR)
         return;
 
-    if (!fsm->files) {
+    if (!fsm->filenames) {
         seaf_warning ("[update] No file uploaded.\n");
         set_content_length_header (req);
         evhtp_send_reply (req, EVHTP_RES_BADREQ);
@@ -475,7 +462,7 @@ update_cb(evhtp_request_t *req, void *arg)
     parent_dir = g_path_get_dirname (target_file);
     filename = g_path_get_basename (target_file);
 
-    if (!check_tmp_file_list (fsm->files, &error_code))
+    if (!check_upload_size (fsm, &error_code))
         goto error;
 
     head_id = evhtp_kv_find (req->uri->query, "head");
@@ -490,14 +477,14 @@ update_cb(evhtp_request_t *req, void *arg)
         goto error;
     }
 
-    seafile_put_file (rpc_client,
-                      fsm->repo_id,
-                      (char *)(fsm->files->data),
-                      parent_dir,
-                      filename,
-                      fsm->user,
-                      head_id,
-                      &error);
+    seafile_put_indexed_file (rpc_client,
+                              fsm->repo_id,
+                              (char *)(fsm->files->data),
+                              parent_dir,
+                              filename,
+                              fsm->user,
+                              head_id,
+                              &error);
     if (error) {
         if (g_strcmp0 (error->message, "file does not exist") == 0) {
             error_code = ERROR_NOT_EXIST;
@@ -539,7 +526,7 @@ update_api_cb(evhtp_request_t *req, void *arg)
     if (!fsm || fsm->state == RECV_ERROR)
         return;
 
-    if (!fsm->files) {
+    if (!fsm->filenames) {
         seaf_warning ("[update] No file uploaded.\n");
         set_content_length_header (req);
         evhtp_send_reply (req, EVHTP_RES_BADREQ);
@@ -558,7 +545,7 @@ update_api_cb(evhtp_request_t *req, void *arg)
     parent_dir = g_path_get_dirname (target_file);
     filename = g_path_get_basename (target_file);
 
-    if (!check_tmp_file_list (fsm->files, &error_code))
+    if (!check_upload_size (fsm, &error_code))
         goto error;
 
     head_id = evhtp_kv_find (req->uri->query, "head");
@@ -573,14 +560,14 @@ update_api_cb(evhtp_request_t *req, void *arg)
         goto error;
     }
 
-    new_file_id = seafile_put_file (rpc_client,
-                                    fsm->repo_id,
-                                    (char *)(fsm->files->data),
-                                    parent_dir,
-                                    filename,
-                                    fsm->user,
-                                    head_id,
-                                    &error);
+    new_file_id = seafile_put_indexed_file (rpc_client,
+                                            fsm->repo_id,
+                                            (char *)(fsm->files->data),
+                                            parent_dir,
+                                            filename,
+                                            fsm->user,
+                                            head_id,
+                                            &error);
     g_free (parent_dir);
     g_free (filename);
     
@@ -646,7 +633,6 @@ static evhtp_res
 upload_finish_cb (evhtp_request_t *req, void *arg)
 {
     RecvFSM *fsm = arg;
-    GList *ptr;
 
     if (!fsm)
         return EVHTP_RES_OK;
@@ -661,14 +647,11 @@ upload_finish_cb (evhtp_request_t *req, void *arg)
     g_hash_table_destroy (fsm->form_kvs);
 
     g_free (fsm->file_name);
-    if (fsm->tmp_file) {
-        close (fsm->fd);
-    }
-    g_free (fsm->tmp_file);
 
-    for (ptr = fsm->tmp_files; ptr; ptr = ptr->next)
-        g_unlink ((char *)(ptr->data));
-    string_list_free (fsm->tmp_files);
+    /* Blocks of an unfinished upload are left to the garbage collector. */
+    seaf_file_indexer_free (fsm->indexer);
+    g_free (fsm->crypt);
+
     string_list_free (fsm->filenames);
     string_list_free (fsm->files);
 
@@ -766,24 +749,29 @@ parse_mime_header (char *header, RecvFSM *fsm)
 }
 
 static int
-open_temp_file (RecvFSM *fsm)
+start_file_indexer (RecvFSM *fsm)
 {
-    GString *temp_file = g_string_new (NULL);
+    fsm->indexer = seaf_fs_manager_file_indexer_new (seaf->fs_mgr,
+                                                     fsm->size_hint,
+                                                     fsm->crypt);
+    if (!fsm->indexer)
+        return -1;
 
-    g_string_printf (temp_file, "%s/%sXXXXXX",
-                     seaf->http_temp_dir, get_basename(fsm->file_name));
+    return 0;
+}
 
-    fsm->fd = g_mkstemp (temp_file->str);
-    if (fsm->fd < 0) {
-        g_string_free (temp_file, TRUE);
-        return -1;
-    }
+static int
+write_file_data (RecvFSM *fsm, const char *data, size_t len)
+{
+    fsm->total_size += (gint64)len;
+    if (fsm->total_size > seaf->max_upload_size)
+        fsm->too_large = TRUE;
 
-    fsm->tmp_file = g_string_free (temp_file, FALSE);
-    /* For clean up later. */
-    fsm->tmp_files = g_list_prepend (fsm->tmp_files, g_strdup(fsm->tmp_file));
+    /* Don't store more blocks, the upload will be rejected when it ends. */
+    if (fsm->too_large)
+        return 0;
 
-    return 0;
+    return seaf_file_indexer_feed (fsm->indexer, data, len);
 }
 
 static evhtp_res
@@ -817,19 +805,29 @@ recv_form_field (RecvFSM *fsm, gboolean *no_line)
     return EVHTP_RES_OK;
 }
 
-static void
+static int
 add_uploaded_file (RecvFSM *fsm)
 {
+    unsigned char sha1[20];
+    char file_id[41];
+
+    if (!fsm->too_large) {
+        if (seaf_file_indexer_finish (fsm->indexer, sha1) < 0)
+            return -1;
+        rawdata_to_hex (sha1, file_id, 20);
+        fsm->files = g_list_prepend (fsm->files, g_strdup(file_id));
+    }
+
     fsm->filenames = g_list_prepend (fsm->filenames,
                                      get_basename(fsm->file_name));
-    fsm->files = g_list_prepend (fsm->files, g_strdup(fsm->tmp_file));
 
     g_free (fsm->file_name);
-    g_free (fsm->tmp_file);
-    close (fsm->fd);
+    seaf_file_indexer_free (fsm->indexer);
     fsm->file_name = NULL;
-    fsm->tmp_file = NULL;
+    fsm->indexer = NULL;
     fsm->recved_crlf = FALSE;
+
+    return 0;
 }
 
 static evhtp_res
@@ -851,9 +849,8 @@ recv_file_data (RecvFSM *fsm, gboolean *no_line)
             seaf_debug ("[upload] recv file data %d bytes.\n",
                      evbuffer_get_length(fsm->line));
             if (fsm->recved_crlf) {
-                if (writen (fsm->fd, "\r\n", 2) < 0) {
-                    seaf_warning ("[upload] Failed to write temp file: %s.\n",
-                               strerror(errno));
+                if (write_file_data (fsm, "\r\n", 2) < 0) {
+                    seaf_warning ("[upload] Failed to index file data.\n");
                     return EVHTP_RES_SERVERR;
                 }
             }
@@ -861,9 +858,8 @@ recv_file_data (RecvFSM *fsm, gboolean *no_line)
             size_t size = evbuffer_get_length (fsm->line);
             char *buf = g_new (char, size);
             evbuffer_remove (fsm->line, buf, size);
-            if (writen (fsm->fd, buf, size) < 0) {
-                seaf_warning ("[upload] Failed to write temp file: %s.\n",
-                           strerror(errno));
+            if (write_file_data (fsm, buf, size) < 0) {
+                seaf_warning ("[upload] Failed to index file data.\n");
                 g_free (buf);
                 return EVHTP_RES_SERVERR;
             }
@@ -874,7 +870,12 @@ recv_file_data (RecvFSM *fsm, gboolean *no_line)
     } else if (strstr (line, fsm->boundary) != NULL) {
         seaf_debug ("[upload] file data ends.\n");
 
-        add_uploaded_file (fsm);
+        if (add_uploaded_file (fsm) < 0) {
+            seaf_warning ("[upload] Failed to index file %s.\n",
+                          fsm->file_name);
+            free (line);
+            return EVHTP_RES_SERVERR;
+        }
 
         g_free (fsm->input_name);
         fsm->input_name = NULL;
@@ -883,15 +884,14 @@ recv_file_data (RecvFSM *fsm, gboolean *no_line)
     } else {
         seaf_debug ("[upload] recv file data %d bytes.\n", len + 2);
         if (fsm->recved_crlf) {
-            if (writen (fsm->fd, "\r\n", 2) < 0) {
-                seaf_warning ("[upload] Failed to write temp file: %s.\n",
-                           strerror(errno));
+            if (write_file_data (fsm, "\r\n", 2) < 0) {
+                seaf_warning ("[upload] Failed to index file data.\n");
+                free (line);
                 return EVHTP_RES_SERVERR;
             }
         }
-        if (writen (fsm->fd, line, len) < 0) {
-            seaf_warning ("[upload] Failed to write temp file: %s.\n",
-                       strerror(errno));
+        if (write_file_data (fsm, line, len) < 0) {
+            seaf_warning ("[upload] Failed to index file data.\n");
             free (line);
             return EVHTP_RES_SERVERR;
         }
@@ -969,8 +969,8 @@ upload_read_cb (evhtp_request_t *req, evbuf_t *buf, void *arg)
                     /* Read an blank line, headers end. */
                     free (line);
                     if (g_strcmp0 (fsm->input_name, "file") == 0) {
-                        if (open_temp_file (fsm) < 0) {
-                            seaf_warning ("[upload] Failed open temp file.\n");
+                        if (start_file_indexer (fsm) < 0) {
+                            seaf_warning ("[upload] Failed to start indexing file.\n");
                             res = EVHTP_RES_SERVERR;
                             goto out;
                         }
@@ -1129,6 +1129,54 @@ get_progress_info (evhtp_request_t *req,
     return 0;
 }
 
+/* Get the key to encrypt the blocks of uploaded files. */
+static SeafileCrypt *
+get_repo_crypt (SearpcClient *rpc, SeafRepo *repo, const char *user)
+{
+    SeafileCryptKey *crypt_key;
+    char *key_hex, *iv_hex;
+    unsigned char enc_key[16], enc_iv[16];
+    SeafileCrypt *crypt;
+
+    crypt_key = (SeafileCryptKey *) seafile_get_decrypt_key (rpc, repo->id,
+                                                             user, NULL);
+    if (!crypt_key)
+        return NULL;
+
+    g_object_get (crypt_key,
+                  "key", &key_hex,
+                  "iv", &iv_hex,
+                  NULL);
+    hex_to_rawdata (key_hex, enc_key, 16);
+    hex_to_rawdata (iv_hex, enc_iv, 16);
+    crypt = seafile_crypt_new (repo->enc_version, enc_key, enc_iv);
+    g_free (key_hex);
+    g_free (iv_hex);
+    g_object_unref (crypt_key);
+
+    return crypt;
+}
+
+/* Files are chunked before their sizes are known. The request body is
+ * larger than any file in it, and larger files are rejected anyway.
+ */
+static gint64
+get_file_size_hint (evhtp_headers_t *hdr)
+{
+    const char *content_len_str;
+    gint64 content_len;
+
+    content_len_str = evhtp_kv_find (hdr, "Content-Length");
+    if (!content_len_str)
+        return seaf->max_upload_size;
+
+    content_len = strtoll (content_len_str, NULL, 10);
+    if (content_len <= 0 || content_len > seaf->max_upload_size)
+        return seaf->max_upload_size;
+
+    return content_len;
+}
+
 static evhtp_res
 upload_headers_cb (evhtp_request_t *req, evhtp_headers_t *hdr, void *arg)
 {
@@ -1140,6 +1188,10 @@ upload_headers_cb (evhtp_request_t *req, evhtp_headers_t *hdr, void *arg)
     char *err_msg = NULL;
     RecvFSM *fsm = NULL;
     Progress *progress = NULL;
+    SeafRepo *repo = NULL;
+    SeafileCrypt *crypt = NULL;
+
+    httpserver_count_request (req);
 
     /* URL format: http://host:port/[upload|update]/<token>?X-Progress-ID=<uuid> */
     token = req->uri->path->file;
@@ -1159,6 +1211,22 @@ upload_headers_cb (evhtp_request_t *req, evhtp_headers_t *hdr, void *arg)
         goto err;
     }
 
+    repo = seaf_repo_manager_get_repo (seaf->repo_mgr, repo_id);
+    if (!repo) {
+        seaf_warning ("[upload] Repo %s doesn't exist.\n", repo_id);
+        err_msg = "Invalid repo";
+        goto err;
+    }
+
+    if (repo->encrypted) {
+        crypt = get_repo_crypt (rpc_client, repo, user);
+        if (!crypt) {
+            seaf_warning ("[upload] Passwd for repo %s is not set.\n", repo_id);
+            err_msg = "Repo is encrypted. Please provide password.";
+            goto err;
+        }
+    }
+
     boundary = get_boundary (hdr);
     if (!boundary) {
         goto err;
@@ -1184,6 +1252,8 @@ upload_headers_cb (evhtp_request_t *req, evhtp_headers_t *hdr, void *arg)
     fsm->line = evbuffer_new ();
     fsm->form_kvs = g_hash_table_new_full (g_str_hash, g_str_equal,
                                            g_free, g_free);
+    fsm->crypt = crypt;
+    fsm->size_hint = get_file_size_hint (hdr);
 
     if (progress_id != NULL) {
         progress = g_new0 (Progress, 1);
@@ -1203,6 +1273,7 @@ upload_headers_cb (evhtp_request_t *req, evhtp_headers_t *hdr, void *arg)
     req->cbarg = fsm;
 
     ccnet_rpc_client_free (rpc_client);
+    seaf_repo_unref (repo);
 
     return EVHTP_RES_OK;
 
@@ -1226,6 +1297,9 @@ err:
     g_free (user);
     g_free (boundary);
     g_free (progress_id);
+    g_free (crypt);
+    if (repo)
+        seaf_repo_unref (repo);
     return EVHTP_RES_OK;
 }
 
@@ -1237,6 +1311,8 @@ upload_progress_cb(evhtp_request_t *req, void *arg)
     Progress *progress;
     GString *buf;
 
+    httpserver_count_request (req);
+
     progress_id = evhtp_kv_find (req->uri->query, "X-Progress-ID");
     if (!progress_id) {
         seaf_warning ("[get pg] Progress id not found in url.\n");
@@ -10,4 +10,13 @@
 int
 monitor_compute_repo_size (const char *repo_id, GError **error);
 
+/**
+ * monitor_get_size_sched_stats:
+ *
+ * Returns a SeafileSizeSchedStats object with the queue depth and job
+ * durations of the repo size scheduler.
+ */
+GObject *
+monitor_get_size_sched_stats (GError **error);
+
 #endif
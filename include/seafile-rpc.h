@@ -19,6 +19,17 @@ seafile_get_session_info (GError **error);
  */
 GList* seafile_get_repo_list (int start, int limit, GError **error);
 
+/**
+ * seafile_get_repo_list_after:
+ * @last_repo_id: id of the last repo of the previous page, "" for the
+ *                first page.
+ *
+ * Returns at most @limit repos ordered by repo id, for walking all repos
+ * page by page.
+ */
+GList* seafile_get_repo_list_after (const char *last_repo_id, int limit,
+                                    GError **error);
+
 /**
  * seafile_get_commit_list:
  *
@@ -383,10 +394,33 @@ int seafile_set_monitor (const char *monitor, GError **error);
 
 char *seafile_get_monitor (GError **error);
 
+/**
+ * Return hit/miss/eviction statistics of the object caches of the server,
+ * as a list of SeafileCacheStats objects.
+ */
+GList *seafile_get_cache_stats (GError **error);
+
 gint64 seafile_get_user_quota_usage (const char *email, GError **error);
 
 gint64 seafile_get_user_share_usage (const char *email, GError **error);
 
+/**
+ * Must be called after members are added to or removed from a group,
+ * so that share usage of the repos shared to the group is recomputed.
+ */
+int
+seafile_group_members_changed (int group_id, GError **error);
+
+/**
+ * Get quota, usage and share usage of users.
+ *
+ * @users: user ids separated by "\n".
+ *
+ * Returns a list of SeafileUserQuotaUsage objects.
+ */
+GList *
+seafile_get_users_quota_usage (const char *users, GError **error);
+
 gint64 seafile_get_org_quota_usage (int org_id, GError **error);
 
 gint64
@@ -427,6 +461,22 @@ GList *
 seafile_list_share_repos (const char *email, const char *type,
                           int start, int limit, GError **error);
 
+/**
+ * seafile_list_share_repos_after:
+ * @last_repo_id: repo id of the last share of the previous page, "" for
+ *                the first page.
+ * @last_user: user of the last share of the previous page, "" for the
+ *             first page.
+ *
+ * Returns at most @limit shares ordered by repo id and user, for walking
+ * all shares of @email page by page.
+ */
+GList *
+seafile_list_share_repos_after (const char *email, const char *type,
+                                const char *last_repo_id,
+                                const char *last_user,
+                                int limit, GError **error);
+
 GList *
 seafile_list_org_share_repos (int org_id, const char *email, const char *type,
                               int start, int limit, GError **error);
@@ -435,6 +485,17 @@ int
 seafile_remove_share (const char *repo_id, const char *from_email,
                       const char *to_email, GError **error);
 
+/*
+ * Return the repo owner, users the repo is shared to and members of groups
+ * the repo is shared to, separated by "\n", without duplicates.
+ */
+char *
+seafile_get_related_users_by_repo (const char *repo_id, GError **error);
+
+char *
+seafile_get_related_users_by_org_repo (int org_id, const char *repo_id,
+                                       GError **error);
+
 int
 seafile_group_share_repo (const char *repo_id, int group_id,
                           const char *user_name, const char *permission,
@@ -447,9 +508,29 @@ seafile_group_unshare_repo (const char *repo_id, int group_id,
 char *
 seafile_get_shared_groups_by_repo(const char *repo_id, GError **error);
 
+/* Get group objects of the groups that a repo is shared to */
+GList *
+seafile_list_groups_by_repo (const char *repo_id, GError **error);
+
+/*
+ * @group_ids_json: a json array of group ids.
+ *
+ * Returns a json array of the org ids of the groups, in the same order,
+ * -1 for groups not in any org.
+ */
+char *
+seafile_get_org_ids_by_groups (const char *group_ids_json, GError **error);
+
 char *
 seafile_get_group_repoids (int group_id, GError **error);
 
+/* Get repos shared to a group, sorted by last modification time.
+ * Returns Repo objects with the owner in "shared_email", the permission
+ * in "share_permission" and the head commit time in "last_modify".
+ */
+GList *
+seafile_get_group_repos (int group_id, GError **error);
+
 GList *
 seafile_get_group_repos_by_owner (char *user, GError **error);
 
@@ -538,6 +619,19 @@ seafile_post_multi_files (const char *repo_id,
                           const char *user,
                           GError **error);
 
+/**
+ * Add multiple files that have been indexed by the caller.
+ *
+ * @file_ids_json: json array of file ids
+ */
+int
+seafile_post_indexed_files (const char *repo_id,
+                            const char *parent_dir,
+                            const char *filenames_json,
+                            const char *file_ids_json,
+                            const char *user,
+                            GError **error);
+
 int
 seafile_post_empty_file (const char *repo_id, const char *parent_dir,
                          const char *new_file_name, const char *user,
@@ -556,6 +650,16 @@ seafile_put_file (const char *repo_id, const char *temp_file_path,
                   const char *user, const char *head_id,
                   GError **error);
 
+/**
+ * Update an existing file with a file that has been indexed by the caller.
+ * @params: same as seafile_put_file, but with the id of the new file
+ */
+char *
+seafile_put_indexed_file (const char *repo_id, const char *file_id,
+                          const char *parent_dir, const char *file_name,
+                          const char *user, const char *head_id,
+                          GError **error);
+
 int
 seafile_post_dir (const char *repo_id, const char *parent_dir,
                   const char *new_dir_name, const char *user,
@@ -644,6 +748,18 @@ char *
 seafile_get_dir_id_by_path (const char *repo_id, const char *path,
                             GError **error);
 
+/**
+ * Get the file ids of several paths of a repo at once.
+ *
+ * @paths: paths separated by "\n".
+ *
+ * Returns the file ids separated by "\n", in the order of @paths. The id of
+ * a path that doesn't exist or is a dir is an empty string.
+ */
+char *
+seafile_get_file_ids_by_paths (const char *repo_id, const char *paths,
+                               GError **error);
+
 /**
  * Return a list of commits where every commit contains a unique version of
  * the file.
@@ -748,6 +864,9 @@ char *
 seafile_get_org_group_repo_owner (int org_id, int group_id,
                                   const char *repo_id, GError **error);
 
+GList *
+seafile_get_org_group_repos (int org_id, int group_id, GError **error);
+
 GList *
 seafile_get_org_group_repos_by_owner (int org_id, const char *user,
                                       GError **error);
@@ -756,6 +875,10 @@ char *
 seafile_get_org_groups_by_repo (int org_id, const char *repo_id,
                                 GError **error);
 
+GList *
+seafile_list_org_groups_by_repo (int org_id, const char *repo_id,
+                                 GError **error);
+
 int
 seafile_set_inner_pub_repo (const char *repo_id,
                             const char *permission,
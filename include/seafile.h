@@ -121,6 +121,25 @@ seafile_post_multi_files (SearpcClient *client,
                           const char *user,
                           GError **error);
 
+int
+seafile_post_indexed_files (SearpcClient *client,
+                            const char *repo_id,
+                            const char *parent_dir,
+                            const char *filenames_json,
+                            const char *file_ids_json,
+                            const char *user,
+                            GError **error);
+
+char *
+seafile_put_indexed_file (SearpcClient *client,
+                          const char *repo_id,
+                          const char *file_id,
+                          const char *parent_dir,
+                          const char *file_name,
+                          const char *user,
+                          const char *head_id,
+                          GError **error);
+
 int
 seafile_set_user_quota (SearpcClient *client,
                         const char *user,
@@ -0,0 +1,14 @@
+namespace Seafile {
+
+public class CacheStats : Object {
+
+    public string name { get; set; }
+    // In number of objects for the commit cache, in bytes for the fs cache.
+    public int64 size { get; set; }
+    public int64 capacity { get; set; }  // 0 if disabled
+    public int64 hits { get; set; }
+    public int64 misses { get; set; }
+    public int64 evictions { get; set; }
+}
+
+} // namespace
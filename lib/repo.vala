@@ -148,4 +148,21 @@ public class RepoTokenInfo: Object {
     public int64 sync_time { get; set; }
 }
 
+public class UserQuotaUsage : Object {
+    public string user { get; set; }
+    public int64 quota { get; set; }
+    public int64 usage { get; set; }        // size of the user's own repos
+    public int64 share_usage { get; set; }  // -1 if it can't be computed
+}
+
+public class SizeSchedStats : Object {
+    public int queued { get; set; }
+    public int running { get; set; }
+    public int max_jobs { get; set; }
+    public int64 coalesced { get; set; }   // requests merged into queued jobs
+    public int64 finished { get; set; }
+    public int64 total_time { get; set; }  // of finished jobs, in microseconds
+    public int64 max_time { get; set; }
+}
+
 } // namespace
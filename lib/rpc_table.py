@@ -60,6 +60,7 @@ func_table = [
     [ "objlist", ["string", "string", "string"] ],
     [ "objlist", ["string", "string", "int"] ],
     [ "objlist", ["string", "string", "int", "int"] ],
+    [ "objlist", ["string", "string", "string", "string", "int"] ],
     [ "objlist", ["int", "string", "string", "int", "int"] ],
     [ "object", [] ],
     [ "object", ["int"] ],
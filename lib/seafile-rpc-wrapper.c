@@ -328,6 +328,42 @@ seafile_post_multi_files (SearpcClient *client,
                                     "string", user);
 }
 
+int
+seafile_post_indexed_files (SearpcClient *client,
+                            const char *repo_id,
+                            const char *parent_dir,
+                            const char *filenames_json,
+                            const char *file_ids_json,
+                            const char *user,
+                            GError **error)
+{
+    return searpc_client_call__int (client, "seafile_post_indexed_files", error,
+                                    5, "string", repo_id,
+                                    "string", parent_dir,
+                                    "string", filenames_json,
+                                    "string", file_ids_json,
+                                    "string", user);
+}
+
+char *
+seafile_put_indexed_file (SearpcClient *client,
+                          const char *repo_id,
+                          const char *file_id,
+                          const char *parent_dir,
+                          const char *file_name,
+                          const char *user,
+                          const char *head_id,
+                          GError **error)
+{
+    return searpc_client_call__string (client, "seafile_put_indexed_file", error,
+                                    6, "string", repo_id,
+                                    "string", file_id,
+                                    "string", parent_dir,
+                                    "string", file_name,
+                                    "string", user,
+                                    "string", head_id);
+}
+
 int
 seafile_set_user_quota (SearpcClient *client,
                         const char *user,
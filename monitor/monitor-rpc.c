@@ -17,3 +17,9 @@ monitor_compute_repo_size (const char *repo_id, GError **error)
 
     return 0;
 }
+
+GObject *
+monitor_get_size_sched_stats (GError **error)
+{
+    return (GObject *)scheduler_get_stats (seaf->scheduler);
+}
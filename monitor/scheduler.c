@@ -4,10 +4,22 @@
 
 #include "seafile-session.h"
 #include "scheduler.h"
+#include "utils.h"
 
 typedef struct SchedulerPriv {
     GQueue *repo_size_job_queue;
+    /* Repo id -> queued job. A repo is queued at most once. */
+    GHashTable *queued_repos;
+    /* Ids of the repos being computed. */
+    GHashTable *running_repos;
     int n_running_repo_size_jobs;
+    int max_jobs;
+    gboolean incremental;
+
+    gint64 n_coalesced_jobs;
+    gint64 n_finished_jobs;
+    gint64 total_job_time;
+    gint64 max_job_time;
 
     CcnetTimer *sched_timer;
 } SchedulerPriv;
@@ -15,10 +27,11 @@ typedef struct SchedulerPriv {
 typedef struct RepoSizeJob {
     Scheduler *sched;
     char repo_id[37];
+    gint64 start_time;
 } RepoSizeJob;
 
 #define SCHEDULER_INTV 10000    /* 10s */
-#define CONCURRENT_JOBS 5
+#define DEFAULT_CONCURRENT_JOBS 5
 
 static int
 schedule_pulse (void *vscheduler);
@@ -49,10 +62,32 @@ scheduler_new (SeafileSession *session)
 int
 scheduler_init (Scheduler *scheduler)
 {
-    scheduler->priv->repo_size_job_queue = g_queue_new ();
-    scheduler->priv->sched_timer = ccnet_timer_new (schedule_pulse,
-                                              scheduler,
-                                              SCHEDULER_INTV);
+    SchedulerPriv *priv = scheduler->priv;
+    GError *error = NULL;
+
+    priv->repo_size_job_queue = g_queue_new ();
+    priv->queued_repos = g_hash_table_new (g_str_hash, g_str_equal);
+    priv->running_repos = g_hash_table_new_full (g_str_hash, g_str_equal,
+                                                 g_free, NULL);
+
+    priv->max_jobs = g_key_file_get_integer (scheduler->seaf->config,
+                                             "size_scheduler",
+                                             "concurrent_jobs",
+                                             &error);
+    if (error || priv->max_jobs <= 0) {
+        g_clear_error (&error);
+        priv->max_jobs = DEFAULT_CONCURRENT_JOBS;
+    }
+
+    /* See compute_size(). */
+    priv->incremental = g_key_file_get_boolean (scheduler->seaf->config,
+                                                "size_scheduler",
+                                                "incremental",
+                                                NULL);
+
+    priv->sched_timer = ccnet_timer_new (schedule_pulse,
+                                         scheduler,
+                                         SCHEDULER_INTV);
 
     return 0;
 }
@@ -60,42 +95,85 @@ scheduler_init (Scheduler *scheduler)
 void
 schedule_repo_size_computation (Scheduler *scheduler, const char *repo_id)
 {
-    RepoSizeJob *job = g_new0(RepoSizeJob, 1);
+    SchedulerPriv *priv = scheduler->priv;
+    RepoSizeJob *job;
 
+    /* A queued job computes the size of the head when it runs, so it
+     * also covers the later updates.
+     */
+    if (g_hash_table_lookup (priv->queued_repos, repo_id)) {
+        ++(priv->n_coalesced_jobs);
+        return;
+    }
+
+    job = g_new0(RepoSizeJob, 1);
     job->sched = scheduler;
     memcpy (job->repo_id, repo_id, 37);
 
-    g_queue_push_tail (scheduler->priv->repo_size_job_queue, job);
+    g_queue_push_tail (priv->repo_size_job_queue, job);
+    g_hash_table_insert (priv->queued_repos, job->repo_id, job);
 }
 
 static int
 schedule_pulse (void *vscheduler)
 {
     Scheduler *sched = vscheduler;
+    SchedulerPriv *priv = sched->priv;
     RepoSizeJob *job;
+    GList *ptr, *next;
 
-    while (sched->priv->n_running_repo_size_jobs < CONCURRENT_JOBS) {
-        job = (RepoSizeJob *)g_queue_pop_head (sched->priv->repo_size_job_queue);
-        if (!job)
-            break;
+    ptr = priv->repo_size_job_queue->head;
+    while (ptr && priv->n_running_repo_size_jobs < priv->max_jobs) {
+        job = ptr->data;
+        next = ptr->next;
+
+        /* Wait for the running job of the same repo to finish. */
+        if (g_hash_table_lookup (priv->running_repos, job->repo_id)) {
+            ptr = next;
+            continue;
+        }
 
+        job->start_time = get_current_time ();
         int ret = ccnet_job_manager_schedule_job (sched->seaf->job_mgr,
                                         compute_repo_size,
                                         compute_repo_size_done,
                                         job);
         if (ret < 0) {
             g_warning ("[scheduler] failed to start compute job.\n");
-            g_queue_push_head (sched->priv->repo_size_job_queue, job);
             break;
         }
-        ++(sched->priv->n_running_repo_size_jobs);
+
+        g_queue_delete_link (priv->repo_size_job_queue, ptr);
+        g_hash_table_remove (priv->queued_repos, job->repo_id);
+        g_hash_table_insert (priv->running_repos, g_strdup(job->repo_id),
+                             (void *)1);
+        ++(priv->n_running_repo_size_jobs);
+
+        ptr = next;
     }
 
     return 1;
 }
 
+SeafileSizeSchedStats *
+scheduler_get_stats (Scheduler *scheduler)
+{
+    SchedulerPriv *priv = scheduler->priv;
+
+    return g_object_new (SEAFILE_TYPE_SIZE_SCHED_STATS,
+                         "queued", (int)priv->repo_size_job_queue->length,
+                         "running", priv->n_running_repo_size_jobs,
+                         "max_jobs", priv->max_jobs,
+                         "coalesced", priv->n_coalesced_jobs,
+                         "finished", priv->n_finished_jobs,
+                         "total_time", priv->total_job_time,
+                         "max_time", priv->max_job_time,
+                         NULL);
+}
+
 static int
-set_repo_size (SeafDB *db, const char *repo_id, const char *head_id, guint64 size)
+set_repo_size (SeafDB *db, const char *repo_id, const char *head_id,
+               guint64 size, gboolean by_file_size)
 {
     char sql[256];
 
@@ -126,6 +204,19 @@ set_repo_size (SeafDB *db, const char *repo_id, const char *head_id, guint64 siz
             return -1;
     }
 
+    /* Record whether the size is a total of file sizes. */
+    snprintf (sql, sizeof(sql),
+              "DELETE FROM RepoFileSizeHead WHERE repo_id='%s'", repo_id);
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+    if (by_file_size) {
+        snprintf (sql, sizeof(sql),
+                  "INSERT INTO RepoFileSizeHead VALUES ('%s', '%s')",
+                  repo_id, head_id);
+        if (seaf_db_query (db, sql) < 0)
+            return -1;
+    }
+
     return 0;
 }
 
@@ -139,6 +230,109 @@ get_cached_head_id (SeafDB *db, const char *repo_id)
     return seaf_db_get_string (db, sql);
 }
 
+/* Returns -1 if the cached size is not the total file size of @head_id.
+ * Sizes saved in block mode, or by older versions, are not.
+ */
+static gint64
+get_cached_file_size (SeafDB *db, const char *repo_id, const char *head_id)
+{
+    char sql[512];
+
+    snprintf (sql, sizeof(sql),
+              "SELECT size FROM RepoSize, RepoFileSizeHead "
+              "WHERE RepoSize.repo_id='%s' AND RepoSize.head_id='%s' AND "
+              "RepoFileSizeHead.repo_id=RepoSize.repo_id AND "
+              "RepoFileSizeHead.head_id=RepoSize.head_id",
+              repo_id, head_id);
+    return seaf_db_get_int64 (db, sql);
+}
+
+/* The total size of the unique blocks of @head. */
+static int
+compute_block_size (SeafileSession *session, SeafCommit *head, guint64 *size)
+{
+    BlockList *bl;
+    char *block_id;
+    BlockMetadata *bmd;
+    int i;
+
+    /* Load block list first so that we don't need to count duplicate blocks.
+     * We only calculate the size of the head commit.
+     */
+    bl = block_list_new ();
+    if (seaf_fs_manager_populate_blocklist (session->fs_mgr,
+                                            head->root_id,
+                                            bl) < 0) {
+        block_list_free (bl);
+        return -1;
+    }
+
+    *size = 0;
+    for (i = 0; i < bl->n_blocks; ++i) {
+        block_id = g_ptr_array_index (bl->block_ids, i);
+        bmd = seaf_block_manager_stat_block (session->block_mgr, block_id);
+        if (bmd) {
+            *size += bmd->size;
+            g_free (bmd);
+        }
+    }
+    block_list_free (bl);
+
+    return 0;
+}
+
+/*
+ * By default the size of a repo is the total size of the unique blocks
+ * of its head commit, and the whole tree is walked on each update.
+ *
+ * With [size_scheduler] incremental = true, the size is the total size of
+ * the files in the head commit, so content that appears more than once is
+ * counted more than once. If the file size of @cached_head_id is known,
+ * the new size is computed from the difference between the two trees.
+ * Otherwise the whole tree of @head is walked.
+ */
+static int
+compute_size (SeafileSession *session,
+              const char *repo_id,
+              const char *cached_head_id,
+              SeafCommit *head,
+              gboolean incremental,
+              guint64 *size)
+{
+    SeafCommit *cached_head = NULL;
+    gint64 cached_size = -1, delta, total;
+
+    if (!incremental)
+        return compute_block_size (session, head, size);
+
+    if (cached_head_id) {
+        cached_size = get_cached_file_size (session->db, repo_id,
+                                            cached_head_id);
+        cached_head = seaf_commit_manager_get_commit (session->commit_mgr,
+                                                      cached_head_id);
+    }
+
+    if (cached_head && cached_size >= 0 &&
+        seaf_fs_manager_get_fs_size_delta (session->fs_mgr,
+                                           cached_head->root_id,
+                                           head->root_id,
+                                           &delta) == 0 &&
+        cached_size + delta >= 0) {
+        seaf_commit_unref (cached_head);
+        *size = (guint64)(cached_size + delta);
+        return 0;
+    }
+
+    if (cached_head)
+        seaf_commit_unref (cached_head);
+
+    total = seaf_fs_manager_get_fs_size (session->fs_mgr, head->root_id);
+    if (total < 0)
+        return -1;
+    *size = (guint64)total;
+    return 0;
+}
+
 static void*
 compute_repo_size (void *vjob)
 {
@@ -147,9 +341,6 @@ compute_repo_size (void *vjob)
     SeafRepo *repo = NULL;
     SeafCommit *head = NULL;
     char *cached_head_id = NULL;
-    BlockList *bl;
-    char *block_id;
-    BlockMetadata *bmd;
     guint64 size = 0;
 
     repo = seaf_repo_manager_get_repo (sched->seaf->repo_mgr, job->repo_id);
@@ -170,32 +361,18 @@ compute_repo_size (void *vjob)
         goto out;
     }
 
-    /* Load block list first so that we don't need to count duplicate blocks.
-     * We only calculate the size of the head commit.
-     */
-    bl = block_list_new ();
-    if (seaf_fs_manager_populate_blocklist (seaf->fs_mgr,
-                                            head->root_id,
-                                            bl) < 0) {
-        block_list_free (bl);
+    if (compute_size (sched->seaf, job->repo_id, cached_head_id,
+                      head, sched->priv->incremental, &size) < 0) {
+        g_warning ("[scheduler] failed to compute size of repo %s.\n",
+                   job->repo_id);
         goto out;
     }
 
-    int i;
-    for (i = 0; i < bl->n_blocks; ++i) {
-        block_id = g_ptr_array_index (bl->block_ids, i);
-        bmd = seaf_block_manager_stat_block (sched->seaf->block_mgr, block_id);
-        if (bmd) {
-            size += bmd->size;
-            g_free (bmd);
-        }
-    }
-    block_list_free (bl);
-
     if (set_repo_size (sched->seaf->db,
                        job->repo_id,
                        repo->head->commit_id,
-                       size) < 0)
+                       size,
+                       sched->priv->incremental) < 0)
         g_warning ("[scheduler] failed to store repo size %s.\n", job->repo_id);
 
 out:
@@ -210,6 +387,16 @@ static void
 compute_repo_size_done (void *vjob)
 {
     RepoSizeJob *job = vjob;
-    --(job->sched->priv->n_running_repo_size_jobs);
+    SchedulerPriv *priv = job->sched->priv;
+    gint64 duration = get_current_time () - job->start_time;
+
+    --(priv->n_running_repo_size_jobs);
+    g_hash_table_remove (priv->running_repos, job->repo_id);
+
+    ++(priv->n_finished_jobs);
+    priv->total_job_time += duration;
+    if (duration > priv->max_job_time)
+        priv->max_job_time = duration;
+
     g_free (job);
 }
@@ -1,6 +1,8 @@
 #ifndef SCHEDULER_H
 #define SCHEDULER_H
 
+#include "seafile-object.h"
+
 struct _SeafileSession;
 
 struct SchedulerPriv;
@@ -20,4 +22,7 @@ scheduler_init (Scheduler *scheduler);
 void
 schedule_repo_size_computation (Scheduler *scheduler, const char *repo_id);
 
+SeafileSizeSchedStats *
+scheduler_get_stats (Scheduler *scheduler);
+
 #endif
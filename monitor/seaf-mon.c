@@ -68,6 +68,11 @@ static void start_rpc_service (CcnetClient *client)
                                      monitor_compute_repo_size,
                                      "compute_repo_size",
                                      searpc_signature_int__string());
+
+    searpc_server_register_function ("monitor-rpcserver",
+                                     monitor_get_size_sched_stats,
+                                     "monitor_get_size_sched_stats",
+                                     searpc_signature_object__void());
 }
 
 static void
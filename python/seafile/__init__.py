@@ -4,6 +4,8 @@ from rpcclient import SeafileThreadedRpcClient as ThreadedRpcClient
 from rpcclient import MonitorRpcClient as MonitorRpcClient
 from rpcclient import SeafServerRpcClient as ServerRpcClient
 from rpcclient import SeafServerThreadedRpcClient as ServerThreadedRpcClient
+from rpcclient import AsyncRpcClient, gather
+import rpcstats
 
 class TaskType(object):
     DOWNLOAD = 0
@@ -1,8 +1,34 @@
 
-import ccnet
-from pysearpc import searpc_func, SearpcError
+import os
+import threading
+from multiprocessing.pool import ThreadPool
 
-class SeafileRpcClient(ccnet.RpcClientBase):
+import ccnet
+import pysearpc
+from pysearpc import SearpcError
+
+import rpcstats
+
+def searpc_func(ret_type, param_types):
+    """
+    Same as pysearpc.searpc_func, and records per-rpc statistics when
+    enabled in `rpcstats`.
+    """
+    def decorate(func):
+        rpc_func = pysearpc.searpc_func(ret_type, param_types)(func)
+        return rpcstats.instrument(func.__name__, rpc_func)
+    return decorate
+
+class RpcClientBase(ccnet.RpcClientBase):
+    """Base class of seafile rpc clients, which reports payload sizes."""
+
+    def call_remote_func_sync(self, fcall_str):
+        ret_str = ccnet.RpcClientBase.call_remote_func_sync(self, fcall_str)
+        if rpcstats.is_enabled():
+            rpcstats.record_payload(len(fcall_str), len(ret_str or ''))
+        return ret_str
+
+class SeafileRpcClient(RpcClientBase):
     """RPC used in client"""
 
     def __init__(self, ccnet_client_pool, *args, **kwargs):
@@ -219,7 +245,7 @@ class SeafileRpcClient(ccnet.RpcClientBase):
     get_repo_token = seafile_get_repo_token
 
 
-class SeafileThreadedRpcClient(ccnet.RpcClientBase):
+class SeafileThreadedRpcClient(RpcClientBase):
     """RPC used in client that run in a thread"""
 
     def __init__(self, ccnet_client_pool, *args, **kwargs):
@@ -258,7 +284,7 @@ class SeafileThreadedRpcClient(ccnet.RpcClientBase):
     commit = seafile_commit
 
 
-class MonitorRpcClient(ccnet.RpcClientBase):
+class MonitorRpcClient(RpcClientBase):
 
     def __init__(self, ccnet_client_pool):
         ccnet.RpcClientBase.__init__(self, ccnet_client_pool, "monitor-rpcserver")
@@ -268,8 +294,13 @@ class MonitorRpcClient(ccnet.RpcClientBase):
         pass
     get_repos_size = monitor_get_repos_size
 
+    @searpc_func("object", [])
+    def monitor_get_size_sched_stats():
+        pass
+    get_size_sched_stats = monitor_get_size_sched_stats
+
 
-class SeafServerRpcClient(ccnet.RpcClientBase):
+class SeafServerRpcClient(RpcClientBase):
 
     def __init__(self, ccnet_client_pool, *args, **kwargs):
         ccnet.RpcClientBase.__init__(self, ccnet_client_pool, "seafserv-rpcserver",
@@ -308,7 +339,7 @@ class SeafServerRpcClient(ccnet.RpcClientBase):
         pass
     get_decrypt_key = seafile_get_decrypt_key
     
-class SeafServerThreadedRpcClient(ccnet.RpcClientBase):
+class SeafServerThreadedRpcClient(RpcClientBase):
 
     def __init__(self, ccnet_client_pool, *args, **kwargs):
         ccnet.RpcClientBase.__init__(self, ccnet_client_pool,
@@ -336,6 +367,10 @@ class SeafServerThreadedRpcClient(ccnet.RpcClientBase):
         pass
     get_repo_list = seafile_get_repo_list
 
+    @searpc_func("objlist", ["string", "int"])
+    def get_repo_list_after(last_repo_id, limit):
+        pass
+
     @searpc_func("int", ["string", "string", "string", "string"])
     def seafile_edit_repo(repo_id, name, description, user):
         pass
@@ -461,6 +496,10 @@ class SeafServerThreadedRpcClient(ccnet.RpcClientBase):
         pass
     get_file_id_by_path = seafile_get_file_id_by_path
 
+    @searpc_func("string", ["string", "string"])
+    def get_file_ids_by_paths(repo_id, paths):
+        pass
+
     @searpc_func("string", ["string", "string"])
     def seafile_get_dir_id_by_path(repo_id, path):
         pass
@@ -506,6 +545,11 @@ class SeafServerThreadedRpcClient(ccnet.RpcClientBase):
         pass
     list_share_repos = seafile_list_share_repos
 
+    @searpc_func("objlist", ["string", "string", "string", "string", "int"])
+    def list_share_repos_after(email, query_col, last_repo_id, last_user,
+                               limit):
+        pass
+
     @searpc_func("objlist", ["int", "string", "string", "int", "int"])
     def seafile_list_org_share_repos(org_id, email, query_col, start, limit):
         pass
@@ -520,6 +564,10 @@ class SeafServerThreadedRpcClient(ccnet.RpcClientBase):
     def set_share_permission(repo_id, from_email, to_email, permission):
         pass
 
+    @searpc_func("string", ["string"])
+    def get_related_users_by_repo(repo_id):
+        pass
+
     # share repo to group
     @searpc_func("int", ["string", "int", "string", "string"])
     def seafile_group_share_repo(repo_id, group_id, user_name, permisson):
@@ -536,11 +584,23 @@ class SeafServerThreadedRpcClient(ccnet.RpcClientBase):
         pass
     get_shared_groups_by_repo=seafile_get_shared_groups_by_repo
     
+    @searpc_func("objlist", ["string"])
+    def list_groups_by_repo(repo_id):
+        pass
+
+    @searpc_func("string", ["string"])
+    def get_org_ids_by_groups(group_ids_json):
+        pass
+
     @searpc_func("string", ["int"])
     def seafile_get_group_repoids(group_id):
         pass
     get_group_repoids = seafile_get_group_repoids
 
+    @searpc_func("objlist", ["int"])
+    def get_group_repos(group_id):
+        pass
+
     @searpc_func("objlist", ["string"])
     def get_group_repos_by_owner(user_name):
         pass
@@ -619,6 +679,14 @@ class SeafServerThreadedRpcClient(ccnet.RpcClientBase):
         pass
     get_user_share_usage = seafile_get_user_share_usage
 
+    @searpc_func("int", ["int"])
+    def group_members_changed(group_id):
+        pass
+
+    @searpc_func("objlist", ["string"])
+    def get_users_quota_usage(users):
+        pass
+
     @searpc_func("int64", ["int"])
     def seafile_get_org_quota_usage(org_id):
         pass
@@ -657,6 +725,10 @@ class SeafServerThreadedRpcClient(ccnet.RpcClientBase):
     def check_quota(repo_id):
         pass
 
+    @searpc_func("objlist", [])
+    def get_cache_stats():
+        pass
+
     # password management
     @searpc_func("int", ["string", "string", "string"])
     def seafile_set_passwd(repo_id, user, passwd):
@@ -719,6 +791,10 @@ class SeafServerThreadedRpcClient(ccnet.RpcClientBase):
     def get_org_group_repo_owner(org_id, group_id, repo_id):
         pass
 
+    @searpc_func("objlist", ["int", "int"])
+    def get_org_group_repos(org_id, group_id):
+        pass
+
     @searpc_func("objlist", ["int", "string"])
     def get_org_group_repos_by_owner(org_id, user):
         pass
@@ -727,9 +803,17 @@ class SeafServerThreadedRpcClient(ccnet.RpcClientBase):
     def get_org_groups_by_repo(org_id, repo_id):
         pass
 
+    @searpc_func("objlist", ["int", "string"])
+    def list_org_groups_by_repo(org_id, repo_id):
+        pass
+
     @searpc_func("int", ["int", "int", "string", "string"])
     def set_org_group_repo_permission(org_id, group_id, repo_id, permission):
         pass
+
+    @searpc_func("string", ["int", "string"])
+    def get_related_users_by_org_repo(org_id, repo_id):
+        pass
     
     # inner pub repo
     @searpc_func("int", ["string", "string"])
@@ -780,3 +864,68 @@ class SeafServerThreadedRpcClient(ccnet.RpcClientBase):
     @searpc_func("int", ["string"])
     def get_repo_history_limit(repo_id):
         pass
+
+
+class AsyncRpcClient(object):
+    """
+    Run the rpcs of another rpc client in a pool of threads, so that
+    several rpcs can be in flight at the same time.
+
+    Every rpc declared on the wrapped client is available with the same
+    name and arguments, but returns a `multiprocessing.pool.AsyncResult`
+    at once. Call `get()` on it to wait for the return value, or use
+    `gather()` to wait for several results.
+
+    The wrapped client must be created with `req_pool=True`, so that each
+    rpc takes its own connection from the ccnet client pool:
+
+        rpc = AsyncRpcClient(ServerThreadedRpcClient(pool, req_pool=True))
+        repo, owner = gather(rpc.get_repo(repo_id),
+                             rpc.get_repo_owner(repo_id))
+    """
+
+    def __init__(self, rpc_client, n_threads=8):
+        self._rpc_client = rpc_client
+        self._n_threads = n_threads
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    def _get_pool(self):
+        # Threads don't survive fork, so a pool inherited from the parent
+        # process can't be used.
+        pid = os.getpid()
+        with self._lock:
+            if self._pool is None or self._pool_pid != pid:
+                self._pool = ThreadPool(self._n_threads)
+                self._pool_pid = pid
+            return self._pool
+
+    def __getattr__(self, name):
+        func = getattr(self._rpc_client, name)
+        if not callable(func):
+            return func
+
+        def async_func(*args):
+            return self._get_pool().apply_async(func, args)
+        async_func.__name__ = name
+        return async_func
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.close()
+                self._pool.join()
+            self._pool = None
+
+
+def gather(*results, **kwargs):
+    """
+    Wait for the results returned by an `AsyncRpcClient`, and return their
+    values in the same order. The first SearpcError raised by a rpc is
+    raised again here.
+
+    timeout: seconds to wait for each result, None to wait forever
+    """
+    timeout = kwargs.get('timeout')
+    return [ r.get(timeout) for r in results ]
@@ -0,0 +1,118 @@
+"""
+Per-rpc statistics of the seafile rpc clients.
+
+Statistics are off by default. When enabled with `enable()`, every rpc
+declared with `rpcclient.searpc_func` records, under its rpc name:
+
+    calls:          number of calls
+    errors:         number of calls that raised an exception
+    bytes_sent:     total size of the serialized requests
+    bytes_received: total size of the serialized responses
+    total_time:     total latency in seconds
+    histogram:      list of (upper bound in seconds, count) of latencies,
+                    the last bound is None for latencies above the others
+
+`snapshot()` returns a copy of the statistics of all rpcs.
+"""
+
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+                   0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+_enabled = False
+_lock = threading.Lock()
+_stats = {}
+_local = threading.local()
+
+class _RpcStats(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_time = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def to_dict(self):
+        bounds = list(LATENCY_BUCKETS) + [None]
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'total_time': self.total_time,
+            'histogram': zip(bounds, self.buckets),
+        }
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+def snapshot():
+    """Return a dict of rpc name -> statistics dict."""
+    with _lock:
+        return dict([ (name, s.to_dict()) for name, s in _stats.iteritems() ])
+
+def _bucket_index(elapsed):
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if elapsed <= bound:
+            return i
+    return len(LATENCY_BUCKETS)
+
+def _record(name, elapsed, sizes, error):
+    index = _bucket_index(elapsed)
+    with _lock:
+        s = _stats.get(name)
+        if s is None:
+            s = _stats[name] = _RpcStats()
+        s.calls += 1
+        if error:
+            s.errors += 1
+        s.bytes_sent += sizes[0]
+        s.bytes_received += sizes[1]
+        s.total_time += elapsed
+        s.buckets[index] += 1
+
+def record_payload(sent, received):
+    """Called by the rpc client with the sizes of a request and response."""
+    sizes = getattr(_local, 'sizes', None)
+    if sizes is not None:
+        sizes[0] += sent
+        sizes[1] += received
+
+def instrument(name, func):
+    """Wrap the rpc method `func` to record statistics under `name`."""
+    def wrapper(self, *args):
+        if not _enabled:
+            return func(self, *args)
+
+        sizes = _local.sizes = [0, 0]
+        start = time.time()
+        try:
+            ret = func(self, *args)
+        except Exception:
+            _record(name, time.time() - start, sizes, True)
+            raise
+        finally:
+            _local.sizes = None
+        _record(name, time.time() - start, sizes, False)
+        return ret
+
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
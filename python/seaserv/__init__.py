@@ -4,11 +4,12 @@ from service import ccnet_rpc, monitor_rpc, seafserv_rpc, \
     seafserv_threaded_rpc, ccnet_threaded_rpc
 from service import send_command, check_quota, web_get_access_token, \
     unset_repo_passwd, get_user_quota_usage, get_user_share_usage, \
-    get_user_quota
+    get_users_quota_usage, get_user_quota
 from service import get_emailusers, count_emailusers, get_session_info
 from service import get_org_groups, get_personal_groups_by_user, \
     get_group_repoids, get_personal_groups, list_share_repos, remove_share, \
     check_group_staff, remove_group_user, get_group, get_org_id_by_group, \
+    get_org_ids_by_groups, \
     get_group_members, get_shared_groups_by_repo, is_group_user, \
     get_org_group_repos, get_group_repos, get_org_groups_by_user, is_org_group,\
     del_org_group_repo, get_org_groups_by_repo, get_org_group_repoids, \
@@ -33,9 +34,11 @@ from service import create_org, get_orgs_by_user, get_org_by_url_prefix, \
 from service import get_related_users_by_repo, get_related_users_by_org_repo
 from service import post_empty_file, del_file
 
-from service import CCNET_CONF_PATH, CCNET_SERVER_ADDR, CCNET_SERVER_PORT, \
-    MAX_UPLOAD_FILE_SIZE, MAX_DOWNLOAD_DIR_SIZE, HTTP_SERVER_ROOT, CALC_SHARE_USAGE
+from service import init, get_config, SeaservConfig, rpc_cache
 
 from service import send_message
 
 from api import seafile_api
+
+# CCNET_CONF_PATH, MAX_UPLOAD_FILE_SIZE, etc. are loaded on first access.
+service.install_lazy_config(__name__)
@@ -1,6 +1,6 @@
 
 from service import ccnet_rpc, monitor_rpc, seafserv_rpc, \
-    seafserv_threaded_rpc, ccnet_threaded_rpc
+    seafserv_threaded_rpc, ccnet_threaded_rpc, rpc_cache
 
 """
 WebAccess:
@@ -11,6 +11,23 @@ WebAccess:
     string username
 """
 
+# Default number of items fetched by each rpc in the iter_* methods.
+PAGE_SIZE = 500
+
+def iter_pages(get_page, page_size):
+    """
+    Yield the items returned by `get_page(start, limit)`, page by page,
+    until a page is not full.
+    """
+    start = 0
+    while True:
+        page = get_page(start, page_size)
+        for item in page:
+            yield item
+        if len(page) < page_size:
+            break
+        start += page_size
+
 class SeafileAPI(object):
 
     def __init__(self):
@@ -50,13 +67,33 @@ class SeafileAPI(object):
         return seafserv_threaded_rpc.get_repo(repo_id)
 
     def remove_repo(self, repo_id):
-        return seafserv_threaded_rpc.remove_repo(repo_id)
+        ret = seafserv_threaded_rpc.remove_repo(repo_id)
+        rpc_cache.invalidate_repo(repo_id)
+        return ret
 
     def get_repo_list(self, start, limit):
         return seafserv_threaded_rpc.get_repo_list(start, limit)
 
+    def iter_repo_list(self, page_size=PAGE_SIZE):
+        """
+        Yield all repos ordered by repo id, fetching `page_size` repos per
+        rpc. Each page continues after the last repo id of the previous
+        page, so repos added or removed while walking don't shift pages.
+        """
+        last_repo_id = ''
+        while True:
+            repos = seafserv_threaded_rpc.get_repo_list_after(last_repo_id,
+                                                              page_size)
+            for repo in repos:
+                yield repo
+            if len(repos) < page_size:
+                break
+            last_repo_id = repos[-1].id
+
     def edit_repo(self, repo_id, name, description, username):
-        return seafserv_threaded_rpc.edit_repo(repo_id, name, description, username)
+        ret = seafserv_threaded_rpc.edit_repo(repo_id, name, description, username)
+        rpc_cache.invalidate_repo(repo_id)
+        return ret
 
     def is_repo_owner(self, username, repo_id):
         return seafserv_threaded_rpc.is_repo_owner(username, repo_id)
@@ -133,6 +170,21 @@ class SeafileAPI(object):
     def get_file_id_by_path(self, repo_id, path):
         return seafserv_threaded_rpc.get_file_id_by_path(repo_id, path)
 
+    def get_file_ids_by_paths(self, repo_id, paths):
+        """
+        Get the file ids of several paths of a repo in one rpc.
+
+        Return a dict of path -> file id. The id is None for a path which
+        doesn't exist or is a dir.
+        """
+        if not paths:
+            return {}
+        ret = seafserv_threaded_rpc.get_file_ids_by_paths(repo_id,
+                                                          '\n'.join(paths))
+        file_ids = ret.split('\n') if ret is not None else [''] * len(paths)
+        return dict([ (path, file_id or None)
+                      for path, file_id in zip(paths, file_ids) ])
+
     def get_file_id_by_commit_and_path(self, commit_id, path):
         return seafserv_threaded_rpc.get_file_id_by_commit_and_path(commit_id, path)
 
@@ -180,8 +232,10 @@ class SeafileAPI(object):
 
     # share repo to user
     def share_repo(self, repo_id, from_username, to_username, permission):
-        return seafserv_threaded_rpc.add_share(repo_id, from_username,
-                                               to_username, permission)
+        ret = seafserv_threaded_rpc.add_share(repo_id, from_username,
+                                              to_username, permission)
+        rpc_cache.invalidate_repo(repo_id)
+        return ret
 
     def get_share_out_repo_list(self, username, start, limit):
         return seafserv_threaded_rpc.list_share_repos(username, "from_email",
@@ -191,25 +245,56 @@ class SeafileAPI(object):
         return seafserv_threaded_rpc.list_share_repos(username, "to_email",
                                                       start, limit)
 
+    def _iter_share_repo_list(self, username, query_col, page_size):
+        last_repo_id, last_user = '', ''
+        while True:
+            shares = seafserv_threaded_rpc.list_share_repos_after(
+                username, query_col, last_repo_id, last_user, page_size)
+            for share in shares:
+                yield share
+            if len(shares) < page_size:
+                break
+            last_repo_id, last_user = shares[-1].repo_id, shares[-1].user
+
+    def iter_share_out_repo_list(self, username, page_size=PAGE_SIZE):
+        return self._iter_share_repo_list(username, 'from_email', page_size)
+
+    def iter_share_in_repo_list(self, username, page_size=PAGE_SIZE):
+        return self._iter_share_repo_list(username, 'to_email', page_size)
+
     def remove_share(self, repo_id, from_username, to_username):
-        return seafserv_threaded_rpc.remove_share(repo_id, from_username,
-                                                  to_username)
+        ret = seafserv_threaded_rpc.remove_share(repo_id, from_username,
+                                                 to_username)
+        rpc_cache.invalidate_repo(repo_id)
+        return ret
     
     def set_share_permission(self, repo_id, from_username, to_username, permission):
-        return seafserv_threaded_rpc.set_share_permission(repo_id, from_username,
-                                                          to_username, permission)
+        ret = seafserv_threaded_rpc.set_share_permission(repo_id, from_username,
+                                                         to_username, permission)
+        rpc_cache.invalidate_repo(repo_id)
+        return ret
 
     # share repo to group
     def group_share_repo(self, repo_id, group_id, username, permission):
-        return seafserv_threaded_rpc.group_share_repo(repo_id, group_id,
-                                                      username, permission)
+        ret = seafserv_threaded_rpc.group_share_repo(repo_id, group_id,
+                                                     username, permission)
+        rpc_cache.invalidate_repo(repo_id)
+        return ret
 
     def group_unshare_repo(self, repo_id, group_id, username):
-        return seafserv_threaded_rpc.group_unshare_repo(repo_id, group_id, username)
+        ret = seafserv_threaded_rpc.group_unshare_repo(repo_id, group_id, username)
+        rpc_cache.invalidate_repo(repo_id)
+        return ret
 
     def get_shared_groups_by_repo(self, repo_id):
         return seafserv_threaded_rpc.get_shared_groups_by_repo(repo_id)
 
+    def list_groups_by_repo(self, repo_id):
+        """
+        Return the list of group objects that the repo is shared to
+        """
+        return seafserv_threaded_rpc.list_groups_by_repo(repo_id)
+
     def get_group_repoids(self, group_id):
         """
         Return the list of group repo ids
@@ -233,12 +318,35 @@ class SeafileAPI(object):
             ret.append(r)
         return ret    
 
+    def get_group_repos(self, group_id):
+        """
+        Return the list of Repo objects shared to the group, with the owner
+        in `shared_email`, the permission in `share_permission` and the head
+        commit time in `last_modify`. Sorted by last modified time, newest
+        first.
+        """
+        return seafserv_threaded_rpc.get_group_repos(group_id)
+
+    def get_org_group_repos(self, org_id, group_id):
+        return seafserv_threaded_rpc.get_org_group_repos(org_id, group_id)
+
     def get_group_repos_by_owner(self, username):
         return seafserv_threaded_rpc.get_group_repos_by_owner(username)
 
     def set_group_repo_permission(self, group_id, repo_id, permission):
-        return seafserv_threaded_rpc.set_group_repo_permission(group_id, repo_id,
-                                                               permission)
+        ret = seafserv_threaded_rpc.set_group_repo_permission(group_id, repo_id,
+                                                              permission)
+        rpc_cache.invalidate_repo(repo_id)
+        return ret
+
+    # users and groups
+    def iter_emailusers(self, page_size=PAGE_SIZE):
+        """Yield all users, fetching `page_size` users per rpc."""
+        return iter_pages(ccnet_threaded_rpc.get_emailusers, page_size)
+
+    def iter_groups(self, page_size=PAGE_SIZE):
+        """Yield all groups, fetching `page_size` groups per rpc."""
+        return iter_pages(ccnet_threaded_rpc.get_all_groups, page_size)
 
     # token
     def generate_repo_token(self, repo_id, username):
@@ -266,25 +374,69 @@ class SeafileAPI(object):
     def get_user_quota(self, username):
         return seafserv_threaded_rpc.get_user_quota(username)
 
+    def group_members_changed(self, group_id):
+        """
+        Must be called after members are added to or removed from a group,
+        so that share usage of the group's repos is recomputed. Group
+        changes made through `ccnet_threaded_rpc` call it automatically.
+        """
+        return seafserv_threaded_rpc.group_members_changed(group_id)
+
+    def get_users_quota_usage(self, usernames):
+        """
+        Get quota, self usage and share usage of several users in one rpc.
+
+        Return a list of objects with attributes `user`, `quota`, `usage`
+        and `share_usage`, in the order of `usernames`. `share_usage` is -1
+        if it can't be computed.
+        """
+        if not usernames:
+            return []
+        return seafserv_threaded_rpc.get_users_quota_usage('\n'.join(usernames))
+
     def set_user_quota(self, username, quota):
         return seafserv_threaded_rpc.set_user_quota(username, quota)
 
     def check_quota(self, repo_id):
         pass
 
+    def get_cache_stats(self):
+        """
+        Return statistics of the object caches of the server, as a list of
+        objects with attributes `name`, `size`, `capacity`, `hits`, `misses`
+        and `evictions`.
+        """
+        return seafserv_threaded_rpc.get_cache_stats()
+
+    def get_size_sched_stats(self):
+        """
+        Return statistics of the repo size scheduler of the monitor, as an
+        object with attributes `queued`, `running`, `max_jobs`, `coalesced`,
+        `finished`, `total_time` and `max_time`. Times are in microseconds.
+        """
+        return monitor_rpc.get_size_sched_stats()
+
     # password management
     def set_passwd(self, repo_id, user, passwd):
-        return seafserv_threaded_rpc.set_passwd(repo_id, user, passwd)
+        ret = seafserv_threaded_rpc.set_passwd(repo_id, user, passwd)
+        rpc_cache.invalidate_repo(repo_id)
+        return ret
 
     def unset_passwd(self, repo_id, user, passwd):
-        return seafserv_threaded_rpc.unset_passwd(repo_id, user, passwd)
+        ret = seafserv_threaded_rpc.unset_passwd(repo_id, user, passwd)
+        rpc_cache.invalidate_repo(repo_id)
+        return ret
 
     # organization wide repo
     def add_inner_pub_repo(self, repo_id, permission):
-        return seafserv_threaded_rpc.set_inner_pub_repo(repo_id, permission)
+        ret = seafserv_threaded_rpc.set_inner_pub_repo(repo_id, permission)
+        rpc_cache.invalidate_repo(repo_id)
+        return ret
 
     def remove_inner_pub_repo(self, repo_id):
-        return seafserv_threaded_rpc.unset_inner_pub_repo(repo_id)
+        ret = seafserv_threaded_rpc.unset_inner_pub_repo(repo_id)
+        rpc_cache.invalidate_repo(repo_id)
+        return ret
 
     def get_inner_pub_repo_list(self):
         return seafserv_threaded_rpc.list_inner_pub_repos()
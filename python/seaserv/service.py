@@ -37,10 +37,12 @@ import json
 import logging
 import os
 import sys
+import threading
+import time
+import types
 import ConfigParser
+from collections import OrderedDict
 
-import ccnet
-import seafile
 import re
 from pysearpc import SearpcError
 
@@ -49,104 +51,420 @@ ENVIRONMENT_VARIABLES = ('CCNET_CONF_DIR', 'SEAFILE_CONF_DIR')
 # Used to fix bug in some rpc calls, will be removed in near future.
 MAX_INT = 2147483647            
 
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
 ### Loading ccnet and seafile configurations ###
-'''ccnet'''
-try:
-    CCNET_CONF_PATH = os.environ[ENVIRONMENT_VARIABLES[0]]
-    if not CCNET_CONF_PATH: # If it's set but is an empty string.
-        raise KeyError
-except KeyError:
-    raise ImportError("Seaserv cannot be imported, because environment variable %s is undefined." % ENVIRONMENT_VARIABLES[0])
-else:
-    print "Loading ccnet config from " + CCNET_CONF_PATH
-
-CCNET_CONF_PATH = os.path.normpath(os.path.expanduser(CCNET_CONF_PATH))
-
-pool = ccnet.ClientPool(CCNET_CONF_PATH)
-ccnet_rpc = ccnet.CcnetRpcClient(pool, req_pool=True)
-ccnet_threaded_rpc = ccnet.CcnetThreadedRpcClient(pool, req_pool=True)
-monitor_rpc = seafile.MonitorRpcClient(pool)
-seafserv_rpc = seafile.ServerRpcClient(pool, req_pool=True)
-seafserv_threaded_rpc = seafile.ServerThreadedRpcClient(pool, req_pool=True)
-
-# load ccnet server addr and port from ccnet.conf.
-# 'addr:port' is used when downloading a repo
-config = ConfigParser.ConfigParser()
-config.read(os.path.join(CCNET_CONF_PATH, 'ccnet.conf'))
-
-if config.has_option('General', 'SERVICE_URL') and \
-   config.has_option('Network', 'PORT'):
-    service_url = config.get('General', 'SERVICE_URL')
-
-    if service_url.startswith('http://'):
-        service_url = service_url[7:]
-    elif service_url.startswith('https://'):
-        service_url = service_url[8:]
-
-    if ':' in service_url:
-        # strip http port such as ':8000' in 'http://192.168.1.101:8000'
-        idx = service_url.index(':')
-        service_url = service_url[:idx]
-    if '/' in service_url:
-        # strip url suffix like the '/seahub' part of www.gonggeng.org/seahub
-        idx = service_url.index('/')
-        service_url = service_url[:idx]
-
-    CCNET_SERVER_ADDR = service_url
-    CCNET_SERVER_PORT = config.get('Network', 'PORT')
-else:
-    print "Warning: SERVICE_URL not set in ccnet.conf"
-    CCNET_SERVER_ADDR = None
-    CCNET_SERVER_PORT = None
-
-'''seafile'''
-try:
-    SEAFILE_CONF_DIR = os.environ[ENVIRONMENT_VARIABLES[1]]
-    if not SEAFILE_CONF_DIR: # If it's set but is an empty string.
-        raise KeyError
-except KeyError:
-    raise ImportError("Seaserv cannot be imported, because environment variable %s is undefined." % ENVIRONMENT_VARIABLES[1])
-else:
-    print "Loading seafile config from " + SEAFILE_CONF_DIR
-
-SEAFILE_CONF_DIR = os.path.normpath(os.path.expanduser(SEAFILE_CONF_DIR))
-config.read(os.path.join(SEAFILE_CONF_DIR, 'seafile.conf'))
-
-MAX_UPLOAD_FILE_SIZE = 100 * (2 ** 20) # Default max upload size, set in httpserver.c
-if config.has_option('httpserver', 'max_upload_size'):
-    try:
-        max_upload_size_mb = config.getint('httpserver', 'max_upload_size')
-        if max_upload_size_mb > 0:
-            MAX_UPLOAD_FILE_SIZE = max_upload_size_mb * (2 ** 20)
-    except ValueError:
-        pass
 
-MAX_DOWNLOAD_DIR_SIZE = 100 * (2 ** 20) # Default max size of a downloadable dir
-if config.has_option('httpserver', 'max_download_dir_size'):
-    try:
-        max_download_dir_size_mb = config.getint('httpserver', 'max_download_dir_size')
-        if max_download_dir_size_mb > 0:
-            MAX_DOWNLOAD_DIR_SIZE = max_download_dir_size_mb * (2 ** 20)
-    except ValueError:
-        pass
+# Configuration constants that can be imported from seaserv, e.g.
+# `from seaserv import MAX_UPLOAD_FILE_SIZE`.
+CONFIG_NAMES = ('CCNET_CONF_PATH', 'CCNET_SERVER_ADDR', 'CCNET_SERVER_PORT',
+                'SEAFILE_CONF_DIR', 'MAX_UPLOAD_FILE_SIZE',
+                'MAX_DOWNLOAD_DIR_SIZE', 'HTTP_SERVER_ROOT', 'CALC_SHARE_USAGE')
 
-if CCNET_SERVER_ADDR:
-    enable_https = config.getboolean('httpserver', 'https') if \
-        config.has_option('httpserver', 'https') else False
-    http_or_https = 'https://' if enable_https else 'http://'
-    
-    port = config.get('httpserver', 'port') if \
-        config.has_option('httpserver', 'port') else '8082'
-    HTTP_SERVER_ROOT = http_or_https + CCNET_SERVER_ADDR + ':' + port
-else:
-    HTTP_SERVER_ROOT = None
+def _get_conf_dir_from_env(env_var):
+    conf_dir = os.environ.get(env_var, '')
+    if not conf_dir: # If it's unset or set to an empty string.
+        raise RuntimeError("Seaserv cannot be initialized, because environment variable %s is undefined." % env_var)
+    return conf_dir
 
-CALC_SHARE_USAGE = False
-if config.has_option('quota', 'calc_share_usage'):
-    CALC_SHARE_USAGE = config.getboolean('quota', 'calc_share_usage')
+class SeaservConfig(object):
+    """
+    Ccnet and seafile configurations used by seaserv.
 
-# Get an instance of a logger
-logger = logging.getLogger(__name__)
+    Conf dirs that are not given are read from the CCNET_CONF_DIR and
+    SEAFILE_CONF_DIR environment variables.
+    """
+
+    def __init__(self, ccnet_conf_dir=None, seafile_conf_dir=None):
+        # ccnet
+        if not ccnet_conf_dir:
+            ccnet_conf_dir = _get_conf_dir_from_env(ENVIRONMENT_VARIABLES[0])
+        self.CCNET_CONF_PATH = os.path.normpath(os.path.expanduser(ccnet_conf_dir))
+        logger.info("Loading ccnet config from %s", self.CCNET_CONF_PATH)
+
+        # load ccnet server addr and port from ccnet.conf.
+        # 'addr:port' is used when downloading a repo
+        config = ConfigParser.ConfigParser()
+        config.read(os.path.join(self.CCNET_CONF_PATH, 'ccnet.conf'))
+
+        if config.has_option('General', 'SERVICE_URL') and \
+           config.has_option('Network', 'PORT'):
+            service_url = config.get('General', 'SERVICE_URL')
+
+            if service_url.startswith('http://'):
+                service_url = service_url[7:]
+            elif service_url.startswith('https://'):
+                service_url = service_url[8:]
+
+            if ':' in service_url:
+                # strip http port such as ':8000' in 'http://192.168.1.101:8000'
+                idx = service_url.index(':')
+                service_url = service_url[:idx]
+            if '/' in service_url:
+                # strip url suffix like the '/seahub' part of www.gonggeng.org/seahub
+                idx = service_url.index('/')
+                service_url = service_url[:idx]
+
+            self.CCNET_SERVER_ADDR = service_url
+            self.CCNET_SERVER_PORT = config.get('Network', 'PORT')
+        else:
+            logger.warning("SERVICE_URL not set in ccnet.conf")
+            self.CCNET_SERVER_ADDR = None
+            self.CCNET_SERVER_PORT = None
+
+        # seafile
+        if not seafile_conf_dir:
+            seafile_conf_dir = _get_conf_dir_from_env(ENVIRONMENT_VARIABLES[1])
+        self.SEAFILE_CONF_DIR = os.path.normpath(os.path.expanduser(seafile_conf_dir))
+        logger.info("Loading seafile config from %s", self.SEAFILE_CONF_DIR)
+
+        config.read(os.path.join(self.SEAFILE_CONF_DIR, 'seafile.conf'))
+
+        self.MAX_UPLOAD_FILE_SIZE = 100 * (2 ** 20) # Default max upload size, set in httpserver.c
+        if config.has_option('httpserver', 'max_upload_size'):
+            try:
+                max_upload_size_mb = config.getint('httpserver', 'max_upload_size')
+                if max_upload_size_mb > 0:
+                    self.MAX_UPLOAD_FILE_SIZE = max_upload_size_mb * (2 ** 20)
+            except ValueError:
+                pass
+
+        self.MAX_DOWNLOAD_DIR_SIZE = 100 * (2 ** 20) # Default max size of a downloadable dir
+        if config.has_option('httpserver', 'max_download_dir_size'):
+            try:
+                max_download_dir_size_mb = config.getint('httpserver', 'max_download_dir_size')
+                if max_download_dir_size_mb > 0:
+                    self.MAX_DOWNLOAD_DIR_SIZE = max_download_dir_size_mb * (2 ** 20)
+            except ValueError:
+                pass
+
+        if self.CCNET_SERVER_ADDR:
+            enable_https = config.getboolean('httpserver', 'https') if \
+                config.has_option('httpserver', 'https') else False
+            http_or_https = 'https://' if enable_https else 'http://'
+
+            port = config.get('httpserver', 'port') if \
+                config.has_option('httpserver', 'port') else '8082'
+            self.HTTP_SERVER_ROOT = http_or_https + self.CCNET_SERVER_ADDR + ':' + port
+        else:
+            self.HTTP_SERVER_ROOT = None
+
+        self.CALC_SHARE_USAGE = False
+        if config.has_option('quota', 'calc_share_usage'):
+            self.CALC_SHARE_USAGE = config.getboolean('quota', 'calc_share_usage')
+
+_lock = threading.RLock()
+_config = None
+_pool = None
+_pool_pid = None
+
+def init(ccnet_conf_dir=None, seafile_conf_dir=None):
+    """
+    Load configurations and drop the client pool created before, if any.
+
+    Calling this is optional: seaserv initializes itself from environment
+    variables on first use.
+    """
+    global _config, _pool, _pool_pid
+    config = SeaservConfig(ccnet_conf_dir, seafile_conf_dir)
+    with _lock:
+        _config = config
+        _pool = None
+        _pool_pid = None
+    return config
+
+def get_config():
+    if _config is None:
+        with _lock:
+            if _config is None:
+                init()
+    return _config
+
+def get_pool():
+    """
+    Return the ccnet client pool of current process, create it if needed.
+
+    A pool inherited from the parent process is never reused, since its
+    connections would be shared with the parent.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _lock:
+            if _pool is None or _pool_pid != pid:
+                import ccnet
+                _pool = ccnet.ClientPool(get_config().CCNET_CONF_PATH)
+                _pool_pid = pid
+    return _pool
+
+class LazyRpcClient(object):
+    """
+    Stand-in for a rpc client. The real client is created from the pool
+    returned by `get_pool()` on first use, and again when the pool changes.
+    """
+
+    def __init__(self, module_name, class_name, **kwargs):
+        self._module_name = module_name
+        self._class_name = class_name
+        self._kwargs = kwargs
+        self._bound = (None, None) # (pool, client)
+
+    def _get_client(self):
+        pool = get_pool()
+        bound_pool, client = self._bound
+        if bound_pool is not pool:
+            module = __import__(self._module_name)
+            client = getattr(module, self._class_name)(pool, **self._kwargs)
+            self._bound = (pool, client)
+        return client
+
+    def __getattr__(self, name):
+        return getattr(self._get_client(), name)
+
+# Ccnet rpcs that change the members of a group or remove the group. The
+# group id is their first argument.
+GROUP_MEMBER_RPCS = ('group_add_member', 'group_remove_member',
+                     'quit_group', 'remove_group')
+
+def _group_members_changed(group_ids):
+    """
+    Make seafile recompute share usage of the repos of the groups, and drop
+    cached permissions, which depend on group membership.
+    """
+    rpc_cache.invalidate_rpc('check_permission')
+    for group_id in group_ids:
+        try:
+            seafserv_threaded_rpc.group_members_changed(group_id)
+        except SearpcError, e:
+            logger.error(e)
+
+class CcnetGroupRpcClient(LazyRpcClient):
+    """
+    Lazy ccnet rpc client that tells seafile server when group members
+    change, since seafile saves the number of users a repo is shared to.
+    """
+
+    def __getattr__(self, name):
+        func = LazyRpcClient.__getattr__(self, name)
+
+        if name in GROUP_MEMBER_RPCS:
+            def wrapper(group_id, *args):
+                ret = func(group_id, *args)
+                _group_members_changed([group_id])
+                return ret
+        elif name == 'remove_group_user':
+            def wrapper(user):
+                try:
+                    group_ids = [ g.id for g in self.get_groups(user) ]
+                except SearpcError, e:
+                    # The counts will expire on the server.
+                    logger.error(e)
+                    group_ids = []
+                ret = func(user)
+                _group_members_changed(group_ids)
+                return ret
+        else:
+            return func
+
+        wrapper.__name__ = name
+        return wrapper
+
+ccnet_rpc = LazyRpcClient('ccnet', 'CcnetRpcClient', req_pool=True)
+ccnet_threaded_rpc = CcnetGroupRpcClient('ccnet', 'CcnetThreadedRpcClient', req_pool=True)
+monitor_rpc = LazyRpcClient('seafile', 'MonitorRpcClient')
+seafserv_rpc = LazyRpcClient('seafile', 'ServerRpcClient', req_pool=True)
+seafserv_threaded_rpc = LazyRpcClient('seafile', 'ServerThreadedRpcClient', req_pool=True)
+
+class LazyConfigModule(types.ModuleType):
+    """
+    Stand-in for a module in `sys.modules`, whose configuration constants
+    in `CONFIG_NAMES` are looked up from `get_config()` when accessed,
+    instead of at import time.
+
+    Every other attribute is read from, assigned to and deleted from the
+    original module, so that its functions, whose globals are the
+    original module's dict, see the changes.
+    """
+
+    def __init__(self, module):
+        types.ModuleType.__init__(self, module.__name__)
+        object.__setattr__(self, '_original_module', module)
+
+    def __getattribute__(self, name):
+        module = object.__getattribute__(self, '_original_module')
+        try:
+            return getattr(module, name)
+        except AttributeError:
+            if name in CONFIG_NAMES:
+                return getattr(get_config(), name)
+            raise
+
+    def __setattr__(self, name, value):
+        module = object.__getattribute__(self, '_original_module')
+        setattr(module, name, value)
+
+    def __delattr__(self, name):
+        module = object.__getattribute__(self, '_original_module')
+        delattr(module, name)
+
+def install_lazy_config(module_name):
+    """Make config constants of an imported module load on first access."""
+    sys.modules[module_name] = LazyConfigModule(sys.modules[module_name])
+
+### Caching of rpc results ###
+
+class RpcCache(object):
+    """
+    Cache of rpc results, keyed by the repo they are about, so that they
+    can be dropped when the repo is changed.
+
+    Lookups first go to a per-request memo, which is only used between
+    `begin_request()` and `end_request()` in the calling thread. Then they
+    go to a process wide LRU cache, whose entries expire after `ttl`
+    seconds. The process wide cache is disabled while `max_size` is 0,
+    which is the default.
+
+    Group membership changes made through `ccnet_threaded_rpc` drop the
+    cached `check_permission` results. Changes made by other processes are
+    not seen until the entries expire.
+    """
+
+    def __init__(self, max_size=0, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict() # key -> (expire_time, value)
+        self._repo_keys = {}          # repo_id -> set of keys
+        self._stats = {}              # rpc name -> [hits, misses]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def configure(self, max_size=None, ttl=None):
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if ttl is not None:
+                self.ttl = ttl
+            self._entries.clear()
+            self._repo_keys.clear()
+
+    def begin_request(self):
+        self._local.memo = {}
+
+    def end_request(self):
+        self._local.memo = None
+
+    def call(self, name, repo_id, func, *args):
+        """
+        Return the cached result of rpc `name` with `args`, or call
+        `func(*args)` and cache its result. Errors are not cached.
+        """
+        return self._call(True, name, repo_id, func, args)
+
+    def call_in_request(self, name, repo_id, func, *args):
+        """
+        Like `call()`, but only use the per-request memo, for results that
+        may change without a call through seaserv.
+        """
+        return self._call(False, name, repo_id, func, args)
+
+    def _call(self, shared, name, repo_id, func, args):
+        key = (repo_id, name, args)
+        memo = getattr(self._local, 'memo', None)
+        if memo is not None and key in memo:
+            self._count(name, True)
+            return memo[key]
+
+        found, value = False, None
+        if shared:
+            found, value = self._lookup(key)
+        self._count(name, found)
+        if not found:
+            value = func(*args)
+            if shared:
+                self._store(key, value)
+
+        if memo is not None:
+            memo[key] = value
+        return value
+
+    def invalidate_repo(self, repo_id):
+        memo = getattr(self._local, 'memo', None)
+        if memo:
+            for key in [ k for k in memo if k[0] == repo_id ]:
+                del memo[key]
+
+        with self._lock:
+            for key in self._repo_keys.pop(repo_id, ()):
+                self._entries.pop(key, None)
+
+    def invalidate_rpc(self, name):
+        """Drop the cached results of rpc `name` for all repos."""
+        memo = getattr(self._local, 'memo', None)
+        if memo:
+            for key in [ k for k in memo if k[1] == name ]:
+                del memo[key]
+
+        with self._lock:
+            for key in [ k for k in self._entries if k[1] == name ]:
+                del self._entries[key]
+                self._unindex(key)
+
+    def stats(self):
+        """
+        Return a dict of rpc name -> {'hits': n, 'misses': n}, plus the
+        totals of all rpcs under 'total'.
+        """
+        ret = {}
+        hits = misses = 0
+        with self._lock:
+            for name, (h, m) in self._stats.iteritems():
+                ret[name] = { 'hits': h, 'misses': m }
+                hits += h
+                misses += m
+        ret['total'] = { 'hits': hits, 'misses': misses }
+        return ret
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+    def _count(self, name, hit):
+        with self._lock:
+            counter = self._stats.setdefault(name, [0, 0])
+            counter[0 if hit else 1] += 1
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False, None
+            if entry[0] < time.time():
+                self._unindex(key)
+                return False, None
+            # Re-insert to mark it as the most recently used.
+            self._entries[key] = entry
+            return True, entry[1]
+
+    def _store(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._repo_keys.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_size:
+                old_key, _ = self._entries.popitem(last=False)
+                self._unindex(old_key)
+
+    def _unindex(self, key):
+        keys = self._repo_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._repo_keys[key[0]]
+
+rpc_cache = RpcCache()
 
 #### Basic ccnet API ####
 
@@ -179,17 +497,20 @@ def get_group(group_id):
 def get_personal_groups(start, limit):
     try:
         groups_all = ccnet_threaded_rpc.get_all_groups(start, limit)
+        org_ids = get_org_ids_by_groups([ x.id for x in groups_all ])
     except SearpcError:
         return []
-    return [ x for x in groups_all if not is_org_group(x.id) ]
+
+    return [ x for x in groups_all if org_ids[x.id] < 0 ]
 
 def get_personal_groups_by_user(email):
     try:
         groups_all = ccnet_threaded_rpc.get_groups(email)
+        org_ids = get_org_ids_by_groups([ x.id for x in groups_all ])
     except SearpcError:
         return []
 
-    return [ x for x in groups_all if not is_org_group(x.id) ]
+    return [ x for x in groups_all if org_ids[x.id] < 0 ]
     
 # group user
 def is_group_user(group_id, user):
@@ -239,6 +560,18 @@ def get_org_id_by_group(group_id):
         org_id = -1
     return org_id
 
+def get_org_ids_by_groups(group_ids):
+    """
+    Return a dict of group id -> org id of the group, -1 for groups not in
+    any org, with one rpc. Raises SearpcError if the rpc fails.
+    """
+    if not group_ids:
+        return {}
+
+    org_ids = json.loads(seafserv_threaded_rpc.get_org_ids_by_groups(
+        json.dumps(list(group_ids))))
+    return dict(zip(group_ids, org_ids))
+
 def get_org_groups(org_id, start, limit):
     try:
         groups = ccnet_threaded_rpc.get_org_groups(org_id, start, limit)
@@ -252,10 +585,11 @@ def get_org_groups_by_user(org_id, user):
     """
     try:
         groups_all = ccnet_threaded_rpc.get_groups(user)
+        org_ids = get_org_ids_by_groups([ x.id for x in groups_all ])
     except SearpcError:
         return []
 
-    return [ x for x in groups_all if org_id == get_org_id_by_group(x.id) ]
+    return [ x for x in groups_all if org_ids[x.id] == org_id ]
     
 # org
 def create_org(org_name, url_prefix, username):
@@ -333,6 +667,7 @@ def get_user_current_org(user, url_prefix):
     return None
 
 def send_command(command):
+    pool = get_pool()
     client = pool.get_client()
     client.send_cmd(command)
     ret = client.response[2]
@@ -340,6 +675,7 @@ def send_command(command):
     return ret
 
 def send_message(msg_type, content):
+    pool = get_pool()
     client = pool.get_client()
     client.send_message(msg_type, content)
     pool.return_client(client)
@@ -379,6 +715,7 @@ def edit_repo(repo_id, name, desc, user):
         ret = seafserv_threaded_rpc.edit_repo(repo_id, name, desc, user)
     except SearpcError, e:
         ret = -1
+    rpc_cache.invalidate_repo(repo_id)
     return True if ret == 0 else False
 
 def create_repo(name, desc, user, passwd):
@@ -401,6 +738,7 @@ def remove_repo(repo_id):
     except SearpcError, e:
         logger.error(e)
         ret = -1
+    rpc_cache.invalidate_repo(repo_id)
     return True if ret == 0 else False
 
 def list_personal_repos_by_owner(owner):
@@ -421,7 +759,8 @@ def get_repo_owner(repo_id):
     Get owner of a repo.
     """
     try:
-        ret = seafserv_threaded_rpc.get_repo_owner(repo_id)
+        ret = rpc_cache.call('get_repo_owner', repo_id,
+                             seafserv_threaded_rpc.get_repo_owner, repo_id)
     except SearpcError:
         ret = ''
     return ret
@@ -431,7 +770,8 @@ def is_repo_owner(user, repo_id):
     Check whether user is repo owner.
     """
     try:
-        ret = seafserv_threaded_rpc.is_repo_owner(user, repo_id)
+        ret = rpc_cache.call('is_repo_owner', repo_id,
+                             seafserv_threaded_rpc.is_repo_owner, user, repo_id)
     except SearpcError:
         ret = 0
     return ret
@@ -487,7 +827,9 @@ def get_org_id_by_repo_id(repo_id):
     Get org id according repo id.
     """
     try:
-        org_id = seafserv_threaded_rpc.get_org_id_by_repo_id(repo_id)
+        org_id = rpc_cache.call('get_org_id_by_repo_id', repo_id,
+                                seafserv_threaded_rpc.get_org_id_by_repo_id,
+                                repo_id)
     except SearpcError:
         org_id = -1
     return org_id
@@ -548,21 +890,10 @@ def get_group_repos_by_owner(user):
 
 def get_shared_groups_by_repo(repo_id):
     try:
-        group_ids = seafserv_threaded_rpc.get_shared_groups_by_repo(repo_id)
+        return seafserv_threaded_rpc.list_groups_by_repo(repo_id)
     except SearpcError:
-        group_ids = ''
-    if not group_ids:
         return []
 
-    groups = []
-    for group_id in group_ids.split('\n'):
-        if not group_id:
-            continue
-        group = get_group(group_id)
-        if group:
-            groups.append(group)
-    return groups
-
 def conv_repoids_to_list(repo_ids):
     """
     Convert repo ids seperated by "\n" to list.
@@ -586,32 +917,32 @@ def get_group_repoids(group_id):
 
     return conv_repoids_to_list(repo_ids)
 
-def get_group_repos(group_id, user):
-    """Get repos of a given group id."""
-    repoid_list = get_group_repoids(group_id)
-
-    repos = []
-    for repo_id in repoid_list:
-        if not repo_id:
-            continue
-        repo = get_repo(repo_id)
-        if not repo:
-            continue
-
-        repo.owner = seafserv_threaded_rpc.get_group_repo_owner(repo_id)
+def conv_group_repos(repos, user):
+    """
+    Set `owner`, `permission`, `share_from_me` and `latest_modify` on the
+    repo objects returned by `get_group_repos` and `get_org_group_repos`
+    rpc.
+    """
+    for repo in repos:
+        repo.owner = repo.shared_email
+        repo.permission = repo.share_permission
         repo.share_from_me = True if user == repo.owner else False
+        repo.latest_modify = repo.last_modify
+    return repos
 
-        last_commit = get_commits(repo.id, 0, 1)[0]
-        repo.latest_modify = last_commit.ctime if last_commit else None
+def get_group_repos(group_id, user):
+    """Get repos of a given group id, sorted by last modified time."""
+    try:
+        repos = seafserv_threaded_rpc.get_group_repos(int(group_id))
+    except SearpcError:
+        return []
 
-        repos.append(repo)
-    repos.sort(lambda x, y: cmp(y.latest_modify, x.latest_modify))
-    
-    return repos
+    return conv_group_repos(repos, user)
 
 # org group repo
 def del_org_group_repo(repo_id, org_id, group_id):
     seafserv_threaded_rpc.del_org_group_repo(repo_id, org_id, group_id)
+    rpc_cache.invalidate_repo(repo_id)
 
 def get_org_group_repoids(org_id, group_id):
     try:
@@ -622,49 +953,19 @@ def get_org_group_repoids(org_id, group_id):
     return conv_repoids_to_list(repo_ids)
 
 def get_org_group_repos(org_id, group_id, user):
-    """Get org repos of a given group id."""
-    repoid_list = get_org_group_repoids(org_id, group_id)
-    if not repoid_list:
+    """Get org repos of a given group id, sorted by last modified time."""
+    try:
+        repos = seafserv_threaded_rpc.get_org_group_repos(org_id, int(group_id))
+    except SearpcError:
         return []
-    
-    repos = []
-    for repo_id in repoid_list:
-        if not repo_id:
-            continue
-        repo = get_repo(repo_id)
-        if not repo:
-            continue
-
-        repo.owner = seafserv_threaded_rpc.get_org_group_repo_owner(org_id,
-                                                                    group_id,
-                                                                    repo_id)
-        repo.sharecd_from_me = True if user == repo.owner else False
 
-        last_commit = get_commits(repo.id, 0, 1)[0]
-        repo.latest_modify = last_commit.ctime if last_commit else None
-
-        repos.append(repo)
-    repos.sort(lambda x, y: cmp(y.latest_modify, x.latest_modify))
-    
-    return repos
+    return conv_group_repos(repos, user)
 
 def get_org_groups_by_repo(org_id, repo_id):
     try:
-        group_ids = seafserv_threaded_rpc.get_org_groups_by_repo(org_id,
-                                                                 repo_id)
+        return seafserv_threaded_rpc.list_org_groups_by_repo(org_id, repo_id)
     except SearpcError:
-        group_ids = ''
-    if not group_ids:
         return []
-
-    groups = []
-    for group_id in group_ids.split('\n'):
-        if not group_id:
-            continue
-        group = get_group(group_id)
-        if group:
-            groups.append(group)
-    return groups
     
 # inner pub repo
 def list_inner_pub_repos_by_owner(user):
@@ -713,6 +1014,7 @@ def is_inner_pub_repo(repo_id):
 
 def unset_inner_pub_repo(repo_id):
     seafserv_threaded_rpc.unset_inner_pub_repo(repo_id)
+    rpc_cache.invalidate_repo(repo_id)
         
 # org inner pub repo
 def list_org_inner_pub_repos(org_id, username, start=None, limit=None):
@@ -738,7 +1040,9 @@ def check_permission(repo_id, user):
     Return values can be 'rw' or 'r' or None.
     """
     try:
-        ret = seafserv_threaded_rpc.check_permission(repo_id, user)
+        ret = rpc_cache.call('check_permission', repo_id,
+                             seafserv_threaded_rpc.check_permission,
+                             repo_id, user)
     except SearpcError:
         ret = None
     return ret
@@ -748,7 +1052,8 @@ def is_personal_repo(repo_id):
     Check whether repo is personal repo.
     """
     try:
-        owner = seafserv_threaded_rpc.get_repo_owner(repo_id)
+        owner = rpc_cache.call('get_repo_owner', repo_id,
+                               seafserv_threaded_rpc.get_repo_owner, repo_id)
     except SearpcError:
         owner = ''
     return True if owner else False
@@ -764,10 +1069,13 @@ def list_share_repos(user, share_type, start, limit):
 
 def remove_share(repo_id, from_user, to_user):
     seafserv_threaded_rpc.remove_share(repo_id, from_user, to_user)
+    rpc_cache.invalidate_repo(repo_id)
 
 def unshare_group_repo(repo_id, group_id, from_user):
-    return seafserv_threaded_rpc.group_unshare_repo(repo_id, int(group_id),
-                                                    from_user)
+    ret = seafserv_threaded_rpc.group_unshare_repo(repo_id, int(group_id),
+                                                   from_user)
+    rpc_cache.invalidate_repo(repo_id)
+    return ret
         
 def list_personal_shared_repos(user, user_type, start, limit):
     """
@@ -860,38 +1168,61 @@ def get_file_id_by_path(repo_id, path):
         ret = ''
     return ret
 
+def conv_users_to_list(users):
+    """
+    Convert user names seperated by "\n" to list.
+    """
+    if not users:
+        return []
+    return [ x for x in users.split("\n") if x ]
+
+def add_related_users(users, seen, new_users):
+    for user in new_users:
+        if user not in seen:
+            seen.add(user)
+            users.append(user)
+
 def get_related_users_by_repo(repo_id):
     """Give a repo id, returns a list of users of:
     - the repo owner
     - members of groups to which the repo is shared
     - users to which the repo is shared
     """
+    try:
+        return conv_users_to_list(
+            seafserv_threaded_rpc.get_related_users_by_repo(repo_id))
+    except SearpcError, e:
+        logger.warning(e)
+
+    # Compute it here if the server failed to.
     owner = seafserv_threaded_rpc.get_repo_owner(repo_id)
     if not owner:
         # Can't happen
         return []
 
     users = [owner]
+    seen = set(users)
 
-    groups = get_shared_groups_by_repo(repo_id)
-
-    for group in groups:
-        members = get_group_members(group.id)
-        for member in members:
-            if member.user_name not in users:
-                users.append(member.user_name)
+    for group in get_shared_groups_by_repo(repo_id):
+        add_related_users(users, seen,
+                          [ x.user_name for x in get_group_members(group.id) ])
 
     share_repos = list_share_repos(owner, 'from_email', -1, -1)
-    for repo in share_repos:
-        if repo.repo_id == repo_id:
-            if repo.user not in users:
-                users.append(repo.user)
+    add_related_users(users, seen,
+                      [ x.user for x in share_repos if x.repo_id == repo_id ])
 
     return users
 
 def get_related_users_by_org_repo(org_id, repo_id):
     """Org version of get_related_users_by_repo
     """
+    try:
+        return conv_users_to_list(
+            seafserv_threaded_rpc.get_related_users_by_org_repo(org_id, repo_id))
+    except SearpcError, e:
+        logger.warning(e)
+
+    # Compute it here if the server failed to.
     owner = get_org_repo_owner(repo_id)
 
     if not owner:
@@ -899,22 +1230,16 @@ def get_related_users_by_org_repo(org_id, repo_id):
         return []
 
     users = [owner]
+    seen = set(users)
 
-    groups = get_org_groups_by_repo(org_id, repo_id)
-
-    for group in groups:
-        members = get_group_members(group.id)
-        for member in members:
-            if member.user_name not in users:
-                users.append(member.user_name)
+    for group in get_org_groups_by_repo(org_id, repo_id):
+        add_related_users(users, seen,
+                          [ x.user_name for x in get_group_members(group.id) ])
 
     share_repos = seafserv_threaded_rpc.list_org_share_repos(org_id, \
                                         owner, 'from_email', -1, -1)
-
-    for repo in share_repos:
-        if repo.repo_id == repo_id:
-            if repo.user not in users:
-                users.append(repo.user)
+    add_related_users(users, seen,
+                      [ x.user for x in share_repos if x.repo_id == repo_id ])
 
     return users
 
@@ -950,6 +1275,19 @@ def get_user_share_usage(user):
         logger.error(e)
         ret = 0
     return ret
+
+def get_users_quota_usage(users):
+    """
+    Return a list of objects with quota, usage and share usage of `users`.
+    """
+    if not users:
+        return []
+    try:
+        ret = seafserv_threaded_rpc.get_users_quota_usage('\n'.join(users))
+    except SearpcError, e:
+        logger.error(e)
+        ret = []
+    return ret
     
 # access token
 def web_get_access_token(repo_id, obj_id, op, username):
@@ -971,11 +1309,16 @@ def unset_repo_passwd(repo_id, user):
         ret = seafserv_threaded_rpc.unset_passwd(repo_id, user)
     except SearpcError, e:
         ret = -1
+    rpc_cache.invalidate_repo(repo_id)
     return ret
 
 def is_passwd_set(repo_id, user):
     try:
-        ret = seafserv_rpc.is_passwd_set(repo_id, user)
+        # The password expires on the server, so the result is only kept
+        # for the current request.
+        ret = rpc_cache.call_in_request('is_passwd_set', repo_id,
+                                        seafserv_rpc.is_passwd_set,
+                                        repo_id, user)
     except SearpcError, e:
         ret = -1
     return True if ret == 1 else False
@@ -994,3 +1337,5 @@ def set_repo_history_limit(repo_id, days):
     except SearpcError, e:
         ret = -1
     return ret
+
+install_lazy_config(__name__)
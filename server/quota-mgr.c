@@ -12,6 +12,8 @@
 #include "seaf-db.h"
 #include "quota-mgr.h"
 
+#define DEFAULT_SHARE_COUNT_TTL 3600 /* seconds */
+
 static gint64
 get_default_quota (GKeyFile *config)
 {
@@ -37,6 +39,11 @@ seaf_quota_manager_new (struct _SeafileSession *session)
     mgr->calc_share_usage = g_key_file_get_boolean (session->config,
                                                     "quota", "calc_share_usage",
                                                     NULL);
+    mgr->share_count_ttl = g_key_file_get_integer (session->config,
+                                                   "quota", "share_count_ttl",
+                                                   NULL);
+    if (mgr->share_count_ttl <= 0)
+        mgr->share_count_ttl = DEFAULT_SHARE_COUNT_TTL;
 
     return mgr;
 }
@@ -64,6 +71,11 @@ seaf_quota_manager_init (SeafQuotaManager *mgr)
         if (seaf_db_query (db, sql) < 0)
             return -1;
 
+        sql = "CREATE TABLE IF NOT EXISTS RepoShareCount (repo_id CHAR(37) PRIMARY KEY,"
+            "n_shared_to INTEGER, version BIGINT, update_time BIGINT)";
+        if (seaf_db_query (db, sql) < 0)
+            return -1;
+
         break;
     case SEAF_DB_TYPE_SQLITE:
         sql = "CREATE TABLE IF NOT EXISTS UserQuota (user VARCHAR(255) PRIMARY KEY,"
@@ -81,6 +93,11 @@ seaf_quota_manager_init (SeafQuotaManager *mgr)
         if (seaf_db_query (db, sql) < 0)
             return -1;
 
+        sql = "CREATE TABLE IF NOT EXISTS RepoShareCount (repo_id CHAR(37) PRIMARY KEY,"
+            "n_shared_to INTEGER, version BIGINT, update_time BIGINT)";
+        if (seaf_db_query (db, sql) < 0)
+            return -1;
+
         break;
     case SEAF_DB_TYPE_MYSQL:
         sql = "CREATE TABLE IF NOT EXISTS UserQuota (user VARCHAR(255) PRIMARY KEY,"
@@ -99,6 +116,11 @@ seaf_quota_manager_init (SeafQuotaManager *mgr)
         if (seaf_db_query (db, sql) < 0)
             return -1;
 
+        sql = "CREATE TABLE IF NOT EXISTS RepoShareCount (repo_id CHAR(37) PRIMARY KEY,"
+            "n_shared_to INTEGER, version BIGINT, update_time BIGINT) ENGINE=INNODB";
+        if (seaf_db_query (db, sql) < 0)
+            return -1;
+
         break;
     }
 
@@ -338,35 +360,94 @@ seaf_quota_manager_get_user_usage (SeafQuotaManager *mgr, const char *user)
     return ret;
 }
 
+/*
+ * Share usage of a user is the sum of size * n_shared_to over the user's
+ * repos, where n_shared_to is the number of distinct users (other than the
+ * owner) a repo is shared to, either personally or through a group.
+ *
+ * n_shared_to is persisted in the RepoShareCount table. A repo's count is
+ * invalidated (set to -1) whenever its shares, its owner or the members of
+ * a group it is shared to change, and is recomputed on the next share usage
+ * query. So a quota check only has to recount the few repos that changed
+ * since the last check, instead of every shared repo of the user.
+ *
+ * Each invalidation increments the version of the row. A recomputed count
+ * is only saved if the version didn't change during the recompute, so that
+ * it can't overwrite an invalidation done meanwhile.
+ *
+ * Group members can also be changed through ccnet without telling us, so
+ * counts expire after share_count_ttl seconds.
+ */
+
+typedef struct {
+    SearpcClient *client;
+    /* group id -> list of member names */
+    GHashTable *group_cache;
+} ShareCountCtx;
+
+static void
+share_count_ctx_init (ShareCountCtx *ctx)
+{
+    ctx->client = NULL;
+    ctx->group_cache = g_hash_table_new_full (g_direct_hash, g_direct_equal,
+                                              NULL,
+                                              (GDestroyNotify)string_list_free);
+}
+
 static void
-count_group_members (GHashTable *user_hash, GList *members)
+share_count_ctx_destroy (ShareCountCtx *ctx)
 {
-    GList *p;
+    g_hash_table_destroy (ctx->group_cache);
+    if (ctx->client)
+        ccnet_rpc_client_free (ctx->client);
+}
+
+/* Return the names of the members of @group_id. Member lists are cached in
+ * @ctx, so that a group shared with many repos is fetched only once.
+ */
+static GList *
+get_group_member_names (ShareCountCtx *ctx, int group_id)
+{
+    GList *members, *p, *names = NULL;
     CcnetGroupUser *user;
-    const char *user_name;
-    int dummy;
 
+    names = g_hash_table_lookup (ctx->group_cache, (gpointer)(long)group_id);
+    if (names)
+        return names;
+
+    if (!ctx->client) {
+        ctx->client = ccnet_create_pooled_rpc_client (seaf->client_pool,
+                                                      NULL,
+                                                      "ccnet-threaded-rpcserver");
+        if (!ctx->client) {
+            seaf_warning ("Failed to alloc rpc client.\n");
+            return NULL;
+        }
+    }
+
+    members = ccnet_get_group_members (ctx->client, group_id);
     for (p = members; p; p = p->next) {
         user = p->data;
-        user_name = ccnet_group_user_get_user_name (user);
-        g_hash_table_insert (user_hash, g_strdup(user_name), &dummy);
-        /* seaf_debug ("Shared to %s.\n", user_name); */
+        names = g_list_prepend (names,
+                                g_strdup(ccnet_group_user_get_user_name (user)));
         g_object_unref (user);
     }
-
     g_list_free (members);
+
+    if (names)
+        g_hash_table_insert (ctx->group_cache, (gpointer)(long)group_id, names);
+    return names;
 }
 
-static gint64
-repo_share_usage (const char *user, const char *repo_id)
+/* Count the distinct users that @repo_id is shared to, except @user. */
+static int
+count_repo_shared_to (const char *user, const char *repo_id,
+                      ShareCountCtx *ctx)
 {
     GHashTable *user_hash;
     int dummy;
-    GList *personal = NULL, *groups = NULL, *members = NULL, *p;
-    SearpcClient *client = NULL;
-    gint64 usage = -1;
-
-    /* seaf_debug ("Computing share usage for repo %s.\n", repo_id); */
+    GList *personal = NULL, *groups = NULL, *members = NULL, *p, *q;
+    int n_shared_to = -1;
 
     /* If a repo is shared to both a user and a group, and that user is also
      * a member of the group, we don't want to count that user twice.
@@ -380,83 +461,292 @@ repo_share_usage (const char *user, const char *repo_id)
     for (p = personal; p; p = p->next) {
         char *email = p->data;
         g_hash_table_insert (user_hash, g_strdup(email), &dummy);
-        /* seaf_debug ("Shared to %s.\n", email); */
     }
 
     /* Then groups... */
-    client = ccnet_create_pooled_rpc_client (seaf->client_pool,
-                                             NULL,
-                                             "ccnet-threaded-rpcserver");
-    if (!client) {
-        seaf_warning ("Failed to alloc rpc client.\n");
-        goto out;
-    }
-
     groups = seaf_repo_manager_get_groups_by_repo (seaf->repo_mgr,
                                                    repo_id, NULL);
     for (p = groups; p; p = p->next) {
-        members = ccnet_get_group_members (client, (int)p->data);
+        members = get_group_member_names (ctx, (int)(long)p->data);
         if (!members) {
-            seaf_warning ("Cannot get member list for groupd %d.\n", (int)p->data);
+            seaf_warning ("Cannot get member list for groupd %d.\n",
+                          (int)(long)p->data);
             goto out;
         }
 
-        count_group_members (user_hash, members);
+        for (q = members; q; q = q->next)
+            g_hash_table_insert (user_hash, g_strdup(q->data), &dummy);
     }
 
     /* Remove myself if i'm in a group. */
     g_hash_table_remove (user_hash, user);
 
-    guint n_shared_to = g_hash_table_size(user_hash);
-    /* seaf_debug ("n_shared_to = %u.\n", n_shared_to); */
-    if (n_shared_to == 0) {
-        usage = 0;
-        goto out;
-    }
-
-    gint64 size = seaf_repo_manager_get_repo_size (seaf->repo_mgr, repo_id);
-    if (size < 0) {
-        seaf_warning ("Cannot get size of repo %s.\n", repo_id);
-        goto out;
-    }
-
-    /* share_usage = repo_size * n_shared_to */
-    usage = size * n_shared_to;
+    n_shared_to = (int)g_hash_table_size(user_hash);
 
 out:
     g_hash_table_destroy (user_hash);
     string_list_free (personal);
     g_list_free (groups);
-    ccnet_rpc_client_free (client);
-    return usage;
+    return n_shared_to;
 }
 
-gint64
-seaf_quota_manager_get_user_share_usage (SeafQuotaManager *mgr,
-                                         const char *user)
+/* Add a row with an invalid count for @repo_id, if there is none. */
+static int
+add_share_count_row (SeafDB *db, const char *repo_id)
+{
+    char sql[256];
+    gboolean db_err = FALSE;
+
+    switch (seaf_db_type(db)) {
+    case SEAF_DB_TYPE_MYSQL:
+        snprintf (sql, sizeof(sql),
+                  "INSERT IGNORE INTO RepoShareCount VALUES ('%s', -1, 0, 0)",
+                  repo_id);
+        return seaf_db_query (db, sql);
+    case SEAF_DB_TYPE_SQLITE:
+        snprintf (sql, sizeof(sql),
+                  "INSERT OR IGNORE INTO RepoShareCount VALUES ('%s', -1, 0, 0)",
+                  repo_id);
+        return seaf_db_query (db, sql);
+    default:
+        snprintf (sql, sizeof(sql),
+                  "SELECT 1 FROM RepoShareCount WHERE repo_id='%s'", repo_id);
+        if (seaf_db_check_for_existence (db, sql, &db_err))
+            return 0;
+        if (db_err)
+            return -1;
+
+        snprintf (sql, sizeof(sql),
+                  "INSERT INTO RepoShareCount VALUES ('%s', -1, 0, 0)", repo_id);
+        if (seaf_db_query (db, sql) == 0)
+            return 0;
+
+        /* The row may have been added by another thread. */
+        snprintf (sql, sizeof(sql),
+                  "SELECT 1 FROM RepoShareCount WHERE repo_id='%s'", repo_id);
+        if (seaf_db_check_for_existence (db, sql, &db_err) && !db_err)
+            return 0;
+        return -1;
+    }
+}
+
+/* Recompute and save the share count of @repo_id. Returns the count. */
+static int
+update_repo_share_count (SeafDB *db, const char *user, const char *repo_id,
+                         ShareCountCtx *ctx)
 {
-    GList *repos, *p;
+    char sql[256];
+    gint64 version;
+    int n_shared_to;
+
+    if (add_share_count_row (db, repo_id) < 0)
+        return -1;
+
+    /* Read the version before the shares, so that any change made to the
+     * shares after they are read also changes the version.
+     */
+    snprintf (sql, sizeof(sql),
+              "SELECT version FROM RepoShareCount WHERE repo_id='%s'", repo_id);
+    version = seaf_db_get_int64 (db, sql);
+    if (version < 0)
+        return -1;
+
+    n_shared_to = count_repo_shared_to (user, repo_id, ctx);
+    if (n_shared_to < 0)
+        return -1;
+
+    snprintf (sql, sizeof(sql),
+              "UPDATE RepoShareCount SET n_shared_to=%d, "
+              "update_time=%"G_GINT64_FORMAT" WHERE repo_id='%s' AND "
+              "version=%"G_GINT64_FORMAT,
+              n_shared_to, (gint64)time(NULL), repo_id, version);
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
+    return n_shared_to;
+}
+
+typedef struct {
     char *repo_id;
-    gint64 total = 0, per_repo;
+    /* -1 if the repo has no size. */
+    gint64 size;
+    /* -1 if the count has to be recomputed. */
+    int n_shared_to;
+} RepoShareInfo;
+
+typedef struct {
+    GList *infos;
+    /* Counts computed before this time have expired. */
+    gint64 expire_time;
+} CollectShareInfoData;
 
-    repos = seaf_repo_manager_get_repo_ids_by_owner (seaf->repo_mgr, user);
+static gboolean
+collect_share_info (SeafDBRow *row, void *vdata)
+{
+    CollectShareInfoData *data = vdata;
+    RepoShareInfo *info;
 
-    for (p = repos; p != NULL; p = p->next) {
-        repo_id = p->data;
-        per_repo = repo_share_usage (user, repo_id);
-        if (per_repo < 0) {
-            seaf_warning ("Failed to get repo %s share usage.\n", repo_id);
-            string_list_free (repos);
-            return -1;
+    info = g_new0 (RepoShareInfo, 1);
+    info->repo_id = g_strdup (seaf_db_row_get_column_text (row, 0));
+
+    if (seaf_db_row_get_column_text (row, 1) != NULL)
+        info->size = seaf_db_row_get_column_int64 (row, 1);
+    else
+        info->size = -1;
+
+    if (seaf_db_row_get_column_text (row, 2) != NULL &&
+        seaf_db_row_get_column_int64 (row, 3) >= data->expire_time)
+        info->n_shared_to = seaf_db_row_get_column_int (row, 2);
+    else
+        info->n_shared_to = -1;
+
+    data->infos = g_list_prepend (data->infos, info);
+    return TRUE;
+}
+
+static void
+repo_share_info_free (RepoShareInfo *info)
+{
+    g_free (info->repo_id);
+    g_free (info);
+}
+
+static gint64
+user_share_usage (SeafQuotaManager *mgr, const char *user, ShareCountCtx *ctx)
+{
+    SeafDB *db = mgr->session->db;
+    char sql[512];
+    CollectShareInfoData data;
+    RepoShareInfo *info;
+    GList *ptr;
+    int n_shared_to;
+    gint64 total = 0;
+
+    data.infos = NULL;
+    data.expire_time = (gint64)time(NULL) - mgr->share_count_ttl;
+
+    snprintf (sql, sizeof(sql),
+              "SELECT RepoOwner.repo_id, size, n_shared_to, update_time "
+              "FROM RepoOwner LEFT JOIN RepoSize "
+              "ON RepoOwner.repo_id = RepoSize.repo_id "
+              "LEFT JOIN RepoShareCount "
+              "ON RepoOwner.repo_id = RepoShareCount.repo_id "
+              "WHERE owner_id='%s'",
+              user);
+    if (seaf_db_foreach_selected_row (db, sql, collect_share_info, &data) < 0)
+        return -1;
+
+    for (ptr = data.infos; ptr; ptr = ptr->next) {
+        info = ptr->data;
+
+        n_shared_to = info->n_shared_to;
+        if (n_shared_to < 0) {
+            n_shared_to = update_repo_share_count (db, user, info->repo_id, ctx);
+            if (n_shared_to < 0) {
+                seaf_warning ("Failed to get repo %s share usage.\n",
+                              info->repo_id);
+                total = -1;
+                break;
+            }
         }
+        if (n_shared_to == 0)
+            continue;
 
-        total += per_repo;
+        if (info->size < 0) {
+            seaf_warning ("Cannot get size of repo %s.\n", info->repo_id);
+            total = -1;
+            break;
+        }
+
+        /* share_usage = repo_size * n_shared_to */
+        total += info->size * n_shared_to;
     }
 
-    string_list_free (repos);
+    g_list_free_full (data.infos, (GDestroyNotify)repo_share_info_free);
+    return total;
+}
+
+gint64
+seaf_quota_manager_get_user_share_usage (SeafQuotaManager *mgr,
+                                         const char *user)
+{
+    ShareCountCtx ctx;
+    gint64 total;
+
+    share_count_ctx_init (&ctx);
+    total = user_share_usage (mgr, user, &ctx);
+    share_count_ctx_destroy (&ctx);
+
     return total;
 }
 
+int
+seaf_quota_manager_invalidate_repo_share_count (SeafQuotaManager *mgr,
+                                                const char *repo_id)
+{
+    char sql[256];
+
+    snprintf (sql, sizeof(sql),
+              "UPDATE RepoShareCount SET n_shared_to=-1, version=version+1 "
+              "WHERE repo_id='%s'", repo_id);
+    return seaf_db_query (mgr->session->db, sql);
+}
+
+int
+seaf_quota_manager_invalidate_group_share_counts (SeafQuotaManager *mgr,
+                                                  int group_id)
+{
+    char sql[256];
+
+    snprintf (sql, sizeof(sql),
+              "UPDATE RepoShareCount SET n_shared_to=-1, version=version+1 "
+              "WHERE repo_id IN "
+              "(SELECT repo_id FROM RepoGroup WHERE group_id=%d)",
+              group_id);
+    return seaf_db_query (mgr->session->db, sql);
+}
+
+GList *
+seaf_quota_manager_get_users_quota_usage (SeafQuotaManager *mgr,
+                                          GList *users)
+{
+    ShareCountCtx ctx;
+    GList *ret = NULL, *ptr;
+    const char *user;
+    gint64 usage, share_usage;
+    SeafileUserQuotaUsage *info;
+
+    /* Users on the same page usually share groups, fetch each group once. */
+    share_count_ctx_init (&ctx);
+
+    for (ptr = users; ptr; ptr = ptr->next) {
+        user = ptr->data;
+
+        usage = seaf_quota_manager_get_user_usage (mgr, user);
+        if (usage < 0) {
+            seaf_warning ("Failed to get usage of user %s.\n", user);
+            for (ptr = ret; ptr; ptr = ptr->next)
+                g_object_unref (ptr->data);
+            g_list_free (ret);
+            ret = NULL;
+            goto out;
+        }
+        share_usage = user_share_usage (mgr, user, &ctx);
+
+        info = g_object_new (SEAFILE_TYPE_USER_QUOTA_USAGE,
+                             "user", user,
+                             "quota", seaf_quota_manager_get_user_quota (mgr, user),
+                             "usage", usage,
+                             "share_usage", share_usage,
+                             NULL);
+        ret = g_list_prepend (ret, info);
+    }
+
+out:
+    share_count_ctx_destroy (&ctx);
+    return g_list_reverse (ret);
+}
+
 gint64
 seaf_quota_manager_get_org_usage (SeafQuotaManager *mgr, int org_id)
 {
@@ -10,6 +10,8 @@ struct _SeafQuotaManager {
 
     gint64 default_quota;
     gboolean calc_share_usage;
+    /* Seconds after which saved share counts are recomputed. */
+    int share_count_ttl;
 };
 typedef struct _SeafQuotaManager SeafQuotaManager;
 
@@ -43,6 +45,20 @@ gint64
 seaf_quota_manager_get_user_share_usage (SeafQuotaManager *mgr,
                                          const char *user);
 
+/*
+ * The number of users a repo is shared to is saved to compute share usage.
+ * It must be invalidated when the shares or the owner of a repo change,
+ * or when the members of a group change. Counts also expire after
+ * [quota] share_count_ttl seconds.
+ */
+int
+seaf_quota_manager_invalidate_repo_share_count (SeafQuotaManager *mgr,
+                                                const char *repo_id);
+
+int
+seaf_quota_manager_invalidate_group_share_counts (SeafQuotaManager *mgr,
+                                                  int group_id);
+
 /* Set/get quota for a user in a business account.
  * The caller should make sure the user is a member of the organization.
  */
@@ -67,6 +83,14 @@ seaf_quota_manager_check_quota (SeafQuotaManager *mgr,
 gint64
 seaf_quota_manager_get_user_usage (SeafQuotaManager *mgr, const char *user);
 
+/*
+ * Get quota, usage and share usage of each user in @users.
+ * Returns a list of SeafileUserQuotaUsage objects in the order of @users.
+ */
+GList *
+seaf_quota_manager_get_users_quota_usage (SeafQuotaManager *mgr,
+                                          GList *users);
+
 gint64
 seaf_quota_manager_get_org_usage (SeafQuotaManager *mgr, int org_id);
 
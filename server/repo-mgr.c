@@ -428,6 +428,34 @@ remove_repo_ondisk (SeafRepoManager *mgr, const char *repo_id)
               repo_id);
     seaf_db_query (db, sql);
 
+    snprintf (sql, sizeof(sql),
+              "DELETE FROM FileLastModified WHERE repo_id = '%s'", repo_id);
+    seaf_db_query (db, sql);
+
+    snprintf (sql, sizeof(sql),
+              "DELETE FROM FileLastModifiedHead WHERE repo_id = '%s'", repo_id);
+    seaf_db_query (db, sql);
+
+    snprintf (sql, sizeof(sql),
+              "DELETE FROM FileRevision WHERE repo_id = '%s'", repo_id);
+    seaf_db_query (db, sql);
+
+    snprintf (sql, sizeof(sql),
+              "DELETE FROM FileRevisionCommit WHERE repo_id = '%s'", repo_id);
+    seaf_db_query (db, sql);
+
+    snprintf (sql, sizeof(sql),
+              "DELETE FROM FileRevisionHead WHERE repo_id = '%s'", repo_id);
+    seaf_db_query (db, sql);
+
+    snprintf (sql, sizeof(sql),
+              "DELETE FROM RepoShareCount WHERE repo_id = '%s'", repo_id);
+    seaf_db_query (db, sql);
+
+    snprintf (sql, sizeof(sql),
+              "DELETE FROM RepoFileSizeHead WHERE repo_id = '%s'", repo_id);
+    seaf_db_query (db, sql);
+
     return 0;
 }
 
@@ -694,6 +722,12 @@ create_tables_mysql (SeafRepoManager *mgr)
     if (seaf_db_query (db, sql) < 0)
         return -1;
 
+    sql = "CREATE TABLE IF NOT EXISTS RepoFileSizeHead ("
+        "repo_id CHAR(37) PRIMARY KEY, head_id CHAR(41))"
+        "ENGINE=INNODB";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
     sql = "CREATE TABLE IF NOT EXISTS RepoHistoryLimit ("
         "repo_id CHAR(37) PRIMARY KEY, days INTEGER)"
         "ENGINE=INNODB";
@@ -712,6 +746,40 @@ create_tables_mysql (SeafRepoManager *mgr)
     if (seaf_db_query (db, sql) < 0)
         return -1;
 
+    sql = "CREATE TABLE IF NOT EXISTS FileLastModified ("
+        "repo_id CHAR(37), path_id CHAR(41), parent_id CHAR(41), "
+        "name TEXT, commit_id CHAR(41), mtime BIGINT, "
+        "PRIMARY KEY (repo_id, path_id), INDEX (repo_id, parent_id))"
+        "ENGINE=INNODB";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
+    sql = "CREATE TABLE IF NOT EXISTS FileLastModifiedHead ("
+        "repo_id CHAR(37) PRIMARY KEY, commit_id CHAR(41))"
+        "ENGINE=INNODB";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
+    sql = "CREATE TABLE IF NOT EXISTS FileRevision ("
+        "repo_id CHAR(37), path_id CHAR(41), commit_id CHAR(41), "
+        "ctime BIGINT, PRIMARY KEY (repo_id, path_id, commit_id))"
+        "ENGINE=INNODB";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
+    sql = "CREATE TABLE IF NOT EXISTS FileRevisionCommit ("
+        "repo_id CHAR(37), commit_id CHAR(41), "
+        "PRIMARY KEY (repo_id, commit_id))"
+        "ENGINE=INNODB";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
+    sql = "CREATE TABLE IF NOT EXISTS FileRevisionHead ("
+        "repo_id CHAR(37) PRIMARY KEY, commit_id CHAR(41))"
+        "ENGINE=INNODB";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
     return 0;
 }
 
@@ -862,6 +930,11 @@ create_tables_sqlite (SeafRepoManager *mgr)
     if (seaf_db_query (db, sql) < 0)
         return -1;
 
+    sql = "CREATE TABLE IF NOT EXISTS RepoFileSizeHead ("
+        "repo_id CHAR(37) PRIMARY KEY, head_id CHAR(41))";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
     sql = "CREATE TABLE IF NOT EXISTS RepoHistoryLimit ("
         "repo_id CHAR(37) PRIMARY KEY, days INTEGER)";
     if (seaf_db_query (db, sql) < 0)
@@ -877,6 +950,40 @@ create_tables_sqlite (SeafRepoManager *mgr)
     if (seaf_db_query (db, sql) < 0)
         return -1;
 
+    sql = "CREATE TABLE IF NOT EXISTS FileLastModified ("
+        "repo_id CHAR(37), path_id CHAR(41), parent_id CHAR(41), "
+        "name TEXT, commit_id CHAR(41), mtime BIGINT, "
+        "PRIMARY KEY (repo_id, path_id))";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
+    sql = "CREATE INDEX IF NOT EXISTS FileLastModifiedParentIndex ON "
+        "FileLastModified (repo_id, parent_id)";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
+    sql = "CREATE TABLE IF NOT EXISTS FileLastModifiedHead ("
+        "repo_id CHAR(37) PRIMARY KEY, commit_id CHAR(41))";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
+    sql = "CREATE TABLE IF NOT EXISTS FileRevision ("
+        "repo_id CHAR(37), path_id CHAR(41), commit_id CHAR(41), "
+        "ctime BIGINT, PRIMARY KEY (repo_id, path_id, commit_id))";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
+    sql = "CREATE TABLE IF NOT EXISTS FileRevisionCommit ("
+        "repo_id CHAR(37), commit_id CHAR(41), "
+        "PRIMARY KEY (repo_id, commit_id))";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
+    sql = "CREATE TABLE IF NOT EXISTS FileRevisionHead ("
+        "repo_id CHAR(37) PRIMARY KEY, commit_id CHAR(41))";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
     return 0;
 }
 
@@ -1010,6 +1117,11 @@ create_tables_pgsql (SeafRepoManager *mgr)
     if (seaf_db_query (db, sql) < 0)
         return -1;
 
+    sql = "CREATE TABLE IF NOT EXISTS RepoFileSizeHead ("
+        "repo_id CHAR(36) PRIMARY KEY, head_id CHAR(40))";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
     sql = "CREATE TABLE IF NOT EXISTS RepoHistoryLimit ("
         "repo_id CHAR(36) PRIMARY KEY, days INTEGER)";
     if (seaf_db_query (db, sql) < 0)
@@ -1025,6 +1137,42 @@ create_tables_pgsql (SeafRepoManager *mgr)
     if (seaf_db_query (db, sql) < 0)
         return -1;
 
+    sql = "CREATE TABLE IF NOT EXISTS FileLastModified ("
+        "repo_id CHAR(36), path_id CHAR(40), parent_id CHAR(40), "
+        "name TEXT, commit_id CHAR(40), mtime BIGINT, "
+        "PRIMARY KEY (repo_id, path_id))";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
+    if (!pgsql_index_exists (db, "filelastmodified_parent_idx")) {
+        sql = "CREATE INDEX filelastmodified_parent_idx ON "
+            "FileLastModified (repo_id, parent_id)";
+        if (seaf_db_query (db, sql) < 0)
+            return -1;
+    }
+
+    sql = "CREATE TABLE IF NOT EXISTS FileLastModifiedHead ("
+        "repo_id CHAR(36) PRIMARY KEY, commit_id CHAR(40))";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
+    sql = "CREATE TABLE IF NOT EXISTS FileRevision ("
+        "repo_id CHAR(36), path_id CHAR(40), commit_id CHAR(40), "
+        "ctime BIGINT, PRIMARY KEY (repo_id, path_id, commit_id))";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
+    sql = "CREATE TABLE IF NOT EXISTS FileRevisionCommit ("
+        "repo_id CHAR(36), commit_id CHAR(40), "
+        "PRIMARY KEY (repo_id, commit_id))";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
+    sql = "CREATE TABLE IF NOT EXISTS FileRevisionHead ("
+        "repo_id CHAR(36) PRIMARY KEY, commit_id CHAR(40))";
+    if (seaf_db_query (db, sql) < 0)
+        return -1;
+
     return 0;
 }
 
@@ -1546,6 +1694,9 @@ seaf_repo_manager_set_repo_owner (SeafRepoManager *mgr,
             return -1;
     }
 
+    /* The owner is not counted in share usage. */
+    seaf_quota_manager_invalidate_repo_share_count (seaf->quota_mgr, repo_id);
+
     return 0;
 }
 
@@ -1663,6 +1814,63 @@ seaf_repo_manager_get_repo_list (SeafRepoManager *mgr, int start, int limit)
     return ret;
 }
 
+GList *
+seaf_repo_manager_get_repo_list_after (SeafRepoManager *mgr,
+                                       const char *last_repo_id,
+                                       int limit,
+                                       GError **error)
+{
+    GList *id_list, *ptr;
+    GList *ret = NULL;
+    SeafRepo *repo;
+    char sql[256];
+    char cursor[37];
+    int n_wanted, n_ids, n_repos = 0;
+
+    g_strlcpy (cursor, last_repo_id ? last_repo_id : "", sizeof(cursor));
+
+    /* Repos that fail to load are skipped, so keep reading pages until
+     * @limit repos are collected or there are no more rows.
+     */
+    while (n_repos < limit) {
+        n_wanted = limit - n_repos;
+        id_list = NULL;
+        snprintf (sql, sizeof(sql),
+                  "SELECT repo_id FROM Repo WHERE repo_id > '%s' "
+                  "ORDER BY repo_id LIMIT %d",
+                  cursor, n_wanted);
+        if (seaf_db_foreach_selected_row (mgr->seaf->db, sql,
+                                          collect_repo_id, &id_list) < 0) {
+            g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL,
+                         "Failed to get repo list");
+            string_list_free (id_list);
+            for (ptr = ret; ptr; ptr = ptr->next)
+                seaf_repo_unref ((SeafRepo *)ptr->data);
+            g_list_free (ret);
+            return NULL;
+        }
+
+        id_list = g_list_reverse (id_list);
+        n_ids = 0;
+        for (ptr = id_list; ptr; ptr = ptr->next) {
+            char *repo_id = ptr->data;
+            g_strlcpy (cursor, repo_id, sizeof(cursor));
+            ++n_ids;
+            repo = seaf_repo_manager_get_repo (mgr, repo_id);
+            if (repo != NULL) {
+                ret = g_list_prepend (ret, repo);
+                ++n_repos;
+            }
+        }
+        string_list_free (id_list);
+
+        if (n_ids < n_wanted)
+            break;
+    }
+
+    return g_list_reverse (ret);
+}
+
 GList *
 seaf_repo_manager_get_repo_ids_by_owner (SeafRepoManager *mgr,
                                          const char *email)
@@ -1751,6 +1959,8 @@ seaf_repo_manager_add_group_repo (SeafRepoManager *mgr,
     if (seaf_db_query (mgr->seaf->db, sql) < 0)
         return -1;
 
+    seaf_quota_manager_invalidate_repo_share_count (seaf->quota_mgr, repo_id);
+
     return 0;
 }
 
@@ -1765,7 +1975,12 @@ seaf_repo_manager_del_group_repo (SeafRepoManager *mgr,
     snprintf (sql, sizeof(sql), "DELETE FROM RepoGroup WHERE group_id=%d "
               "AND repo_id='%s'", group_id, repo_id);
 
-    return seaf_db_query (mgr->seaf->db, sql);
+    if (seaf_db_query (mgr->seaf->db, sql) < 0)
+        return -1;
+
+    seaf_quota_manager_invalidate_repo_share_count (seaf->quota_mgr, repo_id);
+
+    return 0;
 }
 
 static gboolean
@@ -1938,6 +2153,91 @@ fill_in_repo_info (GList *shared_repos)
     }
 }
 
+static gint
+cmp_repo_last_modify (gconstpointer a, gconstpointer b)
+{
+    int mtime_a = seafile_repo_get_last_modify ((SeafileRepo *)a);
+    int mtime_b = seafile_repo_get_last_modify ((SeafileRepo *)b);
+
+    /* Most recently modified first. */
+    return mtime_b - mtime_a;
+}
+
+/*
+ * Convert the shared repos of a group to SeafileRepo objects, filled in
+ * as seafile_get_repo() does. The owner is set in "shared_email", the
+ * permission in "share_permission" and the head commit time in
+ * "last_modify". Repos whose head commit can't be loaded are dropped,
+ * and the result is sorted by last modification time.
+ */
+static GList *
+convert_and_sort_group_repos (GList *shared_repos)
+{
+    SeafileSharedRepo *srepo;
+    SeafileRepo *ret_repo;
+    GList *ptr, *ret = NULL;
+    SeafRepo *repo = NULL;
+    SeafCommit *commit = NULL;
+
+    for (ptr = shared_repos; ptr; ptr = ptr->next) {
+        srepo = ptr->data;
+        repo = seaf_repo_manager_get_repo (seaf->repo_mgr,
+                                           seafile_shared_repo_get_repo_id(srepo));
+        if (!repo)
+            continue;
+        commit = seaf_commit_manager_get_commit (seaf->commit_mgr,
+                                                 repo->head->commit_id);
+        if (!commit) {
+            seaf_repo_unref (repo);
+            continue;
+        }
+
+        ret_repo = seafile_repo_new ();
+        g_object_set (ret_repo, "id", repo->id, "name", repo->name,
+                      "desc", repo->desc, "encrypted", repo->encrypted,
+                      "magic", repo->magic,
+                      "head_branch", repo->head->name,
+                      "head_cmmt_id", repo->head->commit_id,
+                      "last_modify", commit->ctime,
+                      "shared_email", seafile_shared_repo_get_user (srepo),
+                      "share_permission",
+                      seafile_shared_repo_get_permission (srepo),
+                      NULL);
+        seaf_repo_unref (repo);
+        seaf_commit_unref (commit);
+
+        ret = g_list_prepend (ret, ret_repo);
+    }
+
+    for (ptr = shared_repos; ptr; ptr = ptr->next)
+        g_object_unref (ptr->data);
+    g_list_free (shared_repos);
+
+    return g_list_sort (ret, cmp_repo_last_modify);
+}
+
+GList *
+seaf_repo_manager_get_repos_by_group (SeafRepoManager *mgr,
+                                      int group_id,
+                                      GError **error)
+{
+    char sql[512];
+    GList *repos = NULL;
+
+    snprintf (sql, sizeof(sql), "SELECT repo_id, group_id, user_name, permission "
+              "FROM RepoGroup WHERE group_id = %d", group_id);
+    if (seaf_db_foreach_selected_row (mgr->seaf->db, sql, get_group_repos_cb,
+                                      &repos) < 0) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL,
+                     "DB error when get repos of group %d", group_id);
+        for (; repos; repos = g_list_delete_link (repos, repos))
+            g_object_unref (repos->data);
+        return NULL;
+    }
+
+    return convert_and_sort_group_repos (repos);
+}
+
 GList *
 seaf_repo_manager_get_group_repos_by_owner (SeafRepoManager *mgr,
                                             const char *owner,
@@ -1995,6 +2295,9 @@ seaf_repo_manager_remove_group_repos (SeafRepoManager *mgr,
 {
     char sql[512];
 
+    /* Must be done before the repos are removed from RepoGroup. */
+    seaf_quota_manager_invalidate_group_share_counts (seaf->quota_mgr, group_id);
+
     if (!owner) {
         snprintf (sql, sizeof(sql), "DELETE FROM RepoGroup WHERE group_id=%d",
                   group_id);
@@ -2453,6 +2756,30 @@ seaf_repo_manager_get_org_group_repos_by_owner (SeafRepoManager *mgr,
     return g_list_reverse (repos);
 }
 
+GList *
+seaf_repo_manager_get_org_repos_by_group (SeafRepoManager *mgr,
+                                          int org_id,
+                                          int group_id,
+                                          GError **error)
+{
+    char sql[512];
+    GList *repos = NULL;
+
+    snprintf (sql, sizeof(sql), "SELECT repo_id, group_id, owner, permission "
+              "FROM OrgGroupRepo WHERE org_id = %d AND group_id = %d",
+              org_id, group_id);
+    if (seaf_db_foreach_selected_row (mgr->seaf->db, sql, get_group_repos_cb,
+                                      &repos) < 0) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL,
+                     "DB error when get repos of org group %d", group_id);
+        for (; repos; repos = g_list_delete_link (repos, repos))
+            g_object_unref (repos->data);
+        return NULL;
+    }
+
+    return convert_and_sort_group_repos (repos);
+}
+
 /* Org inner public repos */
 
 int
@@ -127,6 +127,17 @@ seaf_repo_manager_repo_exists_prefix (SeafRepoManager *manager, const gchar *id)
 GList* 
 seaf_repo_manager_get_repo_list (SeafRepoManager *mgr, int start, int limit);
 
+/*
+ * Return at most @limit repos whose ids are greater than @last_repo_id,
+ * ordered by repo id. Pass "" or NULL as @last_repo_id to start from the
+ * first repo. Returns NULL and sets @error on database errors.
+ */
+GList *
+seaf_repo_manager_get_repo_list_after (SeafRepoManager *mgr,
+                                       const char *last_repo_id,
+                                       int limit,
+                                       GError **error);
+
 GList *
 seaf_repo_manager_get_repo_id_list (SeafRepoManager *mgr);
 
@@ -258,6 +269,20 @@ seaf_repo_manager_post_multi_files (SeafRepoManager *mgr,
                                     const char *user,
                                     GError **error);
 
+/*
+ * Like seaf_repo_manager_post_multi_files(), but the files have been
+ * indexed by the caller, e.g. while they were uploaded.
+ * @file_ids_json: json array of file ids
+ */
+int
+seaf_repo_manager_post_indexed_files (SeafRepoManager *mgr,
+                                      const char *repo_id,
+                                      const char *parent_dir,
+                                      const char *filenames_json,
+                                      const char *file_ids_json,
+                                      const char *user,
+                                      GError **error);
+
 int
 seaf_repo_manager_post_empty_file (SeafRepoManager *mgr,
                                    const char *repo_id,
@@ -292,6 +317,20 @@ seaf_repo_manager_put_file (SeafRepoManager *mgr,
                             char **new_file_id,                            
                             GError **error);
 
+/* Like seaf_repo_manager_put_file(), but @file_id has been indexed by
+ * the caller.
+ */
+int
+seaf_repo_manager_put_indexed_file (SeafRepoManager *mgr,
+                                    const char *repo_id,
+                                    const char *file_id,
+                                    const char *parent_dir,
+                                    const char *file_name,
+                                    const char *user,
+                                    const char *head_id,
+                                    char **new_file_id,
+                                    GError **error);
+
 int
 seaf_repo_manager_del_file (SeafRepoManager *mgr,
                             const char *repo_id,
@@ -475,6 +514,18 @@ seaf_repo_manager_get_group_repos_by_owner (SeafRepoManager *mgr,
                                             const char *owner,
                                             GError **error);
 
+/*
+ * Return repos shared to @group_id as SeafileRepo objects, filled in as
+ * seafile_get_repo() does, with the owner in "shared_email", the
+ * permission in "share_permission" and the head commit time in
+ * "last_modify". The list is sorted by last modification time, newest
+ * first.
+ */
+GList *
+seaf_repo_manager_get_repos_by_group (SeafRepoManager *mgr,
+                                      int group_id,
+                                      GError **error);
+
 int
 seaf_repo_manager_remove_group_repos (SeafRepoManager *mgr,
                                       int group_id,
@@ -596,6 +647,13 @@ seaf_repo_manager_get_org_group_repos_by_owner (SeafRepoManager *mgr,
                                                 const char *owner,
                                                 GError **error);
 
+/* Like seaf_repo_manager_get_repos_by_group(), for org groups. */
+GList *
+seaf_repo_manager_get_org_repos_by_group (SeafRepoManager *mgr,
+                                          int org_id,
+                                          int group_id,
+                                          GError **error);
+
 /* Org inner public repos */
 
 int
@@ -3,6 +3,7 @@
 #include "common.h"
 
 #include <glib/gstdio.h>
+#include <pthread.h>
 
 #include <json-glib/json-glib.h>
 #include <openssl/sha.h>
@@ -750,6 +751,47 @@ json_to_file_list (const char *files_json)
     return files;
 }
 
+/* Add the files to parent dir and commit. */
+static int
+post_files_and_gen_commit (const char *repo_id,
+                           SeafCommit *head_commit,
+                           const char *canon_path,
+                           GList *filenames,
+                           GList *id_list,
+                           const char *user,
+                           GError **error)
+{
+    GString *buf = g_string_new (NULL);
+    char *root_id = NULL;
+    int ret = 0;
+
+    root_id = do_post_multi_files (head_commit->root_id, canon_path,
+                                   filenames, id_list);
+    if (!root_id) {
+        seaf_warning ("[post file] Failed to put file.\n");
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_INTERNAL,
+                     "Failed to put file");
+        ret = -1;
+        goto out;
+    }
+
+    guint len = g_list_length (filenames);
+    if (len > 1)
+        g_string_printf (buf, "Added \"%s\" and %u more files.",
+                         (char *)(filenames->data), len - 1);
+    else
+        g_string_printf (buf, "Added \"%s\".", (char *)(filenames->data));
+
+    if (gen_new_commit (repo_id, head_commit, root_id,
+                        user, buf->str, error) < 0)
+        ret = -1;
+
+out:
+    g_string_free (buf, TRUE);
+    g_free (root_id);
+    return ret;
+}
+
 int
 seaf_repo_manager_post_multi_files (SeafRepoManager *mgr,
                                     const char *repo_id,
@@ -765,8 +807,6 @@ seaf_repo_manager_post_multi_files (SeafRepoManager *mgr,
     GList *filenames = NULL, *paths = NULL, *id_list = NULL, *ptr;
     char *filename, *path;
     unsigned char sha1[20];
-    GString *buf = g_string_new (NULL);
-    char *root_id = NULL;
     SeafileCrypt *crypt = NULL;
     char hex[41];
     int ret = 0;
@@ -836,26 +876,93 @@ seaf_repo_manager_post_multi_files (SeafRepoManager *mgr,
     }
     id_list = g_list_reverse (id_list);
 
-    /* Add the files to parent dir and commit. */
-    root_id = do_post_multi_files (head_commit->root_id, canon_path,
-                                   filenames, id_list);
-    if (!root_id) {
-        seaf_warning ("[post file] Failed to put file.\n");
-        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_INTERNAL,
-                     "Failed to put file");
+    if (post_files_and_gen_commit (repo_id, head_commit, canon_path,
+                                   filenames, id_list, user, error) < 0)
+        ret = -1;
+
+out:
+    if (repo)
+        seaf_repo_unref (repo);
+    if (head_commit)
+        seaf_commit_unref(head_commit);
+    string_list_free (filenames);
+    string_list_free (paths);
+    string_list_free (id_list);
+    g_free (canon_path);
+    g_free (crypt);
+
+    if (ret == 0)
+        update_repo_size(repo_id);
+
+    return ret;
+}
+
+int
+seaf_repo_manager_post_indexed_files (SeafRepoManager *mgr,
+                                      const char *repo_id,
+                                      const char *parent_dir,
+                                      const char *filenames_json,
+                                      const char *file_ids_json,
+                                      const char *user,
+                                      GError **error)
+{
+    SeafRepo *repo = NULL;
+    SeafCommit *head_commit = NULL;
+    char *canon_path = NULL;
+    GList *filenames = NULL, *id_list = NULL, *ptr;
+    char *filename, *file_id;
+    int ret = 0;
+
+    GET_REPO_OR_FAIL(repo, repo_id);
+    GET_COMMIT_OR_FAIL(head_commit,repo->head->commit_id);
+
+    canon_path = get_canonical_path (parent_dir);
+
+    /* Decode file names and ids from json. */
+    filenames = json_to_file_list (filenames_json);
+    id_list = json_to_file_list (file_ids_json);
+    if (!filenames || !id_list ||
+        g_list_length (filenames) != g_list_length (id_list)) {
+        seaf_warning ("[post files] Invalid filenames or file ids.\n");
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS, "Invalid files");
         ret = -1;
         goto out;
     }
 
-    guint len = g_list_length (filenames);
-    if (len > 1)
-        g_string_printf (buf, "Added \"%s\" and %u more files.",
-                         (char *)(filenames->data), len - 1);
-    else
-        g_string_printf (buf, "Added \"%s\".", (char *)(filenames->data));
+    /* Check inputs. */
+    for (ptr = filenames; ptr; ptr = ptr->next) {
+        filename = ptr->data;
+        if (should_ignore_file (filename, NULL)) {
+            seaf_warning ("[post files] Invalid filename %s.\n", filename);
+            g_set_error (error, SEAFILE_DOMAIN, POST_FILE_ERR_FILENAME,
+                         "%s", filename);
+            ret = -1;
+            goto out;
+        }
+    }
 
-    if (gen_new_commit (repo_id, head_commit, root_id,
-                        user, buf->str, error) < 0)
+    if (strstr (parent_dir, "//") != NULL) {
+        seaf_warning ("[post file] parent_dir cantains // sequence.\n");
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS,
+                     "Invalid parent dir");
+        ret = -1;
+        goto out;
+    }
+
+    /* The files must have been indexed by the caller. */
+    for (ptr = id_list; ptr; ptr = ptr->next) {
+        file_id = ptr->data;
+        if (!seaf_fs_manager_object_exists (seaf->fs_mgr, file_id)) {
+            seaf_warning ("[post files] File %s doesn't exist.\n", file_id);
+            g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS,
+                         "Invalid file id");
+            ret = -1;
+            goto out;
+        }
+    }
+
+    if (post_files_and_gen_commit (repo_id, head_commit, canon_path,
+                                   filenames, id_list, user, error) < 0)
         ret = -1;
 
 out:
@@ -864,12 +971,8 @@ out:
     if (head_commit)
         seaf_commit_unref(head_commit);
     string_list_free (filenames);
-    string_list_free (paths);
     string_list_free (id_list);
-    g_string_free (buf, TRUE);
-    g_free (root_id);
     g_free (canon_path);
-    g_free (crypt);
 
     if (ret == 0)
         update_repo_size(repo_id);
@@ -1788,6 +1891,63 @@ do_put_file (const char *root_id,
     return put_file_recursive(root_id, parent_dir, dent);
 }
 
+/* Replace the file with the already indexed file @file_id and commit. */
+static int
+put_file_and_gen_commit (const char *repo_id,
+                         SeafCommit *head_commit,
+                         const char *canon_path,
+                         const char *parent_dir,
+                         const char *file_name,
+                         const char *file_id,
+                         const char *user,
+                         char **new_file_id,
+                         GError **error)
+{
+    char buf[SEAF_PATH_MAX];
+    char *root_id = NULL;
+    SeafDirent *new_dent = NULL;
+    char *old_file_id = NULL, *fullpath = NULL;
+    int ret = 0;
+
+    new_dent = seaf_dirent_new (file_id, S_IFREG, file_name);
+
+    fullpath = g_build_filename(parent_dir, file_name, NULL);
+
+    old_file_id = seaf_fs_manager_path_to_obj_id (seaf->fs_mgr,
+                                                   head_commit->root_id,
+                                                   fullpath, NULL, NULL);
+
+    if (g_strcmp0(old_file_id, new_dent->id) == 0) {
+        *new_file_id = g_strdup(new_dent->id);
+        goto out;
+    }
+
+    root_id = do_put_file (head_commit->root_id, canon_path, new_dent);
+    if (!root_id) {
+        seaf_warning ("[put file] Failed to put file.\n");
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL,
+                     "Failed to put file");
+        ret = -1;
+        goto out;
+    }
+
+    /* Commit. */
+    snprintf(buf, SEAF_PATH_MAX, "Modified \"%s\"", file_name);
+    if (gen_new_commit (repo_id, head_commit, root_id, user, buf, error) < 0) {
+        ret = -1;
+        goto out;       
+    }
+
+    *new_file_id = g_strdup(new_dent->id);
+
+out:
+    g_free (new_dent);
+    g_free (root_id);
+    g_free (old_file_id);
+    g_free (fullpath);
+    return ret;
+}
+
 int
 seaf_repo_manager_put_file (SeafRepoManager *mgr,
                             const char *repo_id,
@@ -1803,12 +1963,8 @@ seaf_repo_manager_put_file (SeafRepoManager *mgr,
     SeafCommit *head_commit = NULL;
     char *canon_path = NULL;
     unsigned char sha1[20];
-    char buf[SEAF_PATH_MAX];
-    char *root_id = NULL;
     SeafileCrypt *crypt = NULL;
-    SeafDirent *new_dent = NULL;
     char hex[41];
-    char *old_file_id = NULL, *fullpath = NULL;
     int ret = 0;
 
     if (g_access (temp_file_path, R_OK) != 0) {
@@ -1869,50 +2025,86 @@ seaf_repo_manager_put_file (SeafRepoManager *mgr,
     }
         
     rawdata_to_hex(sha1, hex, 20);
-    new_dent = seaf_dirent_new (hex, S_IFREG, file_name);
 
-    if (!fullpath)
-        fullpath = g_build_filename(parent_dir, file_name, NULL);
+    if (put_file_and_gen_commit (repo_id, head_commit, canon_path,
+                                 parent_dir, file_name, hex, user,
+                                 new_file_id, error) < 0)
+        ret = -1;
 
-    old_file_id = seaf_fs_manager_path_to_obj_id (seaf->fs_mgr,
-                                                   head_commit->root_id,
-                                                   fullpath, NULL, NULL);
+out:
+    if (repo)
+        seaf_repo_unref (repo);
+    if (head_commit)
+        seaf_commit_unref(head_commit);
+    g_free (canon_path);
+    g_free (crypt);
 
-    if (g_strcmp0(old_file_id, new_dent->id) == 0) {
-        *new_file_id = g_strdup(new_dent->id);
-        goto out;
+    if (ret == 0) {
+        update_repo_size (repo_id);
     }
 
-    root_id = do_put_file (head_commit->root_id, canon_path, new_dent);
-    if (!root_id) {
-        seaf_warning ("[put file] Failed to put file.\n");
-        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL,
-                     "Failed to put file");
+    return ret;
+}
+
+int
+seaf_repo_manager_put_indexed_file (SeafRepoManager *mgr,
+                                    const char *repo_id,
+                                    const char *file_id,
+                                    const char *parent_dir,
+                                    const char *file_name,
+                                    const char *user,
+                                    const char *head_id,
+                                    char **new_file_id,
+                                    GError **error)
+{
+    SeafRepo *repo = NULL;
+    SeafCommit *head_commit = NULL;
+    char *canon_path = NULL;
+    int ret = 0;
+
+    /* The file must have been indexed by the caller. */
+    if (!seaf_fs_manager_object_exists (seaf->fs_mgr, file_id)) {
+        seaf_warning ("[put file] File %s doesn't exist.\n", file_id);
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS,
+                     "Invalid file id");
+        return -1;
+    }
+
+    GET_REPO_OR_FAIL(repo, repo_id);
+    const char *base = head_id ? head_id : repo->head->commit_id;
+    GET_COMMIT_OR_FAIL(head_commit, base);
+
+    canon_path = get_canonical_path (parent_dir);
+
+    if (should_ignore_file (file_name, NULL)) {
+        seaf_warning ("[put file] Invalid filename %s.\n", file_name);
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS,
+                     "Invalid filename");
         ret = -1;
         goto out;
     }
 
-    /* Commit. */
-    snprintf(buf, SEAF_PATH_MAX, "Modified \"%s\"", file_name);
-    if (gen_new_commit (repo_id, head_commit, root_id, user, buf, error) < 0) {
+    if (strstr (parent_dir, "//") != NULL) {
+        seaf_warning ("[put file] parent_dir cantains // sequence.\n");
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_BAD_ARGS,
+                     "Invalid parent dir");
         ret = -1;
-        goto out;       
+        goto out;
     }
 
-    *new_file_id = g_strdup(new_dent->id);
+    FAIL_IF_FILE_NOT_EXISTS(head_commit->root_id, canon_path, file_name, NULL);
+
+    if (put_file_and_gen_commit (repo_id, head_commit, canon_path,
+                                 parent_dir, file_name, file_id, user,
+                                 new_file_id, error) < 0)
+        ret = -1;
 
 out:
     if (repo)
         seaf_repo_unref (repo);
     if (head_commit)
         seaf_commit_unref(head_commit);
-    if (new_dent)
-        g_free (new_dent);
-    g_free (root_id);
     g_free (canon_path);
-    g_free (crypt);
-    g_free (old_file_id);
-    g_free (fullpath);
 
     if (ret == 0) {
         update_repo_size (repo_id);
@@ -2632,13 +2824,13 @@ compare_commit_by_time (const SeafCommit *a, const SeafCommit *b)
     return (b->ctime - a->ctime);
 }
 
-GList *
-seaf_repo_manager_list_file_revisions (SeafRepoManager *mgr,
-                                       const char *repo_id,
-                                       const char *path,
-                                       int max_revision,
-                                       int limit,
-                                       GError **error)
+static GList *
+list_file_revisions_from_history (SeafRepoManager *mgr,
+                                  const char *repo_id,
+                                  const char *path,
+                                  int max_revision,
+                                  int limit,
+                                  GError **error)
 {
     SeafRepo *repo = NULL;
     GList *commit_list = NULL;
@@ -2707,6 +2899,7 @@ struct CalcFilesLastModifiedParam {
     GHashTable *last_modified_hash;
     GHashTable *current_file_id_hash;
     SeafCommit *current_commit;
+    int n_commits;
 };
 
 static gboolean
@@ -2742,6 +2935,7 @@ collect_files_last_modified (SeafCommit *commit, void *vdata, gboolean *stop)
     gboolean ret = TRUE;
 
     data->current_commit = commit;
+    ++(data->n_commits);
     dir = seaf_fs_manager_get_seafdir_by_path (seaf->fs_mgr,
                                                commit->root_id,
                                                data->parent_dir,
@@ -2808,13 +3002,18 @@ out:
  * tree. Give a commit, for each file, if the file id in that commit is
  * different than its current id, then this file is last modified in the
  * commit previous to that commit.
+ *
+ * If the traverse is stopped by @limit before the commit of some files is
+ * found, their times are only the time of the oldest commit traversed.
+ * The names of these files are returned in @unresolved if it's not NULL.
  */
-GList *
-seaf_repo_manager_calc_files_last_modified (SeafRepoManager *mgr,
-                                            const char *repo_id,
-                                            const char *parent_dir,
-                                            int limit,
-                                            GError **error)
+static GList *
+calc_files_last_modified_from_history (SeafRepoManager *mgr,
+                                       const char *repo_id,
+                                       const char *parent_dir,
+                                       int limit,
+                                       GHashTable **unresolved,
+                                       GError **error)
 {
     SeafRepo *repo = NULL;
     SeafCommit *head_commit = NULL;
@@ -2898,6 +3097,12 @@ seaf_repo_manager_calc_files_last_modified (SeafRepoManager *mgr,
         ret_list = g_list_prepend (ret_list, info);
     }
 
+    /* The traverse may have been stopped by the limit. */
+    if (unresolved && limit > 0 && data.n_commits >= limit) {
+        *unresolved = data.current_file_id_hash;
+        data.current_file_id_hash = NULL;
+    }
+
 out:
     if (repo)
         seaf_repo_unref (repo);
@@ -2913,6 +3118,916 @@ out:
     return g_list_reverse(ret_list);
 }
 
+/*
+ * Last modified index.
+ *
+ * The FileLastModified table records, for each path of a repo, the commit
+ * and time it was last modified. FileLastModifiedHead records the head
+ * commit the index is up to date with. When the head has moved, the index
+ * is brought up to date by diffing each new commit with its parent.
+ *
+ * Dirs are indexed lazily: the first listing of a dir computes the times
+ * of its entries from history and saves them, without a commit id. Later
+ * listings only read the index.
+ */
+
+/* If the index lags behind head by more commits than this, or the indexed
+ * commit is not on the first parent chain of head, the index is rebuilt.
+ */
+#define LAST_MODIFIED_MAX_CATCHUP 200
+
+/* Return "/" or a path with a leading and without a trailing slash. */
+static char *
+canonical_dir_path (const char *path)
+{
+    char **parts, **p;
+    GString *buf = g_string_new ("");
+
+    parts = g_strsplit (path, "/", -1);
+    for (p = parts; *p != NULL; ++p) {
+        if (**p == '\0')
+            continue;
+        g_string_append_c (buf, '/');
+        g_string_append (buf, *p);
+    }
+    g_strfreev (parts);
+
+    if (buf->len == 0)
+        g_string_append_c (buf, '/');
+    return g_string_free (buf, FALSE);
+}
+
+static char *
+path_hash (const char *parent_dir, const char *name)
+{
+    char *path, *hash;
+
+    if (!name)
+        return g_compute_checksum_for_string (G_CHECKSUM_SHA1, parent_dir, -1);
+
+    path = g_build_path ("/", parent_dir, name, NULL);
+    hash = g_compute_checksum_for_string (G_CHECKSUM_SHA1, path, -1);
+    g_free (path);
+    return hash;
+}
+
+static int
+save_last_modified (SeafDB *db, const char *repo_id,
+                    const char *parent_dir, const char *name,
+                    const char *commit_id, gint64 mtime)
+{
+    char *path_id, *parent_id, *esc_name;
+    char commit_value[64];
+    GString *sql = g_string_new ("");
+    int ret;
+
+    path_id = path_hash (parent_dir, name);
+    parent_id = path_hash (parent_dir, NULL);
+    esc_name = seaf_db_escape_string (db, name);
+    if (commit_id)
+        snprintf (commit_value, sizeof(commit_value), "'%s'", commit_id);
+    else
+        snprintf (commit_value, sizeof(commit_value), "NULL");
+
+    if (seaf_db_type(db) == SEAF_DB_TYPE_PGSQL) {
+        g_string_printf (sql,
+                         "DELETE FROM FileLastModified WHERE repo_id='%s' "
+                         "AND path_id='%s'", repo_id, path_id);
+        if (seaf_db_query (db, sql->str) < 0) {
+            ret = -1;
+            goto out;
+        }
+        g_string_printf (sql, "INSERT INTO FileLastModified VALUES ");
+    } else {
+        g_string_printf (sql, "REPLACE INTO FileLastModified VALUES ");
+    }
+    g_string_append_printf (sql,
+                            "('%s', '%s', '%s', '%s', %s, %"G_GINT64_FORMAT")",
+                            repo_id, path_id, parent_id, esc_name,
+                            commit_value, mtime);
+    ret = seaf_db_query (db, sql->str);
+
+out:
+    g_free (path_id);
+    g_free (parent_id);
+    g_free (esc_name);
+    g_string_free (sql, TRUE);
+    return ret;
+}
+
+static int
+delete_last_modified (SeafDB *db, const char *repo_id,
+                      const char *parent_dir, const char *name)
+{
+    char sql[256];
+    char *path_id = path_hash (parent_dir, name);
+
+    snprintf (sql, sizeof(sql),
+              "DELETE FROM FileLastModified WHERE repo_id='%s' AND path_id='%s'",
+              repo_id, path_id);
+    g_free (path_id);
+
+    return seaf_db_query (db, sql);
+}
+
+static int
+set_last_modified_index_head (SeafDB *db, const char *repo_id,
+                              const char *commit_id)
+{
+    char sql[256];
+
+    if (seaf_db_type(db) == SEAF_DB_TYPE_PGSQL) {
+        snprintf (sql, sizeof(sql),
+                  "DELETE FROM FileLastModifiedHead WHERE repo_id='%s'",
+                  repo_id);
+        if (seaf_db_query (db, sql) < 0)
+            return -1;
+        snprintf (sql, sizeof(sql),
+                  "INSERT INTO FileLastModifiedHead VALUES ('%s', '%s')",
+                  repo_id, commit_id);
+    } else {
+        snprintf (sql, sizeof(sql),
+                  "REPLACE INTO FileLastModifiedHead VALUES ('%s', '%s')",
+                  repo_id, commit_id);
+    }
+
+    return seaf_db_query (db, sql);
+}
+
+/*
+ * A change to "a/b/c" modifies "c" in "/a/b", and also "b" in "/a"
+ * and "a" in "/".
+ */
+static int
+index_changed_path (SeafDB *db, const char *repo_id, SeafCommit *commit,
+                    const char *path, gboolean deleted)
+{
+    char **parts;
+    GString *parent = g_string_new ("/");
+    int n_parts, i;
+    int ret = 0;
+
+    parts = g_strsplit (path, "/", -1);
+    n_parts = g_strv_length (parts);
+
+    for (i = 0; i < n_parts; ++i) {
+        if (parts[i][0] == '\0')
+            continue;
+
+        if (i == n_parts - 1 && deleted)
+            ret = delete_last_modified (db, repo_id, parent->str, parts[i]);
+        else
+            ret = save_last_modified (db, repo_id, parent->str, parts[i],
+                                      commit->commit_id, commit->ctime);
+        if (ret < 0)
+            break;
+
+        if (parent->len > 1)
+            g_string_append_c (parent, '/');
+        g_string_append (parent, parts[i]);
+    }
+
+    g_strfreev (parts);
+    g_string_free (parent, TRUE);
+    return ret;
+}
+
+static int
+index_diff_entry (SeafDB *db, const char *repo_id,
+                  SeafCommit *commit, DiffEntry *de)
+{
+    switch (de->status) {
+    case DIFF_STATUS_DELETED:
+    case DIFF_STATUS_DIR_DELETED:
+        return index_changed_path (db, repo_id, commit, de->name, TRUE);
+    case DIFF_STATUS_RENAMED:
+        if (index_changed_path (db, repo_id, commit, de->name, TRUE) < 0)
+            return -1;
+        return index_changed_path (db, repo_id, commit, de->new_name, FALSE);
+    default:
+        return index_changed_path (db, repo_id, commit, de->name, FALSE);
+    }
+}
+
+static int
+index_commit (SeafDB *db, const char *repo_id, SeafCommit *commit)
+{
+    SeafCommit *parent = NULL;
+    GList *results = NULL, *ptr;
+    int ret = 0;
+
+    if (commit->parent_id) {
+        parent = seaf_commit_manager_get_commit (seaf->commit_mgr,
+                                                 commit->parent_id);
+        if (!parent)
+            return -1;
+
+        if (diff_commits (parent, commit, &results) < 0) {
+            seaf_commit_unref (parent);
+            return -1;
+        }
+    }
+
+    for (ptr = results; ptr; ptr = ptr->next) {
+        if (index_diff_entry (db, repo_id, commit, ptr->data) < 0) {
+            ret = -1;
+            break;
+        }
+    }
+
+    for (ptr = results; ptr; ptr = ptr->next)
+        diff_entry_free (ptr->data);
+    g_list_free (results);
+    seaf_commit_unref (parent);
+    return ret;
+}
+
+static gboolean
+last_modified_index_head_is (SeafDB *db, const char *repo_id,
+                             const char *commit_id)
+{
+    char sql[256];
+    gboolean db_err = FALSE;
+
+    snprintf (sql, sizeof(sql),
+              "SELECT 1 FROM FileLastModifiedHead WHERE repo_id='%s' "
+              "AND commit_id='%s'", repo_id, commit_id);
+    return seaf_db_check_for_existence (db, sql, &db_err) && !db_err;
+}
+
+static int
+update_last_modified_index (SeafRepoManager *mgr, const char *repo_id,
+                            SeafCommit *head)
+{
+    SeafDB *db = mgr->seaf->db;
+    char sql[256];
+    char *indexed_id;
+    SeafCommit *commit;
+    GList *new_commits = NULL, *ptr;
+    int n = 0;
+    int ret = 0;
+
+    snprintf (sql, sizeof(sql),
+              "SELECT commit_id FROM FileLastModifiedHead WHERE repo_id='%s'",
+              repo_id);
+    indexed_id = seaf_db_get_string (db, sql);
+    if (indexed_id && strcmp (indexed_id, head->commit_id) == 0) {
+        g_free (indexed_id);
+        return 0;
+    }
+
+    /* Collect the commits after the indexed one, oldest first. */
+    commit = head;
+    seaf_commit_ref (commit);
+    while (indexed_id && strcmp (commit->commit_id, indexed_id) != 0) {
+        if (!commit->parent_id || ++n > LAST_MODIFIED_MAX_CATCHUP) {
+            seaf_commit_unref (commit);
+            commit = NULL;
+            break;
+        }
+        new_commits = g_list_prepend (new_commits, commit);
+        commit = seaf_commit_manager_get_commit (seaf->commit_mgr,
+                                                 commit->parent_id);
+        if (!commit)
+            break;
+    }
+
+    if (!commit) {
+        /* Can't catch up, drop the index of this repo. */
+        snprintf (sql, sizeof(sql),
+                  "DELETE FROM FileLastModified WHERE repo_id='%s'", repo_id);
+        if (seaf_db_query (db, sql) < 0)
+            ret = -1;
+    } else {
+        seaf_commit_unref (commit);
+        for (ptr = new_commits; ptr; ptr = ptr->next) {
+            if (index_commit (db, repo_id, ptr->data) < 0) {
+                seaf_warning ("Failed to index commit %s of repo %s.\n",
+                              ((SeafCommit *)ptr->data)->commit_id, repo_id);
+                ret = -1;
+                break;
+            }
+        }
+    }
+
+    if (ret == 0)
+        ret = set_last_modified_index_head (db, repo_id, head->commit_id);
+
+    for (ptr = new_commits; ptr; ptr = ptr->next)
+        seaf_commit_unref (ptr->data);
+    g_list_free (new_commits);
+    g_free (indexed_id);
+    return ret;
+}
+
+static gboolean
+collect_last_modified (SeafDBRow *row, void *data)
+{
+    GHashTable *mtimes = data;
+    gint64 *mtime = g_new (gint64, 1);
+
+    *mtime = seaf_db_row_get_column_int64 (row, 1);
+    g_hash_table_replace (mtimes,
+                          g_strdup(seaf_db_row_get_column_text (row, 0)),
+                          mtime);
+    return TRUE;
+}
+
+/*
+ * Get the last modified times of the entries of @dir from the index.
+ * Returns FALSE if some entries are not indexed yet.
+ */
+static gboolean
+get_last_modified_from_index (SeafRepoManager *mgr, const char *repo_id,
+                              const char *parent_dir, SeafDir *dir,
+                              GList **infos)
+{
+    char sql[256];
+    char *parent_id;
+    GHashTable *mtimes;
+    GList *ptr;
+    SeafDirent *dent;
+    gint64 *mtime;
+    SeafileFileLastModifiedInfo *info;
+    gboolean complete = TRUE;
+
+    *infos = NULL;
+
+    parent_id = path_hash (parent_dir, NULL);
+    snprintf (sql, sizeof(sql),
+              "SELECT name, mtime FROM FileLastModified WHERE repo_id='%s' "
+              "AND parent_id='%s'", repo_id, parent_id);
+    g_free (parent_id);
+
+    mtimes = g_hash_table_new_full (g_str_hash, g_str_equal, g_free, g_free);
+    if (seaf_db_foreach_selected_row (mgr->seaf->db, sql,
+                                      collect_last_modified, mtimes) < 0) {
+        g_hash_table_destroy (mtimes);
+        return FALSE;
+    }
+
+    for (ptr = dir->entries; ptr; ptr = ptr->next) {
+        dent = ptr->data;
+        mtime = g_hash_table_lookup (mtimes, dent->name);
+        if (!mtime) {
+            complete = FALSE;
+            break;
+        }
+        info = g_object_new (SEAFILE_TYPE_FILE_LAST_MODIFIED_INFO,
+                             "file_name", dent->name,
+                             "last_modified", *mtime,
+                             NULL);
+        *infos = g_list_prepend (*infos, info);
+    }
+
+    if (!complete) {
+        for (ptr = *infos; ptr; ptr = ptr->next)
+            g_object_unref (ptr->data);
+        g_list_free (*infos);
+        *infos = NULL;
+    } else {
+        *infos = g_list_reverse (*infos);
+    }
+
+    g_hash_table_destroy (mtimes);
+    return complete;
+}
+
+/**
+ * Give a directory, return the last modification timestamps of all the files
+ * under this directory. The timestamps are read from the last modified index
+ * when possible, and calculated from history otherwise.
+ */
+GList *
+seaf_repo_manager_calc_files_last_modified (SeafRepoManager *mgr,
+                                            const char *repo_id,
+                                            const char *parent_dir,
+                                            int limit,
+                                            GError **error)
+{
+    SeafRepo *repo = NULL;
+    SeafCommit *head_commit = NULL;
+    SeafDir *dir = NULL;
+    char *canon_dir = NULL;
+    GList *infos = NULL, *ptr;
+    SeafileFileLastModifiedInfo *info;
+    const char *file_name;
+    GHashTable *unresolved = NULL;
+    gboolean indexed = FALSE;
+
+    repo = seaf_repo_manager_get_repo (mgr, repo_id);
+    if (!repo) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL,
+                     "No such repo %s", repo_id);
+        goto out;
+    }
+
+    head_commit = seaf_commit_manager_get_commit (seaf->commit_mgr,
+                                                  repo->head->commit_id);
+    if (!head_commit) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL,
+                     "Failed to get commit %s", repo->head->commit_id);
+        goto out;
+    }
+
+    dir = seaf_fs_manager_get_seafdir_by_path (seaf->fs_mgr, head_commit->root_id,
+                                               parent_dir, error);
+    if (*error || !dir)
+        goto out;
+
+    canon_dir = canonical_dir_path (parent_dir);
+
+    if (update_last_modified_index (mgr, repo_id, head_commit) == 0)
+        indexed = get_last_modified_from_index (mgr, repo_id, canon_dir,
+                                                dir, &infos);
+    else
+        seaf_warning ("Failed to update last modified index of repo %s.\n",
+                      repo_id);
+    if (indexed)
+        goto out;
+
+    infos = calc_files_last_modified_from_history (mgr, repo_id, parent_dir,
+                                                   limit, &unresolved, error);
+    if (*error)
+        goto out;
+
+    /* Don't save the result if the index has moved past head_commit. */
+    if (!last_modified_index_head_is (mgr->seaf->db, repo_id,
+                                      head_commit->commit_id))
+        goto out;
+    for (ptr = infos; ptr; ptr = ptr->next) {
+        info = ptr->data;
+        file_name = seafile_file_last_modified_info_get_file_name (info);
+        /* Only save the times that are exact. */
+        if (unresolved && g_hash_table_lookup (unresolved, file_name))
+            continue;
+        save_last_modified (mgr->seaf->db, repo_id, canon_dir, file_name, NULL,
+                            seafile_file_last_modified_info_get_last_modified (info));
+    }
+
+out:
+    if (repo)
+        seaf_repo_unref (repo);
+    if (head_commit)
+        seaf_commit_unref (head_commit);
+    if (dir)
+        seaf_dir_free (dir);
+    if (unresolved)
+        g_hash_table_destroy (unresolved);
+    g_free (canon_dir);
+
+    return infos;
+}
+
+/*
+ * File revision index.
+ *
+ * The FileRevision table maps a path of a repo to the commits where the
+ * file at that path was changed, i.e. where its file id differs from the
+ * file id in the parent commits. FileRevisionCommit records the commits
+ * that have been indexed, and FileRevisionHead the head commit whose whole
+ * history has been indexed.
+ *
+ * The index of a repo is built in the background after the first
+ * revisions query, and extended with the commits made since the indexed
+ * head after later queries. Until the index is up to date with the head,
+ * queries walk the history as before.
+ */
+
+/* A failed update is not retried for this long, in seconds. */
+#define REVISION_INDEX_RETRY_INTERVAL 3600
+#define REVISION_INDEX_THREADS 1
+
+static pthread_mutex_t revision_index_lock = PTHREAD_MUTEX_INITIALIZER;
+/* Repos whose revision index is being updated. */
+static GHashTable *revision_indexing_repos;
+/* Repo id -> time of the last failed update. */
+static GHashTable *revision_index_failures;
+static GThreadPool *revision_index_tpool;
+
+typedef struct RevisionIndexJob {
+    char repo_id[37];
+    char head_id[41];
+} RevisionIndexJob;
+
+typedef struct IndexRevisionParam {
+    SeafDB *db;
+    const char *repo_id;
+    const char *indexed_head;
+    /* Ids of the commits indexed by this update. */
+    GList *indexed_commits;
+    gboolean db_error;
+} IndexRevisionParam;
+
+static int
+save_file_revision (SeafDB *db, const char *repo_id,
+                    const char *path, SeafCommit *commit)
+{
+    char sql[512];
+    char *path_id;
+    gboolean db_err = FALSE;
+    int ret = 0;
+
+    path_id = path_hash (path, NULL);
+
+    if (seaf_db_type(db) == SEAF_DB_TYPE_PGSQL) {
+        snprintf (sql, sizeof(sql),
+                  "SELECT 1 FROM FileRevision WHERE repo_id='%s' AND "
+                  "path_id='%s' AND commit_id='%s'",
+                  repo_id, path_id, commit->commit_id);
+        if (seaf_db_check_for_existence (db, sql, &db_err) || db_err)
+            goto out;
+        snprintf (sql, sizeof(sql),
+                  "INSERT INTO FileRevision VALUES "
+                  "('%s', '%s', '%s', %"G_GINT64_FORMAT")",
+                  repo_id, path_id, commit->commit_id, (gint64)commit->ctime);
+    } else {
+        snprintf (sql, sizeof(sql),
+                  "REPLACE INTO FileRevision VALUES "
+                  "('%s', '%s', '%s', %"G_GINT64_FORMAT")",
+                  repo_id, path_id, commit->commit_id, (gint64)commit->ctime);
+    }
+    ret = seaf_db_query (db, sql);
+
+out:
+    g_free (path_id);
+    if (db_err)
+        ret = -1;
+    return ret;
+}
+
+static gboolean
+commit_revisions_indexed (SeafDB *db, const char *repo_id,
+                          const char *commit_id, gboolean *db_err)
+{
+    char sql[256];
+
+    snprintf (sql, sizeof(sql),
+              "SELECT 1 FROM FileRevisionCommit WHERE repo_id='%s' AND "
+              "commit_id='%s'", repo_id, commit_id);
+    return seaf_db_check_for_existence (db, sql, db_err);
+}
+
+static int
+save_indexed_commits (SeafDB *db, const char *repo_id, GList *commit_ids)
+{
+    char sql[256];
+    GList *ptr;
+    char *commit_id;
+    gboolean db_err = FALSE;
+
+    for (ptr = commit_ids; ptr; ptr = ptr->next) {
+        commit_id = ptr->data;
+        if (commit_revisions_indexed (db, repo_id, commit_id, &db_err))
+            continue;
+        if (db_err)
+            return -1;
+        snprintf (sql, sizeof(sql),
+                  "INSERT INTO FileRevisionCommit VALUES ('%s', '%s')",
+                  repo_id, commit_id);
+        if (seaf_db_query (db, sql) < 0)
+            return -1;
+    }
+
+    return 0;
+}
+
+static int
+set_revision_index_head (SeafDB *db, const char *repo_id,
+                         const char *commit_id)
+{
+    char sql[256];
+
+    if (seaf_db_type(db) == SEAF_DB_TYPE_PGSQL) {
+        snprintf (sql, sizeof(sql),
+                  "DELETE FROM FileRevisionHead WHERE repo_id='%s'", repo_id);
+        if (seaf_db_query (db, sql) < 0)
+            return -1;
+        snprintf (sql, sizeof(sql),
+                  "INSERT INTO FileRevisionHead VALUES ('%s', '%s')",
+                  repo_id, commit_id);
+    } else {
+        snprintf (sql, sizeof(sql),
+                  "REPLACE INTO FileRevisionHead VALUES ('%s', '%s')",
+                  repo_id, commit_id);
+    }
+
+    return seaf_db_query (db, sql);
+}
+
+/*
+ * Get the files changed by @commit. For a merge, these are the files that
+ * differ from both parents. For an initial commit, or a commit whose parent
+ * has been removed, all the files of the commit.
+ */
+static int
+get_changed_files (SeafCommit *commit, GList **results)
+{
+    SeafCommit *parent = NULL;
+    SeafCommit empty;
+    int ret;
+
+    if (commit->second_parent_id)
+        return diff_merge (commit, results);
+
+    if (commit->parent_id)
+        parent = seaf_commit_manager_get_commit (seaf->commit_mgr,
+                                                 commit->parent_id);
+    if (!parent) {
+        memset (&empty, 0, sizeof(empty));
+        memcpy (empty.commit_id, EMPTY_SHA1, 41);
+        memcpy (empty.root_id, EMPTY_SHA1, 41);
+        return diff_commits (&empty, commit, results);
+    }
+
+    ret = diff_commits (parent, commit, results);
+    seaf_commit_unref (parent);
+    return ret;
+}
+
+static gboolean
+index_commit_revisions (SeafCommit *commit, void *vdata, gboolean *stop)
+{
+    IndexRevisionParam *data = vdata;
+    GList *results = NULL, *ptr;
+    DiffEntry *de;
+    const char *path;
+    char *canon_path;
+    gboolean db_err = FALSE;
+    gboolean ret = TRUE;
+
+    if (data->indexed_head) {
+        if (strcmp (commit->commit_id, data->indexed_head) == 0 ||
+            commit_revisions_indexed (data->db, data->repo_id,
+                                      commit->commit_id, &db_err)) {
+            *stop = TRUE;
+            return TRUE;
+        }
+        if (db_err) {
+            data->db_error = TRUE;
+            return FALSE;
+        }
+    }
+
+    /* Fail the update, so that the commit is indexed again by the next
+     * one instead of leaving a hole in the history.
+     */
+    if (get_changed_files (commit, &results) < 0) {
+        seaf_warning ("Failed to diff commit %s.\n", commit->commit_id);
+        return FALSE;
+    }
+
+    for (ptr = results; ptr; ptr = ptr->next) {
+        de = ptr->data;
+        if (de->status == DIFF_STATUS_ADDED ||
+            de->status == DIFF_STATUS_MODIFIED)
+            path = de->name;
+        else if (de->status == DIFF_STATUS_RENAMED)
+            path = de->new_name;
+        else
+            continue;
+
+        canon_path = canonical_dir_path (path);
+        if (save_file_revision (data->db, data->repo_id,
+                                canon_path, commit) < 0) {
+            data->db_error = TRUE;
+            ret = FALSE;
+        }
+        g_free (canon_path);
+        if (!ret)
+            break;
+    }
+
+    for (ptr = results; ptr; ptr = ptr->next)
+        diff_entry_free (ptr->data);
+    g_list_free (results);
+
+    if (ret)
+        data->indexed_commits = g_list_prepend (data->indexed_commits,
+                                                g_strdup(commit->commit_id));
+    return ret;
+}
+
+static int
+update_revision_index (SeafRepoManager *mgr, const char *repo_id,
+                       const char *head_id)
+{
+    SeafDB *db = mgr->seaf->db;
+    IndexRevisionParam data = {0};
+    char sql[256];
+    char *indexed_head;
+    int ret = 0;
+
+    snprintf (sql, sizeof(sql),
+              "SELECT commit_id FROM FileRevisionHead WHERE repo_id='%s'",
+              repo_id);
+    indexed_head = seaf_db_get_string (db, sql);
+    if (indexed_head && strcmp (indexed_head, head_id) == 0) {
+        g_free (indexed_head);
+        return 0;
+    }
+
+    data.db = db;
+    data.repo_id = repo_id;
+    data.indexed_head = indexed_head;
+
+    if (!seaf_commit_manager_traverse_commit_tree (seaf->commit_mgr, head_id,
+                                                   index_commit_revisions,
+                                                   &data, TRUE) ||
+        data.db_error) {
+        seaf_warning ("Failed to index file revisions of repo %s.\n", repo_id);
+        ret = -1;
+        goto out;
+    }
+
+    /* Only mark the commits as indexed when their ancestors are indexed
+     * too, so that an interrupted update is redone from the start.
+     */
+    if (save_indexed_commits (db, repo_id, data.indexed_commits) < 0 ||
+        set_revision_index_head (db, repo_id, head_id) < 0)
+        ret = -1;
+
+out:
+    string_list_free (data.indexed_commits);
+    g_free (indexed_head);
+
+    return ret;
+}
+
+static void
+revision_index_thread (gpointer vjob, gpointer unused)
+{
+    RevisionIndexJob *job = vjob;
+    gint64 *fail_time;
+    int ret;
+
+    ret = update_revision_index (seaf->repo_mgr, job->repo_id, job->head_id);
+
+    pthread_mutex_lock (&revision_index_lock);
+    if (ret < 0) {
+        fail_time = g_new (gint64, 1);
+        *fail_time = (gint64)time(NULL);
+        g_hash_table_replace (revision_index_failures,
+                              g_strdup(job->repo_id), fail_time);
+    } else {
+        g_hash_table_remove (revision_index_failures, job->repo_id);
+    }
+    g_hash_table_remove (revision_indexing_repos, job->repo_id);
+    pthread_mutex_unlock (&revision_index_lock);
+
+    g_free (job);
+}
+
+/* Start updating the revision index of a repo in the background, unless
+ * it's being updated or its last update failed recently.
+ */
+static void
+schedule_revision_index_update (const char *repo_id, const char *head_id)
+{
+    RevisionIndexJob *job;
+    gint64 *fail_time;
+    GError *error = NULL;
+
+    pthread_mutex_lock (&revision_index_lock);
+
+    if (!revision_index_tpool) {
+        revision_indexing_repos = g_hash_table_new_full (g_str_hash,
+                                                         g_str_equal,
+                                                         g_free, NULL);
+        revision_index_failures = g_hash_table_new_full (g_str_hash,
+                                                         g_str_equal,
+                                                         g_free, g_free);
+        revision_index_tpool = g_thread_pool_new (revision_index_thread, NULL,
+                                                  REVISION_INDEX_THREADS,
+                                                  FALSE, &error);
+        if (!revision_index_tpool) {
+            seaf_warning ("Failed to create revision index thread pool: %s.\n",
+                          error->message);
+            g_clear_error (&error);
+            goto out;
+        }
+    }
+
+    if (g_hash_table_lookup (revision_indexing_repos, repo_id))
+        goto out;
+
+    fail_time = g_hash_table_lookup (revision_index_failures, repo_id);
+    if (fail_time &&
+        (gint64)time(NULL) - *fail_time < REVISION_INDEX_RETRY_INTERVAL)
+        goto out;
+
+    job = g_new0 (RevisionIndexJob, 1);
+    memcpy (job->repo_id, repo_id, 36);
+    memcpy (job->head_id, head_id, 40);
+    g_hash_table_insert (revision_indexing_repos, g_strdup(repo_id), (void *)1);
+    g_thread_pool_push (revision_index_tpool, job, NULL);
+
+out:
+    pthread_mutex_unlock (&revision_index_lock);
+}
+
+static gboolean
+revision_index_is_up_to_date (SeafDB *db, const char *repo_id,
+                              const char *head_id)
+{
+    char sql[256];
+    gboolean db_err = FALSE;
+
+    snprintf (sql, sizeof(sql),
+              "SELECT 1 FROM FileRevisionHead WHERE repo_id='%s' "
+              "AND commit_id='%s'", repo_id, head_id);
+    return seaf_db_check_for_existence (db, sql, &db_err) && !db_err;
+}
+
+static gboolean
+collect_revision_ids (SeafDBRow *row, void *data)
+{
+    GList **ids = data;
+
+    *ids = g_list_prepend (*ids,
+                           g_strdup(seaf_db_row_get_column_text (row, 0)));
+    return TRUE;
+}
+
+GList *
+seaf_repo_manager_list_file_revisions (SeafRepoManager *mgr,
+                                       const char *repo_id,
+                                       const char *path,
+                                       int max_revision,
+                                       int limit,
+                                       GError **error)
+{
+    SeafRepo *repo = NULL;
+    char sql[256];
+    char *canon_path, *path_id;
+    GList *ids = NULL, *ptr;
+    GList *commit_list = NULL;
+    SeafCommit *commit;
+    gint64 truncate_time;
+    int n = 0;
+
+    repo = seaf_repo_manager_get_repo (mgr, repo_id);
+    if (!repo) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL,
+                     "No such repo %s", repo_id);
+        return NULL;
+    }
+
+    if (!revision_index_is_up_to_date (mgr->seaf->db, repo_id,
+                                       repo->head->commit_id)) {
+        schedule_revision_index_update (repo_id, repo->head->commit_id);
+        seaf_repo_unref (repo);
+        return list_file_revisions_from_history (mgr, repo_id, path,
+                                                 max_revision, limit, error);
+    }
+
+    canon_path = canonical_dir_path (path);
+    path_id = path_hash (canon_path, NULL);
+    snprintf (sql, sizeof(sql),
+              "SELECT commit_id FROM FileRevision WHERE repo_id='%s' AND "
+              "path_id='%s' ORDER BY ctime", repo_id, path_id);
+    g_free (canon_path);
+    g_free (path_id);
+
+    /* Latest revision comes first in ids. */
+    if (seaf_db_foreach_selected_row (mgr->seaf->db, sql,
+                                      collect_revision_ids, &ids) < 0) {
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL,
+                     "Failed to get revisions of %s", path);
+        goto out;
+    }
+
+    truncate_time = seaf_repo_manager_get_repo_truncate_time (mgr, repo_id);
+
+    for (ptr = ids; ptr; ptr = ptr->next) {
+        if (max_revision > 0 && n >= max_revision)
+            break;
+
+        /* Commits may have been removed by gc. */
+        commit = seaf_commit_manager_get_commit (seaf->commit_mgr, ptr->data);
+        if (!commit)
+            continue;
+
+        /* At least return the latest revision. */
+        if (n > 0 && (truncate_time == 0 ||
+                      (truncate_time > 0 &&
+                       (gint64)commit->ctime < truncate_time))) {
+            seaf_commit_unref (commit);
+            break;
+        }
+
+        commit_list = g_list_prepend (commit_list, commit);
+        ++n;
+    }
+    commit_list = g_list_reverse (commit_list);
+
+out:
+    seaf_repo_unref (repo);
+    string_list_free (ids);
+
+    return commit_list;
+}
+
 int
 seaf_repo_manager_revert_on_server (SeafRepoManager *mgr,
                                     const char *repo_id,
@@ -119,6 +119,10 @@ static void start_rpc_service (CcnetClient *client, int cloud_mode)
                                      seafile_get_repo_list,
                                      "seafile_get_repo_list",
                                      searpc_signature_objlist__int_int());
+    searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                     seafile_get_repo_list_after,
+                                     "get_repo_list_after",
+                                     searpc_signature_objlist__string_int());
     searpc_server_register_function ("seafserv-threaded-rpcserver",
                                      seafile_get_repo_owner,
                                      "seafile_get_repo_owner",
@@ -172,11 +176,21 @@ static void start_rpc_service (CcnetClient *client, int cloud_mode)
                                      "seafile_post_multi_files",
                     searpc_signature_int__string_string_string_string_string());
 
+    searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                     seafile_post_indexed_files,
+                                     "seafile_post_indexed_files",
+                    searpc_signature_int__string_string_string_string_string());
+
     searpc_server_register_function ("seafserv-threaded-rpcserver",
                                      seafile_put_file,
                                      "seafile_put_file",
                     searpc_signature_string__string_string_string_string_string_string());
 
+    searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                     seafile_put_indexed_file,
+                                     "seafile_put_indexed_file",
+                    searpc_signature_string__string_string_string_string_string_string());
+
     searpc_server_register_function ("seafserv-threaded-rpcserver",
                                      seafile_post_empty_file,
                                      "seafile_post_empty_file",
@@ -252,6 +266,11 @@ static void start_rpc_service (CcnetClient *client, int cloud_mode)
                                      "seafile_get_file_id_by_path",
                                      searpc_signature_string__string_string());
 
+    searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                     seafile_get_file_ids_by_paths,
+                                     "get_file_ids_by_paths",
+                                     searpc_signature_string__string_string());
+
     searpc_server_register_function ("seafserv-threaded-rpcserver",
                                      seafile_get_dir_id_by_path,
                                      "seafile_get_dir_id_by_path",
@@ -291,6 +310,10 @@ static void start_rpc_service (CcnetClient *client, int cloud_mode)
                                      seafile_list_share_repos,
                                      "seafile_list_share_repos",
                                      searpc_signature_objlist__string_string_int_int());
+    searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                     seafile_list_share_repos_after,
+                                     "list_share_repos_after",
+                                     searpc_signature_objlist__string_string_string_string_int());
     searpc_server_register_function ("seafserv-threaded-rpcserver",
                                      seafile_list_org_share_repos,
                                      "seafile_list_org_share_repos",
@@ -300,6 +323,10 @@ static void start_rpc_service (CcnetClient *client, int cloud_mode)
                                      "seafile_remove_share",
                                      searpc_signature_int__string_string_string());
 
+    searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                     seafile_get_related_users_by_repo,
+                                     "get_related_users_by_repo",
+                                     searpc_signature_string__string());
     searpc_server_register_function ("seafserv-threaded-rpcserver",
                                      seafile_set_share_permission,
                                      "set_share_permission",
@@ -319,10 +346,23 @@ static void start_rpc_service (CcnetClient *client, int cloud_mode)
                                      "seafile_get_shared_groups_by_repo",
                                      searpc_signature_string__string());
     
+    searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                     seafile_list_groups_by_repo,
+                                     "list_groups_by_repo",
+                                     searpc_signature_objlist__string());
+    searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                     seafile_get_org_ids_by_groups,
+                                     "get_org_ids_by_groups",
+                                     searpc_signature_string__string());
+
     searpc_server_register_function ("seafserv-threaded-rpcserver",
                                      seafile_get_group_repoids,
                                      "seafile_get_group_repoids",
                                      searpc_signature_string__int());
+    searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                     seafile_get_group_repos,
+                                     "get_group_repos",
+                                     searpc_signature_objlist__int());
     searpc_server_register_function ("seafserv-threaded-rpcserver",
                                      seafile_get_group_repos_by_owner,
                                      "get_group_repos_by_owner",
@@ -381,6 +421,14 @@ static void start_rpc_service (CcnetClient *client, int cloud_mode)
                                      seafile_get_user_share_usage,
                                      "seafile_get_user_share_usage",
                                      searpc_signature_int64__string());
+    searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                     seafile_group_members_changed,
+                                     "group_members_changed",
+                                     searpc_signature_int__int());
+    searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                     seafile_get_users_quota_usage,
+                                     "get_users_quota_usage",
+                                     searpc_signature_objlist__string());
     searpc_server_register_function ("seafserv-threaded-rpcserver",
                                      seafile_get_org_quota_usage,
                                      "seafile_get_org_quota_usage",
@@ -426,6 +474,11 @@ static void start_rpc_service (CcnetClient *client, int cloud_mode)
                                      "seafile_get_monitor",
                                      searpc_signature_string__void());
 
+    searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                     seafile_get_cache_stats,
+                                     "get_cache_stats",
+                                     searpc_signature_objlist__void());
+
     /* password management */
     searpc_server_register_function ("seafserv-threaded-rpcserver",
                                      seafile_set_passwd,
@@ -558,6 +611,10 @@ static void start_rpc_service (CcnetClient *client, int cloud_mode)
                                          seafile_get_org_group_repo_owner,
                                          "get_org_group_repo_owner",
                                 searpc_signature_string__int_int_string());
+        searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                         seafile_get_org_group_repos,
+                                         "get_org_group_repos",
+                                         searpc_signature_objlist__int_int());
         searpc_server_register_function ("seafserv-threaded-rpcserver",
                                          seafile_get_org_group_repos_by_owner,
                                          "get_org_group_repos_by_owner",
@@ -566,6 +623,14 @@ static void start_rpc_service (CcnetClient *client, int cloud_mode)
                                          seafile_get_org_groups_by_repo,
                                          "get_org_groups_by_repo",
                                          searpc_signature_string__int_string());
+        searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                         seafile_get_related_users_by_org_repo,
+                                         "get_related_users_by_org_repo",
+                                         searpc_signature_string__int_string());
+        searpc_server_register_function ("seafserv-threaded-rpcserver",
+                                         seafile_list_org_groups_by_repo,
+                                         "list_org_groups_by_repo",
+                                         searpc_signature_objlist__int_string());
         searpc_server_register_function ("seafserv-threaded-rpcserver",
                                          seafile_set_org_group_repo_permission,
                                          "set_org_group_repo_permission",
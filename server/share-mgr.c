@@ -2,9 +2,14 @@
 
 #include "common.h"
 #include "utils.h"
+#include "log.h"
+
+#include <ccnet.h>
+#include <ccnet/ccnet-object.h>
 
 #include "seafile-session.h"
 #include "share-mgr.h"
+#include "seafile-error.h"
 
 #include "seaf-db.h"
 
@@ -79,6 +84,8 @@ seaf_share_manager_add_share (SeafShareManager *mgr, const char *repo_id,
     if (seaf_db_query (mgr->seaf->db, sql) < 0)
         return -1;
 
+    seaf_quota_manager_invalidate_repo_share_count (seaf->quota_mgr, repo_id);
+
     return 0;
 }
 
@@ -221,6 +228,66 @@ seaf_share_manager_list_share_repos (SeafShareManager *mgr, const char *email,
     return g_list_reverse (ret);
 }
 
+GList*
+seaf_share_manager_list_share_repos_after (SeafShareManager *mgr,
+                                           const char *email,
+                                           const char *type,
+                                           const char *last_repo_id,
+                                           const char *last_user,
+                                           int limit,
+                                           GError **error)
+{
+    GList *ret = NULL, *p;
+    char sql[1024];
+    const char *user_col;
+
+    if (g_strcmp0 (type, "from_email") == 0)
+        user_col = "to_email";
+    else if (g_strcmp0 (type, "to_email") == 0)
+        user_col = "from_email";
+    else {
+        /* should never reach here */
+        g_warning ("[share mgr] Wrong column type");
+        return NULL;
+    }
+
+    if (!last_repo_id)
+        last_repo_id = "";
+    if (!last_user)
+        last_user = "";
+
+    /* A repo can be shared with several users, so the page cursor is
+     * the (repo_id, user) pair of the last row of the previous page.
+     */
+    snprintf (sql, sizeof(sql),
+              "SELECT SharedRepo.repo_id, %s, permission FROM "
+              "SharedRepo, RepoOwner WHERE "
+              "%s='%s' AND "
+              "SharedRepo.repo_id=RepoOwner.repo_id AND "
+              "(SharedRepo.repo_id > '%s' OR "
+              "(SharedRepo.repo_id = '%s' AND %s > '%s')) "
+              "ORDER BY SharedRepo.repo_id, %s "
+              "LIMIT %d",
+              user_col, type, email,
+              last_repo_id, last_repo_id, user_col, last_user,
+              user_col, limit);
+
+    if (seaf_db_foreach_selected_row (mgr->seaf->db, sql,
+                                      collect_repos, &ret) < 0) {
+        g_warning ("[share mgr] DB error when get shared repo id and email "
+                   "for %s.\n", email);
+        g_set_error (error, SEAFILE_DOMAIN, SEAF_ERR_GENERAL, "DB error");
+        for (p = ret; p; p = p->next)
+            g_object_unref (p->data);
+        g_list_free (ret);
+        return NULL;
+    }
+
+    fill_in_repo_info (ret);
+
+    return g_list_reverse (ret);
+}
+
 GList*
 seaf_share_manager_list_org_share_repos (SeafShareManager *mgr,
                                          int org_id,
@@ -331,6 +398,81 @@ seaf_share_manager_list_shared_to (SeafShareManager *mgr,
     return ret;
 }
 
+/* Takes ownership of @user. */
+static void
+add_related_user (GList **users, GHashTable *user_hash, char *user)
+{
+    if (g_hash_table_lookup (user_hash, user)) {
+        g_free (user);
+        return;
+    }
+    g_hash_table_insert (user_hash, user, user);
+    *users = g_list_prepend (*users, user);
+}
+
+GList *
+seaf_share_manager_get_related_users (SeafShareManager *mgr,
+                                      int org_id,
+                                      const char *repo_id)
+{
+    SeafRepoManager *repo_mgr = mgr->seaf->repo_mgr;
+    GHashTable *user_hash;
+    GList *users = NULL, *groups = NULL, *members, *shared_to, *p, *q;
+    SearpcClient *client = NULL;
+    char *owner;
+    int group_id;
+
+    if (org_id < 0)
+        owner = seaf_repo_manager_get_repo_owner (repo_mgr, repo_id);
+    else
+        owner = seaf_repo_manager_get_org_repo_owner (repo_mgr, repo_id);
+    if (!owner)
+        return NULL;
+
+    /* Keys are owned by the @users list. */
+    user_hash = g_hash_table_new (g_str_hash, g_str_equal);
+
+    add_related_user (&users, user_hash, owner);
+
+    /* Members of the groups the repo is shared to. */
+    if (org_id < 0)
+        groups = seaf_repo_manager_get_groups_by_repo (repo_mgr, repo_id, NULL);
+    else
+        groups = seaf_repo_manager_get_org_groups_by_repo (repo_mgr, org_id,
+                                                           repo_id, NULL);
+    if (groups) {
+        client = ccnet_create_pooled_rpc_client (mgr->seaf->client_pool,
+                                                 NULL,
+                                                 "ccnet-threaded-rpcserver");
+        if (!client)
+            seaf_warning ("Failed to alloc rpc client.\n");
+    }
+
+    for (p = groups; p && client; p = p->next) {
+        group_id = (int)(long)p->data;
+        members = ccnet_get_group_members (client, group_id);
+        for (q = members; q; q = q->next) {
+            const char *user_name = ccnet_group_user_get_user_name (q->data);
+            add_related_user (&users, user_hash, g_strdup(user_name));
+            g_object_unref (q->data);
+        }
+        g_list_free (members);
+    }
+
+    /* Users the owner shares the repo to. */
+    shared_to = seaf_share_manager_list_shared_to (mgr, owner, repo_id);
+    for (p = shared_to; p; p = p->next)
+        add_related_user (&users, user_hash, p->data);
+    g_list_free (shared_to);
+
+    g_hash_table_destroy (user_hash);
+    g_list_free (groups);
+    if (client)
+        ccnet_rpc_client_free (client);
+
+    return g_list_reverse (users);
+}
+
 int
 seaf_share_manager_remove_share (SeafShareManager *mgr, const char *repo_id,
                                  const char *from_email, const char *to_email)
@@ -344,6 +486,8 @@ seaf_share_manager_remove_share (SeafShareManager *mgr, const char *repo_id,
     if (seaf_db_query (mgr->seaf->db, sql) < 0)
         return -1;
 
+    seaf_quota_manager_invalidate_repo_share_count (seaf->quota_mgr, repo_id);
+
     return 0;
 }
 
@@ -359,6 +503,8 @@ seaf_share_manager_remove_repo (SeafShareManager *mgr, const char *repo_id)
     if (seaf_db_query (mgr->seaf->db, sql) < 0)
         return -1;
 
+    seaf_quota_manager_invalidate_repo_share_count (seaf->quota_mgr, repo_id);
+
     return 0;
 }
 
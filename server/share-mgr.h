@@ -36,6 +36,21 @@ GList*
 seaf_share_manager_list_share_repos (SeafShareManager *mgr, const char *email,
                                      const char *type, int start, int limit);
 
+/*
+ * Return at most @limit shares ordered by (repo id, user), starting after
+ * the share of @last_repo_id with @last_user. @type is "from_email" or
+ * "to_email", as in seaf_share_manager_list_share_repos(). Pass "" for
+ * @last_repo_id and @last_user to get the first page.
+ */
+GList*
+seaf_share_manager_list_share_repos_after (SeafShareManager *mgr,
+                                           const char *email,
+                                           const char *type,
+                                           const char *last_repo_id,
+                                           const char *last_user,
+                                           int limit,
+                                           GError **error);
+
 GList*
 seaf_share_manager_list_org_share_repos (SeafShareManager *mgr,
                                          int org_id,
@@ -48,6 +63,16 @@ seaf_share_manager_list_shared_to (SeafShareManager *mgr,
                                    const char *owner,
                                    const char *repo_id);
 
+/*
+ * Return the owner of a repo, followed by the users and group members the
+ * repo is shared to, without duplicates.
+ * If @org_id is not negative, @repo_id is treated as an org repo.
+ */
+GList *
+seaf_share_manager_get_related_users (SeafShareManager *mgr,
+                                      int org_id,
+                                      const char *repo_id);
+
 int
 seaf_share_manager_remove_share (SeafShareManager *mgr, const char *repo_id,
                                  const char *from_email, const char *to_email);
@@ -9,7 +9,13 @@
 typedef struct SizeSchedulerPriv {
     pthread_mutex_t q_lock;
     GQueue *repo_size_job_queue;
+    /* Repo id -> queued job. A repo is queued at most once. */
+    GHashTable *queued_repos;
+    /* Ids of the repos being computed. */
+    GHashTable *running_repos;
     int n_running_repo_size_jobs;
+    int max_jobs;
+    gboolean incremental;
 
     CcnetTimer *sched_timer;
 } SizeSchedulerPriv;
@@ -20,7 +26,7 @@ typedef struct RepoSizeJob {
 } RepoSizeJob;
 
 #define SCHEDULER_INTV 10000    /* 10s */
-#define CONCURRENT_JOBS 5
+#define DEFAULT_CONCURRENT_JOBS 5
 
 static int
 schedule_pulse (void *vscheduler);
@@ -33,6 +39,7 @@ SizeScheduler *
 size_scheduler_new (SeafileSession *session)
 {
     SizeScheduler *sched = g_new0 (SizeScheduler, 1);
+    GError *error = NULL;
 
     if (!sched)
         return NULL;
@@ -48,6 +55,25 @@ size_scheduler_new (SeafileSession *session)
     pthread_mutex_init (&sched->priv->q_lock, NULL);
 
     sched->priv->repo_size_job_queue = g_queue_new ();
+    sched->priv->queued_repos = g_hash_table_new (g_str_hash, g_str_equal);
+    sched->priv->running_repos = g_hash_table_new_full (g_str_hash,
+                                                        g_str_equal,
+                                                        g_free, NULL);
+
+    sched->priv->max_jobs = g_key_file_get_integer (session->config,
+                                                    "size_scheduler",
+                                                    "concurrent_jobs",
+                                                    &error);
+    if (error || sched->priv->max_jobs <= 0) {
+        g_clear_error (&error);
+        sched->priv->max_jobs = DEFAULT_CONCURRENT_JOBS;
+    }
+
+    /* See compute_size(). */
+    sched->priv->incremental = g_key_file_get_boolean (session->config,
+                                                       "size_scheduler",
+                                                       "incremental",
+                                                       NULL);
 
     return sched;
 }
@@ -65,13 +91,25 @@ size_scheduler_start (SizeScheduler *scheduler)
 void
 schedule_repo_size_computation (SizeScheduler *scheduler, const char *repo_id)
 {
-    RepoSizeJob *job = g_new0(RepoSizeJob, 1);
+    RepoSizeJob *job;
+
+    pthread_mutex_lock (&scheduler->priv->q_lock);
+
+    /* A queued job computes the size of the head when it runs, so it
+     * also covers the later updates.
+     */
+    if (g_hash_table_lookup (scheduler->priv->queued_repos, repo_id)) {
+        pthread_mutex_unlock (&scheduler->priv->q_lock);
+        return;
+    }
 
+    job = g_new0(RepoSizeJob, 1);
     job->sched = scheduler;
     memcpy (job->repo_id, repo_id, 37);
 
-    pthread_mutex_lock (&scheduler->priv->q_lock);
     g_queue_push_tail (scheduler->priv->repo_size_job_queue, job);
+    g_hash_table_insert (scheduler->priv->queued_repos, job->repo_id, job);
+
     pthread_mutex_unlock (&scheduler->priv->q_lock);
 }
 
@@ -79,15 +117,22 @@ static int
 schedule_pulse (void *vscheduler)
 {
     SizeScheduler *sched = vscheduler;
+    SizeSchedulerPriv *priv = sched->priv;
     RepoSizeJob *job;
+    GList *ptr, *next;
 
-    while (sched->priv->n_running_repo_size_jobs < CONCURRENT_JOBS) {
-        pthread_mutex_lock (&sched->priv->q_lock);
-        job = (RepoSizeJob *)g_queue_pop_head (sched->priv->repo_size_job_queue);
-        pthread_mutex_unlock (&sched->priv->q_lock);
+    pthread_mutex_lock (&priv->q_lock);
 
-        if (!job)
-            break;
+    ptr = priv->repo_size_job_queue->head;
+    while (ptr && priv->n_running_repo_size_jobs < priv->max_jobs) {
+        job = ptr->data;
+        next = ptr->next;
+
+        /* Wait for the running job of the same repo to finish. */
+        if (g_hash_table_lookup (priv->running_repos, job->repo_id)) {
+            ptr = next;
+            continue;
+        }
 
         int ret = ccnet_job_manager_schedule_job (sched->seaf->job_mgr,
                                                   compute_repo_size,
@@ -95,14 +140,20 @@ schedule_pulse (void *vscheduler)
                                                   job);
         if (ret < 0) {
             g_warning ("[scheduler] failed to start compute job.\n");
-            pthread_mutex_lock (&sched->priv->q_lock);
-            g_queue_push_head (sched->priv->repo_size_job_queue, job);
-            pthread_mutex_unlock (&sched->priv->q_lock);
             break;
         }
-        ++(sched->priv->n_running_repo_size_jobs);
+
+        g_queue_delete_link (priv->repo_size_job_queue, ptr);
+        g_hash_table_remove (priv->queued_repos, job->repo_id);
+        g_hash_table_insert (priv->running_repos, g_strdup(job->repo_id),
+                             (void *)1);
+        ++(priv->n_running_repo_size_jobs);
+
+        ptr = next;
     }
 
+    pthread_mutex_unlock (&priv->q_lock);
+
     return 1;
 }
 
@@ -125,7 +176,8 @@ set_repo_size (SeafDB *db,
                const char *repo_id,
                const char *old_head_id,
                const char *new_head_id,
-               guint64 size)
+               guint64 size,
+               gboolean by_file_size)
 {
     SeafDBTrans *trans;
     char sql[256];
@@ -185,6 +237,23 @@ set_repo_size (SeafDB *db,
         }
     }
 
+    /* Record whether the size is a total of file sizes. */
+    snprintf (sql, sizeof(sql),
+              "DELETE FROM RepoFileSizeHead WHERE repo_id = '%s'", repo_id);
+    if (seaf_db_trans_query (trans, sql) < 0) {
+        ret = SET_SIZE_ERROR;
+        goto rollback;
+    }
+    if (by_file_size) {
+        snprintf (sql, sizeof(sql),
+                  "INSERT INTO RepoFileSizeHead VALUES ('%s', '%s')",
+                  repo_id, new_head_id);
+        if (seaf_db_trans_query (trans, sql) < 0) {
+            ret = SET_SIZE_ERROR;
+            goto rollback;
+        }
+    }
+
     if (seaf_db_commit (trans) < 0) {
         ret = SET_SIZE_ERROR;
         goto rollback;
@@ -210,6 +279,109 @@ get_cached_head_id (SeafDB *db, const char *repo_id)
     return seaf_db_get_string (db, sql);
 }
 
+/* Returns -1 if the cached size is not the total file size of @head_id.
+ * Sizes saved in block mode, or by older versions, are not.
+ */
+static gint64
+get_cached_file_size (SeafDB *db, const char *repo_id, const char *head_id)
+{
+    char sql[512];
+
+    snprintf (sql, sizeof(sql),
+              "SELECT size FROM RepoSize, RepoFileSizeHead "
+              "WHERE RepoSize.repo_id='%s' AND RepoSize.head_id='%s' AND "
+              "RepoFileSizeHead.repo_id=RepoSize.repo_id AND "
+              "RepoFileSizeHead.head_id=RepoSize.head_id",
+              repo_id, head_id);
+    return seaf_db_get_int64 (db, sql);
+}
+
+/* The total size of the unique blocks of @head. */
+static int
+compute_block_size (SeafileSession *session, SeafCommit *head, guint64 *size)
+{
+    BlockList *bl;
+    char *block_id;
+    BlockMetadata *bmd;
+    int i;
+
+    /* Load block list first so that we don't need to count duplicate blocks.
+     * We only calculate the size of the head commit.
+     */
+    bl = block_list_new ();
+    if (seaf_fs_manager_populate_blocklist (session->fs_mgr,
+                                            head->root_id,
+                                            bl) < 0) {
+        block_list_free (bl);
+        return -1;
+    }
+
+    *size = 0;
+    for (i = 0; i < bl->n_blocks; ++i) {
+        block_id = g_ptr_array_index (bl->block_ids, i);
+        bmd = seaf_block_manager_stat_block (session->block_mgr, block_id);
+        if (bmd) {
+            *size += bmd->size;
+            g_free (bmd);
+        }
+    }
+    block_list_free (bl);
+
+    return 0;
+}
+
+/*
+ * By default the size of a repo is the total size of the unique blocks
+ * of its head commit, and the whole tree is walked on each update.
+ *
+ * With [size_scheduler] incremental = true, the size is the total size of
+ * the files in the head commit, so content that appears more than once is
+ * counted more than once. If the file size of @cached_head_id is known,
+ * the new size is computed from the difference between the two trees.
+ * Otherwise the whole tree of @head is walked.
+ */
+static int
+compute_size (SeafileSession *session,
+              const char *repo_id,
+              const char *cached_head_id,
+              SeafCommit *head,
+              gboolean incremental,
+              guint64 *size)
+{
+    SeafCommit *cached_head = NULL;
+    gint64 cached_size = -1, delta, total;
+
+    if (!incremental)
+        return compute_block_size (session, head, size);
+
+    if (cached_head_id) {
+        cached_size = get_cached_file_size (session->db, repo_id,
+                                            cached_head_id);
+        cached_head = seaf_commit_manager_get_commit (session->commit_mgr,
+                                                      cached_head_id);
+    }
+
+    if (cached_head && cached_size >= 0 &&
+        seaf_fs_manager_get_fs_size_delta (session->fs_mgr,
+                                           cached_head->root_id,
+                                           head->root_id,
+                                           &delta) == 0 &&
+        cached_size + delta >= 0) {
+        seaf_commit_unref (cached_head);
+        *size = (guint64)(cached_size + delta);
+        return 0;
+    }
+
+    if (cached_head)
+        seaf_commit_unref (cached_head);
+
+    total = seaf_fs_manager_get_fs_size (session->fs_mgr, head->root_id);
+    if (total < 0)
+        return -1;
+    *size = (guint64)total;
+    return 0;
+}
+
 static void*
 compute_repo_size (void *vjob)
 {
@@ -218,9 +390,6 @@ compute_repo_size (void *vjob)
     SeafRepo *repo = NULL;
     SeafCommit *head = NULL;
     char *cached_head_id = NULL;
-    BlockList *bl;
-    char *block_id;
-    BlockMetadata *bmd;
     guint64 size = 0;
 
 retry:
@@ -242,33 +411,19 @@ retry:
         goto out;
     }
 
-    /* Load block list first so that we don't need to count duplicate blocks.
-     * We only calculate the size of the head commit.
-     */
-    bl = block_list_new ();
-    if (seaf_fs_manager_populate_blocklist (seaf->fs_mgr,
-                                            head->root_id,
-                                            bl) < 0) {
-        block_list_free (bl);
+    if (compute_size (sched->seaf, job->repo_id, cached_head_id,
+                      head, sched->priv->incremental, &size) < 0) {
+        g_warning ("[scheduler] failed to compute size of repo %s.\n",
+                   job->repo_id);
         goto out;
     }
 
-    int i;
-    for (i = 0; i < bl->n_blocks; ++i) {
-        block_id = g_ptr_array_index (bl->block_ids, i);
-        bmd = seaf_block_manager_stat_block (sched->seaf->block_mgr, block_id);
-        if (bmd) {
-            size += bmd->size;
-            g_free (bmd);
-        }
-    }
-    block_list_free (bl);
-
     int ret = set_repo_size (sched->seaf->db,
                              job->repo_id,
                              cached_head_id,
                              repo->head->commit_id,
-                             size);
+                             size,
+                             sched->priv->incremental);
     if (ret == SET_SIZE_ERROR)
         g_warning ("[scheduler] failed to store repo size %s.\n", job->repo_id);
     else if (ret == SET_SIZE_CONFLICT) {
@@ -291,6 +446,12 @@ static void
 compute_repo_size_done (void *vjob)
 {
     RepoSizeJob *job = vjob;
-    --(job->sched->priv->n_running_repo_size_jobs);
+    SizeSchedulerPriv *priv = job->sched->priv;
+
+    pthread_mutex_lock (&priv->q_lock);
+    --(priv->n_running_repo_size_jobs);
+    g_hash_table_remove (priv->running_repos, job->repo_id);
+    pthread_mutex_unlock (&priv->q_lock);
+
     g_free (job);
 }
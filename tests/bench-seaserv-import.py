@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""
+Measure the startup cost of seaserv.
+
+`import seaserv` no longer loads configurations or creates the ccnet client
+pool, this is deferred to the first rpc call. This script compares the time
+of a bare import with the time of an import followed by initialization,
+which is what every import used to cost.
+
+Usage:
+    CCNET_CONF_DIR=... SEAFILE_CONF_DIR=... python bench-seaserv-import.py [runs]
+"""
+
+import subprocess
+import sys
+import time
+
+IMPORT_ONLY = "import seaserv"
+IMPORT_AND_INIT = "import seaserv; seaserv.service.get_pool()"
+
+def bench(code, runs):
+    total = 0.0
+    for i in range(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable, "-c", code])
+        total += time.time() - start
+    return total / runs
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    base = bench("pass", runs)
+    lazy = bench(IMPORT_ONLY, runs)
+    eager = bench(IMPORT_AND_INIT, runs)
+
+    print "interpreter startup:   %.1f ms" % (base * 1000)
+    print "import seaserv:        %.1f ms" % ((lazy - base) * 1000)
+    print "import seaserv + init: %.1f ms" % ((eager - base) * 1000)
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,7 @@
 #include <string.h>
 #include <sys/stat.h>
 #include <limits.h>
+#include <time.h>
 
 #include "cdc/cdc.h"
 
@@ -92,6 +93,103 @@ int test_write_chunk (CDCDescriptor *chunk_descr,
     return ret;
 }
 
+static int checksum_chunk (CDCDescriptor *chunk_descr,
+                           struct SeafileCrypt *crypt,
+                           uint8_t *checksum,
+                           gboolean write_data)
+{
+    GChecksum *ctx = g_checksum_new (G_CHECKSUM_SHA1);
+    guint8 digest[20];
+    gsize len = sizeof (digest);
+
+    g_checksum_update (ctx, (guchar *)chunk_descr->block_buf,
+                       chunk_descr->len);
+    g_checksum_get_digest (ctx, digest, &len);
+    g_checksum_free (ctx);
+    memcpy (checksum, digest, CHECKSUM_LENGTH);
+
+    return 0;
+}
+
+/* Feed the file to a CDC stream in random-sized pieces, and check that
+ * the blocks are the same as chunking the whole file.
+ */
+int test_stream (const char *filename)
+{
+    static const gsize max_piece_sizes[] = { 16, 64 * 1024, 4 << 20 };
+    CDCFileDescriptor whole, streamed;
+    CDCStream *stream;
+    GRand *rand;
+    guint32 seed;
+    char *data;
+    gsize len, off, n;
+    int i, ret = 0;
+
+    if (!g_file_get_contents (filename, &data, &len, NULL)) {
+        fprintf (stderr, "failed to read %s.\n", filename);
+        return -1;
+    }
+
+    memset (&whole, 0, sizeof (whole));
+    whole.write_block = checksum_chunk;
+    if (filename_chunk_cdc (filename, &whole, NULL, FALSE) < 0) {
+        fprintf (stderr, "file chunk failed\n");
+        g_free (data);
+        return -1;
+    }
+
+    seed = (guint32)time (NULL);
+    printf ("stream test seed: %u\n", seed);
+    rand = g_rand_new_with_seed (seed);
+
+    for (i = 0; i < G_N_ELEMENTS (max_piece_sizes) && ret == 0; ++i) {
+        memset (&streamed, 0, sizeof (streamed));
+        streamed.write_block = checksum_chunk;
+        stream = cdc_stream_new (&streamed, NULL, FALSE);
+        if (!stream) {
+            fprintf (stderr, "failed to create cdc stream.\n");
+            ret = -1;
+            break;
+        }
+
+        for (off = 0; off < len; off += n) {
+            n = g_rand_int_range (rand, 1, max_piece_sizes[i] + 1);
+            if (n > len - off)
+                n = len - off;
+            if (cdc_stream_feed (stream, data + off, n) < 0) {
+                fprintf (stderr, "cdc stream feed failed.\n");
+                ret = -1;
+                break;
+            }
+        }
+        if (ret == 0 && cdc_stream_finish (stream) < 0) {
+            fprintf (stderr, "cdc stream finish failed.\n");
+            ret = -1;
+        }
+        cdc_stream_free (stream);
+
+        if (ret == 0 &&
+            (streamed.block_nr != whole.block_nr ||
+             streamed.file_size != whole.file_size ||
+             memcmp (streamed.blk_sha1s, whole.blk_sha1s,
+                     whole.block_nr * CHECKSUM_LENGTH) != 0 ||
+             memcmp (streamed.file_sum, whole.file_sum,
+                     CHECKSUM_LENGTH) != 0)) {
+            fprintf (stderr, "streamed blocks differ, max piece size %d.\n",
+                     (int)max_piece_sizes[i]);
+            ret = -1;
+        }
+
+        free (streamed.blk_sha1s);
+    }
+
+    g_rand_free (rand);
+    free (whole.blk_sha1s);
+    g_free (data);
+
+    return ret;
+}
+
 int main (int argc, char *argv[])
 {
     char *src_filename = NULL;
@@ -120,6 +218,12 @@ int main (int argc, char *argv[])
         exit(1);
     }
 
+    ret = test_stream (src_filename);
+    if (ret < 0) {
+        fprintf (stderr, "stream test failed.\n");
+        exit(1);
+    }
+
     printf ("test passed.\n");
     return 0;
 }